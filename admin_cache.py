@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import time
+
+from config import ADMIN_CACHE_TTL, ADMIN_CACHE_REFRESH_AFTER
+from metrics import CACHE_LOOKUPS, registry
+
+logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = ("creator", "administrator")
+
+ADMIN_FETCHES = registry.counter("bot_admin_fetches_total", "Запросы списка администраторов чата к Telegram")
+
+
+class AdminCache:
+    """Кэш администраторов чатов для админских команд
+
+    Список администраторов чата запрашивается у Telegram не чаще раза в
+    ttl секунд. Если запись старше refresh_after, ответ берется из кэша,
+    а свежий список загружается в фоне - команда не ждет сеть. Несколько
+    одновременных запросов по одному чату ждут одну и ту же загрузку.
+
+    Обновления chat_member (назначение или снятие администратора) правят
+    запись сразу; загрузка, начатая до такого обновления, запись уже не
+    перезаписывает (сверяется версия чата).
+    """
+
+    def __init__(self, ttl=ADMIN_CACHE_TTL, refresh_after=ADMIN_CACHE_REFRESH_AFTER):
+        self.ttl = ttl
+        self.refresh_after = refresh_after
+        self._admins = {}    # chat_id -> (set(user_id), время загрузки)
+        self._loading = {}   # chat_id -> Task загрузки
+        self._versions = {}  # chat_id -> номер версии, растет при каждом изменении
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+
+    async def is_admin(self, bot, chat_id, user_id):
+        return user_id in await self.get_admins(bot, chat_id)
+
+    async def get_admins(self, bot, chat_id):
+        """id администраторов чата (из кэша, если запись не устарела)"""
+        entry = self._admins.get(chat_id)
+        if entry is not None:
+            age = time.monotonic() - entry[1]
+            if age < self.ttl:
+                self.hits += 1
+                CACHE_LOOKUPS.inc(cache="admin", result="hit")
+                if age >= self.refresh_after:
+                    self._load(bot, chat_id)
+                return entry[0]
+
+        self.misses += 1
+        CACHE_LOOKUPS.inc(cache="admin", result="miss")
+        # shield: отмена одного ожидающего не прерывает общую загрузку
+        return await asyncio.shield(self._load(bot, chat_id))
+
+    def _load(self, bot, chat_id):
+        """Задача загрузки списка; уже идущая загрузка переиспользуется"""
+        task = self._loading.get(chat_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(bot, chat_id, self._versions.get(chat_id, 0)))
+            self._loading[chat_id] = task
+            task.add_done_callback(lambda done: self._loaded(chat_id, done))
+        return task
+
+    async def _fetch(self, bot, chat_id, version):
+        self.fetches += 1
+        ADMIN_FETCHES.inc()
+        admins = await bot.get_chat_administrators(chat_id)
+        admin_ids = {admin.user.id for admin in admins}
+        if self._versions.get(chat_id, 0) == version:
+            self._admins[chat_id] = (admin_ids, time.monotonic())
+        return admin_ids
+
+    def _loaded(self, chat_id, task):
+        if self._loading.get(chat_id) is task:
+            del self._loading[chat_id]
+        # Ошибку фоновой загрузки никто не ждет - выводим ее здесь
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"⚠️ Не удалось получить администраторов чата {chat_id}: {task.exception()}")
+
+    def invalidate(self, chat_id):
+        """Забывает администраторов чата (следующая проверка пойдет в Telegram)"""
+        self._versions[chat_id] = self._versions.get(chat_id, 0) + 1
+        self._admins.pop(chat_id, None)
+        self._loading.pop(chat_id, None)
+
+    def on_member_update(self, chat_id, user_id, status):
+        """Учитывает изменение статуса участника из обновления chat_member"""
+        entry = self._admins.get(chat_id)
+        if entry is None:
+            self.invalidate(chat_id)
+            return
+        is_admin = status in ADMIN_STATUSES
+        if is_admin == (user_id in entry[0]):
+            return
+        self._versions[chat_id] = self._versions.get(chat_id, 0) + 1
+        admin_ids = set(entry[0])
+        if is_admin:
+            admin_ids.add(user_id)
+        else:
+            admin_ids.discard(user_id)
+        self._admins[chat_id] = (admin_ids, entry[1])
@@ -0,0 +1,157 @@
+import re
+
+from config import ANSWER_SIMILARITY
+
+# Римские цифры (только латиница, как их обычно набирают)
+ROMAN_RE = re.compile(r"^(?=[ivxlcdm]+$)m{0,3}(cm|cd|d?c{0,3})(xc|xl|l?x{0,3})(ix|iv|v?i{0,3})$")
+ROMAN_VALUES = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100, "d": 500, "m": 1000}
+
+# Окончания порядковых числительных после цифры: 1-й, 2-ая, 3ий, 5-го
+ORDINAL_SUFFIX_RE = re.compile(r"^(\d+)-?(й|ый|ий|ой|я|ая|яя|е|ое|ее|го|ого|его)$")
+
+NUMBER_WORDS = {}
+for number, words in {
+    0: "ноль нуль",
+    1: "один одна одно первый первая первое",
+    2: "два две второй вторая второе",
+    3: "три третий третья третье",
+    4: "четыре четвертый четвертая четвертое",
+    5: "пять пятый пятая пятое",
+    6: "шесть шестой шестая шестое",
+    7: "семь седьмой седьмая седьмое",
+    8: "восемь восьмой восьмая восьмое",
+    9: "девять девятый девятая девятое",
+    10: "десять десятый десятая десятое",
+    11: "одиннадцать одиннадцатый",
+    12: "двенадцать двенадцатый",
+    13: "тринадцать тринадцатый",
+    14: "четырнадцать четырнадцатый",
+    15: "пятнадцать пятнадцатый",
+    16: "шестнадцать шестнадцатый",
+    17: "семнадцать семнадцатый",
+    18: "восемнадцать восемнадцатый",
+    19: "девятнадцать девятнадцатый",
+    20: "двадцать двадцатый",
+    30: "тридцать",
+    40: "сорок",
+    50: "пятьдесят",
+    100: "сто",
+    1000: "тысяча",
+}.items():
+    for word in words.split():
+        NUMBER_WORDS[word] = str(number)
+
+
+def roman_to_int(token):
+    """Перевод римского числа в арабское (токен уже проверен ROMAN_RE)"""
+    total = 0
+    for i, char in enumerate(token):
+        value = ROMAN_VALUES[char]
+        if i + 1 < len(token) and ROMAN_VALUES[token[i + 1]] > value:
+            total -= value
+        else:
+            total += value
+    return total
+
+
+def normalize_token(token):
+    """Приводит число словами или римскими цифрами к арабским"""
+    if token in NUMBER_WORDS:
+        return NUMBER_WORDS[token]
+    if ROMAN_RE.match(token):
+        return str(roman_to_int(token))
+    return token
+
+
+def normalize(text):
+    """Нормализация ответа: регистр, ё→е, пунктуация, числа"""
+    text = text.lower().replace("ё", "е")
+    # Дефис внутри "1-й" оставляем до разбора числа, остальное - в пробелы
+    text = re.sub(r"[^\w\s-]", " ", text)
+    tokens = []
+    for token in text.split():
+        ordinal = ORDINAL_SUFFIX_RE.match(token)
+        if ordinal:
+            tokens.append(ordinal.group(1))
+            continue
+        tokens.extend(normalize_token(part) for part in token.split("-") if part)
+    return " ".join(tokens)
+
+
+def numbers_of(normalized):
+    """Числа в нормализованном ответе (по порядку)"""
+    return tuple(token for token in normalized.split() if token.isdigit())
+
+
+def bounded_levenshtein(a, b, max_distance):
+    """Расстояние Левенштейна, если оно не больше max_distance, иначе None
+
+    Считается только полоса шириной 2*max_distance+1 вокруг диагонали,
+    и расчет прерывается, как только вся строка таблицы превысила порог.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+    if a == b:
+        return 0
+    if len(a) > len(b):
+        a, b = b, a
+
+    inf = max_distance + 1
+    previous = [j if j <= max_distance else inf for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [inf] * (len(b) + 1)
+        if i <= max_distance:
+            current[0] = i
+        row_min = current[0]
+        start = max(1, i - max_distance)
+        end = min(len(b), i + max_distance)
+        char_a = a[i - 1]
+        for j in range(start, end + 1):
+            cost = 0 if char_a == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            current[j] = value if value <= max_distance else inf
+            if current[j] < row_min:
+                row_min = current[j]
+        if row_min > max_distance:
+            return None
+        previous = current
+
+    distance = previous[len(b)]
+    return distance if distance <= max_distance else None
+
+
+class AnswerMatcher:
+    """Проверка ответов на один вопрос
+
+    Нормализованные варианты правильного ответа считаются один раз, когда
+    вопрос становится активным; проверка каждого сообщения - это поиск
+    в множестве и, при промахе, ограниченный Левенштейн.
+    """
+
+    def __init__(self, question, similarity=ANSWER_SIMILARITY):
+        answers = [question["answer"], *question.get("alternatives", [])]
+        self.forms = {normalize(answer) for answer in answers}
+        self.forms.discard("")
+        # Для каждого варианта: числа в нем и допустимое число опечаток.
+        # Порог в целых процентах: int(5 * (1 - 0.8)) дает 0 из-за 0.19999...
+        percent = round(similarity * 100)
+        self.fuzzy_forms = [
+            (form, numbers_of(form), len(form) * (100 - percent) // 100)
+            for form in self.forms
+        ]
+
+    def match(self, answer):
+        """True, если ответ совпадает с одним из вариантов с учетом опечаток"""
+        normalized = normalize(answer)
+        if not normalized:
+            return False
+        if normalized in self.forms:
+            return True
+        # Числа опечаткой не считаются: "александр 2" - это не "александр 1"
+        numbers = numbers_of(normalized)
+        for form, form_numbers, max_distance in self.fuzzy_forms:
+            if not max_distance or numbers != form_numbers:
+                continue
+            if bounded_levenshtein(normalized, form, max_distance) is not None:
+                return True
+        return False
@@ -1,538 +1,886 @@
-import logging
-import sys
-import datetime
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, JobQueue
-from quiz_manager import QuizManager
-
-print("🚀 Бот запускается...")
-
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-
-print("🔧 Инициализация бота...")
-
-# Инициализация менеджера викторины
-quiz_manager = QuizManager()
-
-def save_user_info(update: Update):
-    """Сохраняет информацию о пользователе при любом взаимодействии"""
-    try:
-        user = update.message.from_user
-        quiz_manager.update_user_info(user.id, user.username, user.first_name)
-        print(f"💾 Сохранен пользователь: {user.first_name} (ID: {user.id})")
-    except Exception as e:
-        print(f"❌ Ошибка сохранения пользователя: {e}")
-
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработка текстовых сообщений (ответов) - только сообщения начинающиеся с -"""
-    print(f"📨 Получено сообщение: '{update.message.text}' от {update.message.from_user.first_name}")
-    
-    # Игнорируем команды
-    if update.message.text.startswith('/'):
-        print("⚙️ Игнорируем команду")
-        return
-    
-    # Игнорируем сообщения, которые НЕ начинаются с -
-    if not update.message.text.startswith('-'):
-        print("⚙️ Игнорируем сообщение (не начинается с -)")
-        return
-    
-    user = update.message.from_user
-    # Убираем - из начала ответа для проверки
-    user_answer = update.message.text[1:].strip()
-    
-    # Проверяем, что после - есть текст
-    if not user_answer:
-        print("⚙️ Игнорируем сообщение (пустой ответ после -)")
-        await update.message.reply_text("💡 Напиши ответ после дефиса!\nПример: - париж")
-        return
-    
-    print(f"🔍 Проверяем ответ от {user.first_name}: '{user_answer}'")
-    
-    # Сохраняем информацию о пользователе
-    save_user_info(update)
-    
-    # Проверяем ответ
-    is_correct, reason = quiz_manager.check_answer(user.id, user_answer, context, update.effective_chat.id)
-    
-    print(f"📊 Результат проверки: correct={is_correct}, reason={reason}")
-    
-    if reason == "already_answered":
-        print(f"⚠️ Пользователь {user.first_name} пытался ответить после правильного ответа")
-        
-        # Получаем информацию о том, кто ответил первым
-        first_responder_info = quiz_manager.get_first_responder_info()
-        
-        if first_responder_info:
-            responder_name = first_responder_info.get('first_name', 'другой участник')
-            await update.message.reply_text(f"❌ Опоздал! На этот вопрос уже ответил {responder_name}!")
-        else:
-            await update.message.reply_text("❌ На этот вопрос уже ответили!")
-            
-    elif reason == "no_question":
-        print("⚠️ Нет активного вопроса")
-        await update.message.reply_text(
-            "ℹ️ Сейчас нет активной викторины.\n"
-            "Жди следующую викторину по расписанию! 📅\n"
-            "Используй /schedule чтобы посмотреть расписание."
-        )
-        
-    elif is_correct:
-        user_score = quiz_manager.get_user_score(user.id)
-        print(f"✅ Правильный ответ! {user.first_name} получает очко. Счет: {user_score}")
-        
-        # Поздравление для победителя
-        import random
-        congrats_messages = [
-            f"🎉 БИНГО! {user.first_name} получает 1 очко!",
-            f"✅ В ЯБЛОЧКО! {user.first_name} +1 очко!",
-            f"🏆 ВЕРНО! {user.first_name} зарабатывает очко!",
-            f"⭐ ОТЛИЧНО! {user.first_name} получает 1 балл!",
-            f"🎯 ПОПАДАНИЕ! {user.first_name} +1 к счету!",
-        ]
-        congrats_message = random.choice(congrats_messages)
-        
-        await update.message.reply_text(
-            f"{congrats_message}\n"
-            f"📊 Твой счет: {user_score}\n\n"
-            f"Используй /leaderboard чтобы посмотреть таблицу лидеров!"
-        )
-    else:
-        # НИКАКОЙ РЕАКЦИИ НА НЕПРАВИЛЬНЫЕ ОТВЕТЫ - УБИРАЕМ СПАМ
-        print(f"❌ Неправильный ответ от {user.first_name} - игнорируем")
-        # НЕ отправляем сообщение - просто игнорируем
-
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик команды /start"""
-    save_user_info(update)
-    
-    # Сохраняем ID чата для автоматических викторин
-    chat_id = update.effective_chat.id
-    quiz_manager.add_chat_id(chat_id)
-    print(f"💾 Сохранен чат ID: {chat_id} для автоматических викторин")
-    
-    quiz_times = quiz_manager.get_quiz_times()
-    times_text = "\n".join([f"• {time}" for time in quiz_times])
-    
-    welcome_text = f"""
-🤖 Добро пожаловать в Карась-викторину!
-
-🕐 Карась-Викторины запускаются автоматически каждый день в 12:00!
-
-🎯 Доступные команды:
-/start - показать это сообщение
-/leaderboard - таблица лидеров
-/question - показать текущий вопрос
-/schedule - показать расписание
-/profile - мой профиль и уровень
-/achievements - мои достижения
-/next_quiz - когда следующая Карась-викторина
-/reset_stats - сброс статистики (только для админов)
-
-💡 Просто напиши ответ в чат, когда увидишь вопрос!
-Первый правильный ответ = 1 Карась-балл!
-
-🏆 Накопи очки чтобы повысить уровень и получить достижения!
-    """
-    await update.message.reply_text(welcome_text)
-
-async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик команды /leaderboard"""
-    save_user_info(update)
-    
-    leaders = quiz_manager.get_leaderboard()
-    
-    if not leaders:
-        await update.message.reply_text("📊 Пока никто не заработал Карась-баллов. Будь первым!")
-        return
-    
-    leaderboard_text = "🏆 ТАБЛИЦА ЛИДЕРОВ:\n\n"
-    for i, (user_id, user_data) in enumerate(leaders, 1):
-        name = user_data.get('username') or user_data.get('first_name') or f"User{user_id}"
-        score = user_data.get('score', 0)
-        level = quiz_manager.get_user_level(score)
-        level_emoji = quiz_manager.get_user_profile(user_id)['level_emoji']
-        leaderboard_text += f"{i}. {name}: {score} очков {level_emoji} Ур.{level}\n"
-    
-    # Добавляем общее количество игроков
-    all_users = quiz_manager.load_users().get('users', {})
-    total_players = len(all_users)
-    leaderboard_text += f"\n👥 Всего игроков: {total_players}"
-    
-    await update.message.reply_text(leaderboard_text)
-
-async def question(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик команды /question - показывает текущий вопрос"""
-    print(f"🔍 Команда /question от {update.message.from_user.first_name}")
-    
-    save_user_info(update)
-    
-    current_question = quiz_manager.get_current_question()
-    print(f"📋 Текущий вопрос из базы: {current_question}")
-    
-    if current_question:
-        response_text = f"📝 ТЕКУЩИЙ ВОПРОС:\n\n{current_question['question']}"
-        print(f"✅ Отправляем вопрос: {current_question['question'][:50]}...")
-    else:
-        response_text = (
-            "ℹ️ Сейчас нет активного вопроса.\n"
-            "Следующая викторина по расписанию!"
-        )
-        print("❌ Нет активного вопроса")
-    
-    await update.message.reply_text(response_text)
-
-async def schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик команды /schedule - показывает расписание"""
-    save_user_info(update)
-    
-    quiz_times = quiz_manager.get_quiz_times()
-    if quiz_times:
-        times_text = "\n".join([f"• {time}" for time in quiz_times])
-        await update.message.reply_text(f"🕐 Расписание викторин (МСК):\n\n{times_text}")
-    else:
-        await update.message.reply_text("📅 Расписание не настроено.")
-
-async def next_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показывает, когда следующая викторина"""
-    save_user_info(update)
-    
-    quiz_times = quiz_manager.get_quiz_times()
-    if not quiz_times:
-        await update.message.reply_text("📅 Расписание не настроено.")
-        return
-    
-    # Просто показываем расписание
-    times_text = "\n".join([f"• {time}" for time in quiz_times])
-    await update.message.reply_text(f"🕐 Следующие викторины (МСК):\n\n{times_text}")
-
-async def quiz(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Ручной запуск викторины (только для админов)"""
-    save_user_info(update)
-    
-    try:
-        # Проверка прав администратора
-        chat_admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-        admin_ids = [admin.user.id for admin in chat_admins]
-        
-        if update.message.from_user.id not in admin_ids:
-            await update.message.reply_text("❌ Эта команда только для администраторов чата!")
-            return
-        
-        await update.message.reply_text("🔄 Запускаю викторину...")
-        
-        # Запускаем викторину
-        await send_quiz_to_chat(update.effective_chat.id, context)
-            
-    except Exception as e:
-        await update.message.reply_text(f"❌ Ошибка при запуске викторины: {e}")
-        print(f"❌ Ошибка quiz: {e}")
-
-async def reset_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Сброс всей статистики (только для админов)"""
-    save_user_info(update)
-    
-    try:
-        # Проверка прав администратора
-        chat_admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-        admin_ids = [admin.user.id for admin in chat_admins]
-        
-        if update.message.from_user.id not in admin_ids:
-            await update.message.reply_text("❌ Эта команда только для администраторов чата!")
-            return
-        
-        # Сбрасываем статистику
-        quiz_manager.reset_all_stats()
-        
-        await update.message.reply_text(
-            "🔄 Вся статистика сброшена! 🎯\n\n"
-            "✅ Таблица лидеров очищена\n"
-            "✅ Все вопросы разблокированы\n" 
-            "✅ Текущий вопрос сброшен\n"
-            "✅ Все достижения сброшены\n"
-            "📊 Теперь все начинают с 0 очков!\n\n"
-            "Запусти новую викторину командой /quiz"
-        )
-        print(f"✅ Статистика сброшена администратором {update.message.from_user.first_name}")
-        
-    except Exception as e:
-        await update.message.reply_text(f"❌ Ошибка при сбросе статистики: {e}")
-        print(f"❌ Ошибка reset_stats: {e}")
-
-async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показывает профиль пользователя"""
-    save_user_info(update)
-    
-    user = update.message.from_user
-    profile = quiz_manager.get_user_profile(user.id)
-    
-    profile_text = f"""
-👤 ПРОФИЛЬ: {user.first_name}
-
-{profile['level_emoji']} Уровень: {profile['level']} ({profile['level_name']})
-⭐ Очки: {profile['score']}
-🏅 Достижений: {len(profile['achievements'])}
-📈 Прогресс: {profile['progress_percent']}%
-
-🎯 До следующего уровня: {profile['next_level_points'] - profile['score'] if isinstance(profile['next_level_points'], int) else 'максимум'} очков
-    """
-    
-    await update.message.reply_text(profile_text)
-
-async def achievements(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показывает достижения пользователя"""
-    save_user_info(update)
-    
-    user = update.message.from_user
-    user_achievements = quiz_manager.get_user_achievements(user.id)
-    profile = quiz_manager.get_user_profile(user.id)
-    
-    if not user_achievements:
-        await update.message.reply_text(
-            f"🎯 У тебя пока нет достижений, {user.first_name}!\n"
-            f"🏆 Продолжай участвовать в викторинах чтобы получить свои первые награды!\n\n"
-            f"📊 Твой уровень: {profile['level_emoji']} {profile['level_name']}\n"
-            f"⭐ Очков: {profile['score']}"
-        )
-        return
-    
-    achievements_text = f"🏅 ТВОИ ДОСТИЖЕНИЯ, {user.first_name}:\n\n"
-    
-    for ach_id in user_achievements:
-        ach = quiz_manager.ACHIEVEMENTS[ach_id]
-        achievements_text += f"{ach['icon']} {ach['name']}\n{ach['description']}\n\n"
-    
-    achievements_text += f"📊 Уровень: {profile['level_emoji']} {profile['level_name']}\n"
-    achievements_text += f"⭐ Очков: {profile['score']}\n"
-    achievements_text += f"🎯 До следующего уровня: {profile['next_level_points'] - profile['score'] if isinstance(profile['next_level_points'], int) else 'максимум'} очков"
-    
-    await update.message.reply_text(achievements_text)
-
-async def test_scheduler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Тестовая команда для проверки планировщика"""
-    save_user_info(update)
-    
-    try:
-        # Проверка прав администратора
-        chat_admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-        admin_ids = [admin.user.id for admin in chat_admins]
-        
-        if update.message.from_user.id not in admin_ids:
-            await update.message.reply_text("❌ Эта команда только для администраторов чата!")
-            return
-        
-        await update.message.reply_text("🧪 Тестируем планировщик...")
-        
-        # Запускаем викторину через планировщик через 10 секунд
-        context.job_queue.run_once(
-            scheduled_quiz, 
-            10,  # через 10 секунд
-            chat_id=update.effective_chat.id,
-            name="test_scheduled_quiz"
-        )
-        
-        await update.message.reply_text("✅ Тест запущен! Викторина придет через 10 секунд...")
-        print("⏰ Тестовый запуск планировщика через 10 секунд")
-        
-    except Exception as e:
-        await update.message.reply_text(f"❌ Ошибка тестирования: {e}")
-        print(f"❌ Ошибка test_scheduler: {e}")
-
-async def active_chats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показывает активные чаты (только для админов)"""
-    save_user_info(update)
-    
-    try:
-        # Проверка прав администратора
-        chat_admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-        admin_ids = [admin.user.id for admin in chat_admins]
-        
-        if update.message.from_user.id not in admin_ids:
-            await update.message.reply_text("❌ Эта команда только для администраторов чата!")
-            return
-        
-        active_chats = quiz_manager.get_active_chats()
-        
-        if not active_chats:
-            await update.message.reply_text("📊 Нет активных чатов")
-            return
-        
-        chats_text = "📊 АКТИВНЫЕ ЧАТЫ:\n\n"
-        for i, chat_id in enumerate(active_chats, 1):
-            try:
-                chat = await context.bot.get_chat(chat_id)
-                chat_name = chat.title or chat.first_name or f"Чат {chat_id}"
-                chats_text += f"{i}. {chat_name} (ID: {chat_id})\n"
-            except:
-                chats_text += f"{i}. Неизвестный чат (ID: {chat_id})\n"
-        
-        await update.message.reply_text(chats_text)
-        
-    except Exception as e:
-        await update.message.reply_text(f"❌ Ошибка: {e}")
-        print(f"❌ Ошибка active_chats: {e}")
-
-async def send_quiz_to_chat(chat_id, context):
-    """Отправляет викторину в указанный чат"""
-    try:
-        question_data = quiz_manager.get_random_question()
-        if question_data:
-            print(f"📝 Устанавливаем новый вопрос: {question_data['question']}")
-            quiz_manager.set_current_question(question_data)
-            
-            message = (
-                f"🧠 ВИКТОРИНА!\n\n"
-                f"{question_data['question']}\n\n"
-                f"💡 Отвечайте, начиная сообщение с ДЕФИСА:\n"
-                f"- ваш ответ\n\n"
-                f"🎯 Первый правильный ответ получает 1 Карась-балл!"
-            )
-            
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=message
-            )
-            print(f"✅ Викторина отправлена в чат {chat_id}!")
-            return True
-        else:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="😔 На сегодня вопросы закончились!"
-            )
-            return False
-    except Exception as e:
-        print(f"❌ Ошибка при отправке викторины: {e}")
-        return False
-
-async def scheduled_quiz(context: ContextTypes.DEFAULT_TYPE):
-    """Функция для запуска викторины по расписанию"""
-    print("🕐 Запуск викторины по расписанию...")
-    
-    # Получаем все активные чаты
-    active_chats = quiz_manager.get_active_chats()
-    print(f"📋 Активные чаты: {active_chats}")
-    
-    if not active_chats:
-        print("⚠️ Нет активных чатов для отправки викторины")
-        return
-    
-    # Отправляем викторину во все активные чаты
-    successful_sends = 0
-    for chat_id in active_chats:
-        try:
-            result = await send_quiz_to_chat(chat_id, context)
-            if result:
-                successful_sends += 1
-        except Exception as e:
-            print(f"❌ Ошибка отправки в чат {chat_id}: {e}")
-    
-    print(f"✅ Викторина отправлена в {successful_sends} из {len(active_chats)} чатов")
-
-def setup_scheduler(application):
-    """Настраивает планировщик для автоматических викторин"""
-    try:
-        job_queue = application.job_queue
-        
-        if job_queue is None:
-            print("❌ JobQueue недоступен")
-            return
-        
-        # Время викторин (МСК)
-        quiz_times_msk = ["12:00"]
-        
-        print(f"⏰ Настройка планировщика для времени: {quiz_times_msk}")
-        
-        for time_msk in quiz_times_msk:
-            try:
-                # Конвертируем МСК в UTC (МСК = UTC+3)
-                hours_msk, minutes = map(int, time_msk.split(':'))
-                hours_utc = (hours_msk - 3) % 24  # МСК -> UTC
-                
-                # Правильное создание объекта времени
-                from datetime import time as dt_time
-                time_utc = dt_time(hour=hours_utc, minute=minutes, second=0)
-                
-                # Создаем job для каждого времени
-                job_queue.run_daily(
-                    scheduled_quiz,
-                    time=time_utc,
-                    days=tuple(range(7)),  # Все дни недели
-                    name=f"quiz_{time_msk}"
-                )
-                print(f"✅ Викторина настроена на {time_msk} МСК ({hours_utc:02d}:{minutes:02d} UTC)")
-                
-            except Exception as e:
-                print(f"❌ Ошибка настройки времени {time_msk}: {e}")
-        
-        print("✅ Планировщик успешно настроен!")
-        
-    except Exception as e:
-        print(f"❌ Ошибка настройки планировщика: {e}")
-
-def main():
-    """Основная функция"""
-    print("🔄 Запуск основной функции...")
-    
-    try:
-        # Импортируем токен напрямую из config
-        from config import BOT_TOKEN
-        
-        if BOT_TOKEN == "ВАШ_ТОКЕН_ОТ_BOTFATHER":
-            print("❌ ЗАМЕНИТЕ ТОКЕН В config.py на настоящий!")
-            input("Нажмите Enter чтобы выйти...")
-            return
-        
-        print("✅ Токен загружен")
-        
-        # Создание приложения
-        application = Application.builder().token(BOT_TOKEN).build()
-        print("✅ Приложение создано")
-        
-        # Добавление обработчиков
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("leaderboard", leaderboard))
-        application.add_handler(CommandHandler("question", question))
-        application.add_handler(CommandHandler("schedule", schedule))
-        application.add_handler(CommandHandler("next_quiz", next_quiz))
-        application.add_handler(CommandHandler("quiz", quiz))
-        application.add_handler(CommandHandler("reset_stats", reset_stats))
-        application.add_handler(CommandHandler("profile", profile))
-        application.add_handler(CommandHandler("achievements", achievements))
-        application.add_handler(CommandHandler("test_schedule", test_scheduler))
-        application.add_handler(CommandHandler("active_chats", active_chats))
-        
-        # Обработчик сообщений ДОЛЖЕН БЫТЬ ПОСЛЕДНИМ!
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-        
-        print("✅ Все обработчики добавлены")
-        
-        # Настройка планировщика
-        setup_scheduler(application)
-        
-        # Запуск бота
-        print("🎯 Бот запускается для опроса...")
-        print("⏰ Викторины будут каждые день в 12:00")
-        print("🧪 Для тестирования используйте /test_schedule")
-        print("🔄 Для сброса статистики используйте /reset_stats (админы)")
-        print("🏆 Доступны команды /profile и /achievements")
-        print("🔇 Бот НЕ реагирует на неправильные ответы (убрали спам)")
-        print("🤖 Включено fuzzy-сравнение ответов (80% совпадение)")
-        print("Остановите бота комбинацией Ctrl+C")
-        
-        # Используем run_polling вместо asyncio
-        application.run_polling()
-        
-    except Exception as e:
-        print(f"💥 Критическая ошибка: {e}")
-        import traceback
-        traceback.print_exc()
-        input("Нажмите Enter чтобы выйти...")
-
-if __name__ == '__main__':
-    print("📦 Запуск из main...")
-    main()
-    print("👋 Бот завершил работу")
+import asyncio
+import logging
+import sys
+import datetime
+import functools
+import secrets
+from urllib.parse import urlsplit
+from telegram import Update
+from telegram.ext import Application, ChatMemberHandler, CommandHandler, MessageHandler, TypeHandler, filters, ContextTypes, JobQueue
+from quiz_manager import AsyncQuizManager
+from admin_cache import AdminCache
+from chat_cache import ChatInfoCache
+from broadcaster import Broadcaster, BroadcastReport
+from profile_cache import UserProfileCache
+from render_cache import ResponseCache
+from scheduler import QuizScheduler, chat_schedule, next_quiz_time, parse_time, parse_timezone
+from update_processor import ChatOrderedUpdateProcessor
+from metrics import registry, start_metrics_server, timed_handler
+from profiler import SlowUpdateProfiler
+from storage import atomic_write
+from logging_setup import setup_logging
+
+# Настройка логирования: запись в отдельном потоке, уровни из config
+setup_logging()
+logger = logging.getLogger("bot")
+
+logger.info("🚀 Бот запускается...")
+logger.info("🔧 Инициализация бота...")
+
+# Инициализация менеджера викторины
+quiz_manager = AsyncQuizManager()
+
+# Параллельная рассылка викторин с учетом лимитов Telegram;
+# недоступные чаты исключаются из активных
+broadcaster = Broadcaster(on_deactivate=quiz_manager.remove_chat_id)
+
+# Последние сохраненные профили: save_user_info пишет только изменения
+profile_cache = UserProfileCache(is_current=quiz_manager.is_user_info_current)
+
+# Готовые тексты ответов на команды, сбрасываются событиями QuizManager
+response_cache = ResponseCache()
+quiz_manager.subscribe(response_cache.on_event)
+
+# Задания викторин по расписанию из настроек (перестраиваются при их изменении)
+quiz_scheduler = QuizScheduler()
+quiz_manager.subscribe(quiz_scheduler.on_event)
+
+# Администраторы чатов: админские команды не ждут запрос к Telegram
+admin_cache = AdminCache()
+
+# Названия и типы чатов (пополняются из входящих обновлений)
+chat_info = ChatInfoCache()
+
+# Самые медленные обновления (работает, только если PROFILER_ENABLED)
+update_profiler = SlowUpdateProfiler()
+
+# Сколько сообщений дошло до каждой стадии handle_message (экспортируется в /metrics)
+PIPELINE_STAGES = ("received", "filtered", "empty_answer", "no_session", "late", "profile_saved", "adjudicated", "correct")
+pipeline_stats = registry.counter("bot_messages_total", "Сообщения по стадиям обработки handle_message", ["stage"])
+
+async def save_user_info(update: Update):
+    """Сохраняет информацию о пользователе, если она изменилась; True если записано"""
+    try:
+        user = update.message.from_user
+        if not profile_cache.needs_save(user.id, user.username, user.first_name):
+            return False
+        
+        await quiz_manager.update_user_info(user.id, user.username, user.first_name)
+        profile_cache.mark_saved(user.id, user.username, user.first_name)
+        logger.debug("💾 Сохранен пользователь", extra={"user": user.id})
+        return True
+    except Exception as e:
+        logger.exception(f"❌ Ошибка сохранения пользователя: {e}")
+        return False
+
+async def reply_cached(update: Update, key, tags, render):
+    """Отвечает текстом из кэша; при промахе строит его через render()
+    
+    render() возвращает текст или (текст, ttl), если ответ устареет
+    раньше RENDER_CACHE_TTL.
+    """
+    text = response_cache.get(key)
+    if text is None:
+        generation = response_cache.generation
+        text, ttl = await render(), None
+        if isinstance(text, tuple):
+            text, ttl = text
+        response_cache.put(key, text, tags, generation, ttl)
+    await update.message.reply_text(text)
+
+async def is_chat_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """True, если автор сообщения - администратор чата"""
+    return await admin_cache.is_admin(context.bot, update.effective_chat.id, update.message.from_user.id)
+
+async def remember_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Запоминает название и тип чата из каждого обновления"""
+    if update.effective_chat:
+        chat_info.observe(update.effective_chat)
+
+async def track_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обновляет кэш администраторов при изменении статуса участника чата"""
+    member_update = update.chat_member or update.my_chat_member
+    member = member_update.new_chat_member
+    admin_cache.on_member_update(member_update.chat.id, member.user.id, member.status)
+    
+    # Бота выгнали или заблокировали - рассылать в этот чат больше некуда
+    if update.my_chat_member and member.status in ("left", "kicked"):
+        await broadcaster.deactivate(member_update.chat.id)
+
+async def log_pipeline_stats(context: ContextTypes.DEFAULT_TYPE):
+    """Периодически выводит, на какой стадии отсеиваются сообщения"""
+    from config import METRICS_FILE, PROFILER_ENABLED
+    
+    if pipeline_stats.value(stage="received"):
+        counts = {stage: pipeline_stats.value(stage=stage) for stage in PIPELINE_STAGES}
+        stats = ", ".join(f"{stage}={count}" for stage, count in counts.items() if count)
+        logger.info(f"📈 Обработка сообщений: {stats}")
+    if response_cache.hits or response_cache.misses:
+        logger.info(f"📈 Кэш ответов на команды: попаданий {response_cache.hits}, промахов {response_cache.misses}")
+    if admin_cache.hits or admin_cache.misses:
+        logger.info(f"📈 Кэш администраторов: попаданий {admin_cache.hits}, промахов {admin_cache.misses}, "
+              f"запросов к Telegram {admin_cache.fetches}")
+    processor = context.application.update_processor
+    if isinstance(processor, ChatOrderedUpdateProcessor):
+        stats = processor.stats()
+        logger.info(
+            f"📈 Обновления в обработке: {stats['running']}/{processor.max_running}, "
+            f"в очереди {stats['queued']}, чатов {stats['chats']} "
+            f"(пик за период: {stats['peak_running']} / {stats['peak_queued']})"
+        )
+        processor.reset_peaks()
+    if PROFILER_ENABLED:
+        logger.info(f"🐢 {update_profiler.report(limit=3)}")
+    if METRICS_FILE:
+        # fsync и rename - в отдельном потоке, чтобы не задерживать обработку обновлений
+        await asyncio.to_thread(atomic_write, METRICS_FILE, registry.render())
+
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработка текстовых сообщений (ответов) - только сообщения начинающиеся с -
+    
+    Сообщение проходит стадии от самой дешевой к самой дорогой:
+    1. синтаксический фильтр (ответ начинается с дефиса);
+    2. проверка активной сессии в чате (в памяти);
+    3. сохранение профиля - только если имя/username изменились;
+    4. проверка ответа.
+    Сообщения в чатах без викторины не трогают ни диск, ни пул потоков.
+    """
+    pipeline_stats.inc(stage="received")
+    text = update.message.text
+    
+    # Стадия 1: игнорируем команды и сообщения, которые НЕ начинаются с -
+    if not text.startswith('-'):
+        pipeline_stats.inc(stage="filtered")
+        return
+    
+    user = update.message.from_user
+    chat_id = update.effective_chat.id
+    # Убираем - из начала ответа для проверки
+    user_answer = text[1:].strip()
+    
+    # Проверяем, что после - есть текст
+    if not user_answer:
+        pipeline_stats.inc(stage="empty_answer")
+        await update.message.reply_text("💡 Напиши ответ после дефиса!\nПример: - париж")
+        return
+    
+    # Стадия 2: есть ли викторина в этом чате
+    status = quiz_manager.get_session_status(chat_id)
+    if status is None:
+        pipeline_stats.inc(stage="no_session")
+        await update.message.reply_text(
+            "ℹ️ Сейчас нет активной викторины.\n"
+            "Жди следующую викторину по расписанию! 📅\n"
+            "Используй /schedule чтобы посмотреть расписание."
+        )
+        return
+    
+    if status == "answered":
+        pipeline_stats.inc(stage="late")
+        is_correct, reason = False, "already_answered"
+    else:
+        
+        # Стадия 3: профиль пишем только если он изменился
+        if await save_user_info(update):
+            pipeline_stats.inc(stage="profile_saved")
+        
+        # Стадия 4: проверяем ответ
+        pipeline_stats.inc(stage="adjudicated")
+        is_correct, reason = await quiz_manager.check_answer(user.id, user_answer, chat_id)
+        if is_correct:
+            pipeline_stats.inc(stage="correct")
+        
+        logger.debug(
+            "📊 Результат проверки",
+            extra={"chat": chat_id, "user": user.id, "reason": reason, "sampled": True},
+        )
+    
+    if reason == "already_answered":
+        logger.debug("⚠️ Ответ после правильного ответа", extra={"chat": chat_id, "user": user.id, "sampled": True})
+        
+        # Кто ответил первым - из сессии в памяти, без пула потоков
+        first_responder_info = quiz_manager.get_first_responder_info(chat_id)
+        
+        if first_responder_info:
+            responder_name = first_responder_info.get('first_name', 'другой участник')
+            await update.message.reply_text(f"❌ Опоздал! На этот вопрос уже ответил {responder_name}!")
+        else:
+            await update.message.reply_text("❌ На этот вопрос уже ответили!")
+            
+    elif reason == "no_question":
+        logger.debug("⚠️ Нет активного вопроса", extra={"chat": chat_id, "sampled": True})
+        await update.message.reply_text(
+            "ℹ️ Сейчас нет активной викторины.\n"
+            "Жди следующую викторину по расписанию! 📅\n"
+            "Используй /schedule чтобы посмотреть расписание."
+        )
+        
+    elif is_correct:
+        user_score = await quiz_manager.get_user_score(user.id)
+        logger.debug("✅ Очко за правильный ответ", extra={"chat": chat_id, "user": user.id, "score": user_score})
+        
+        # Поздравление для победителя
+        import random
+        congrats_messages = [
+            f"🎉 БИНГО! {user.first_name} получает 1 очко!",
+            f"✅ В ЯБЛОЧКО! {user.first_name} +1 очко!",
+            f"🏆 ВЕРНО! {user.first_name} зарабатывает очко!",
+            f"⭐ ОТЛИЧНО! {user.first_name} получает 1 балл!",
+            f"🎯 ПОПАДАНИЕ! {user.first_name} +1 к счету!",
+        ]
+        congrats_message = random.choice(congrats_messages)
+        
+        await update.message.reply_text(
+            f"{congrats_message}\n"
+            f"📊 Твой счет: {user_score}\n\n"
+            f"Используй /leaderboard чтобы посмотреть таблицу лидеров!"
+        )
+    else:
+        # НИКАКОЙ РЕАКЦИИ НА НЕПРАВИЛЬНЫЕ ОТВЕТЫ - УБИРАЕМ СПАМ
+        logger.debug("❌ Неправильный ответ - игнорируем", extra={"chat": chat_id, "user": user.id, "sampled": True})
+        # НЕ отправляем сообщение - просто игнорируем
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /start"""
+    await save_user_info(update)
+    
+    # Сохраняем ID чата для автоматических викторин
+    chat_id = update.effective_chat.id
+    await quiz_manager.add_chat_id(chat_id)
+    broadcaster.reactivate(chat_id)
+    logger.info(f"💾 Сохранен чат ID: {chat_id} для автоматических викторин")
+    
+    timezone, quiz_times = chat_schedule(quiz_manager.get_settings(), chat_id)
+    times_text = ", ".join(quiz_times) or "-"
+    
+    welcome_text = f"""
+🤖 Добро пожаловать в Карась-викторину!
+
+🕐 Карась-Викторины запускаются автоматически каждый день в {times_text} ({timezone})!
+
+🎯 Доступные команды:
+/start - показать это сообщение
+/leaderboard - таблица лидеров
+/question - показать текущий вопрос
+/schedule - показать расписание
+/profile - мой профиль и уровень
+/achievements - мои достижения
+/next_quiz - когда следующая Карась-викторина
+/reset_stats - сброс статистики (только для админов)
+/set_schedule, /set_timezone - расписание чата (только для админов)
+
+💡 Просто напиши ответ в чат, когда увидишь вопрос!
+Первый правильный ответ = 1 Карась-балл!
+
+🏆 Накопи очки чтобы повысить уровень и получить достижения!
+    """
+    await update.message.reply_text(welcome_text)
+
+def format_leaderboard_row(position, user_id, user_data):
+    """Строка таблицы лидеров"""
+    name = user_data.get('username') or user_data.get('first_name') or f"User{user_id}"
+    return f"{position}. {name}: {user_data['score']} очков {user_data['level_emoji']} Ур.{user_data['level']}\n"
+
+async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /leaderboard
+    
+    В группе показывает рейтинг этого чата, в личке или с аргументом
+    "global" - общий рейтинг.
+    """
+    await save_user_info(update)
+    
+    user = update.message.from_user
+    chat = update.effective_chat
+    use_global = chat.type == "private" or (context.args and context.args[0].lower() in ("global", "общий"))
+    chat_id = None if use_global else chat.id
+    
+    tags = ["scores:global"] if use_global else [f"scores:chat:{chat_id}"]
+    await reply_cached(
+        update,
+        ("leaderboard", chat_id, user.id),
+        tags,
+        lambda: render_leaderboard(chat_id, user.id),
+    )
+
+async def render_leaderboard(chat_id, user_id):
+    """Текст таблицы лидеров (общей при chat_id=None) для пользователя user_id"""
+    leaders = await quiz_manager.get_leaderboard(chat_id)
+    
+    if not leaders:
+        return "📊 Пока никто не заработал Карась-баллов. Будь первым!"
+    
+    leaderboard_text = "🏆 ТАБЛИЦА ЛИДЕРОВ:\n\n" if chat_id is None else "🏆 ТАБЛИЦА ЛИДЕРОВ ЧАТА:\n\n"
+    for i, (leader_id, user_data) in enumerate(leaders, 1):
+        leaderboard_text += format_leaderboard_row(i, leader_id, user_data)
+    
+    # Место пользователя и соседи, если он не попал в топ
+    rank = await quiz_manager.get_user_rank(user_id, chat_id)
+    if rank and rank > len(leaders):
+        leaderboard_text += "...\n"
+        for position, neighbour_id, user_data in await quiz_manager.get_leaderboard_neighbours(user_id, chat_id):
+            if position > len(leaders):
+                leaderboard_text += format_leaderboard_row(position, neighbour_id, user_data)
+    if rank:
+        leaderboard_text += f"\n📍 Твое место: {rank}"
+    
+    # Добавляем общее количество игроков
+    total_players = await quiz_manager.get_players_count(chat_id)
+    leaderboard_text += f"\n👥 Всего игроков: {total_players}"
+    if chat_id is not None:
+        leaderboard_text += "\n🌍 Общий рейтинг: /leaderboard global"
+    
+    return leaderboard_text
+
+async def question(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /question - показывает текущий вопрос"""
+    logger.debug("🔍 Команда /question", extra={"chat": update.effective_chat.id, "sampled": True})
+    
+    await save_user_info(update)
+    
+    chat_id = update.effective_chat.id
+    await reply_cached(update, ("question", chat_id), [f"session:{chat_id}"], lambda: render_question(chat_id))
+
+async def render_question(chat_id):
+    """Текст ответа /question для чата"""
+    current_question = await quiz_manager.get_current_question(chat_id)
+    
+    if current_question:
+        logger.debug("✅ Отправляем вопрос", extra={"chat": chat_id, "question": current_question.get("id")})
+        return f"📝 ТЕКУЩИЙ ВОПРОС:\n\n{current_question['question']}"
+    logger.debug("❌ Нет активного вопроса", extra={"chat": chat_id})
+    return (
+        "ℹ️ Сейчас нет активного вопроса.\n"
+        "Следующая викторина по расписанию!"
+    )
+
+async def schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /schedule - показывает расписание чата"""
+    await save_user_info(update)
+    chat_id = update.effective_chat.id
+    await reply_cached(update, ("schedule", chat_id), ["schedule"], lambda: render_schedule(chat_id))
+
+async def render_schedule(chat_id):
+    timezone, quiz_times = chat_schedule(quiz_manager.get_settings(), chat_id)
+    if quiz_times:
+        times_text = "\n".join([f"• {time}" for time in quiz_times])
+        return f"🕐 Расписание викторин ({timezone}):\n\n{times_text}"
+    return "📅 Расписание не настроено."
+
+async def next_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает, когда следующая викторина"""
+    await save_user_info(update)
+    chat_id = update.effective_chat.id
+    await reply_cached(update, ("next_quiz", chat_id), ["schedule"], lambda: render_next_quiz(chat_id))
+
+async def render_next_quiz(chat_id):
+    timezone, quiz_times = chat_schedule(quiz_manager.get_settings(), chat_id)
+    next_time = next_quiz_time(timezone, quiz_times)
+    if not next_time:
+        return "📅 Расписание не настроено."
+    
+    # Как только викторина начнется, ответ устареет
+    seconds_left = (next_time - datetime.datetime.now(next_time.tzinfo)).total_seconds()
+    return f"🕐 Следующая викторина: {next_time:%d.%m в %H:%M} ({timezone})", seconds_left
+
+async def quiz(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Ручной запуск викторины (только для админов)"""
+    await save_user_info(update)
+    
+    try:
+        # Проверка прав администратора
+        if not await is_chat_admin(update, context):
+            await update.message.reply_text("❌ Эта команда только для администраторов чата!")
+            return
+        
+        await update.message.reply_text("🔄 Запускаю викторину...")
+        
+        # Запускаем викторину
+        await send_quiz_to_chat(update.effective_chat.id, context)
+            
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка при запуске викторины: {e}")
+        logger.exception(f"❌ Ошибка quiz: {e}")
+
+async def reset_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Сброс всей статистики (только для админов)"""
+    await save_user_info(update)
+    
+    try:
+        # Проверка прав администратора
+        if not await is_chat_admin(update, context):
+            await update.message.reply_text("❌ Эта команда только для администраторов чата!")
+            return
+        
+        # Сбрасываем статистику
+        await quiz_manager.reset_all_stats()
+        
+        await update.message.reply_text(
+            "🔄 Вся статистика сброшена! 🎯\n\n"
+            "✅ Таблица лидеров очищена\n"
+            "✅ Все вопросы разблокированы\n" 
+            "✅ Текущий вопрос сброшен\n"
+            "✅ Все достижения сброшены\n"
+            "📊 Теперь все начинают с 0 очков!\n\n"
+            "Запусти новую викторину командой /quiz"
+        )
+        logger.info(f"✅ Статистика сброшена администратором {update.message.from_user.first_name}")
+        
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка при сбросе статистики: {e}")
+        logger.exception(f"❌ Ошибка reset_stats: {e}")
+
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает профиль пользователя"""
+    await save_user_info(update)
+    
+    user = update.message.from_user
+    # Место в общем рейтинге меняется от чужих очков - тег общий
+    await reply_cached(
+        update,
+        ("profile", user.id, user.first_name),
+        ["scores:global"],
+        lambda: render_profile(user.id, user.first_name),
+    )
+
+async def render_profile(user_id, first_name):
+    """Текст профиля пользователя"""
+    profile = await quiz_manager.get_user_profile(user_id)
+    
+    profile_text = f"""
+👤 ПРОФИЛЬ: {first_name}
+
+{profile['level_emoji']} Уровень: {profile['level']} ({profile['level_name']})
+⭐ Очки: {profile['score']}
+🏅 Достижений: {len(profile['achievements'])}
+📈 Прогресс: {profile['progress_percent']}%
+🏆 Место в рейтинге: {profile['rank'] or '-'} из {profile['players']}
+
+🎯 До следующего уровня: {profile['next_level_points'] - profile['score'] if isinstance(profile['next_level_points'], int) else 'максимум'} очков
+    """
+    
+    return profile_text
+
+async def achievements(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает достижения пользователя"""
+    await save_user_info(update)
+    
+    user = update.message.from_user
+    user_achievements = await quiz_manager.get_user_achievements(user.id)
+    profile = await quiz_manager.get_user_profile(user.id)
+    
+    if not user_achievements:
+        await update.message.reply_text(
+            f"🎯 У тебя пока нет достижений, {user.first_name}!\n"
+            f"🏆 Продолжай участвовать в викторинах чтобы получить свои первые награды!\n\n"
+            f"📊 Твой уровень: {profile['level_emoji']} {profile['level_name']}\n"
+            f"⭐ Очков: {profile['score']}"
+        )
+        return
+    
+    achievements_text = f"🏅 ТВОИ ДОСТИЖЕНИЯ, {user.first_name}:\n\n"
+    
+    for ach_id in user_achievements:
+        ach = quiz_manager.ACHIEVEMENTS[ach_id]
+        achievements_text += f"{ach['icon']} {ach['name']}\n{ach['description']}\n\n"
+    
+    achievements_text += f"📊 Уровень: {profile['level_emoji']} {profile['level_name']}\n"
+    achievements_text += f"⭐ Очков: {profile['score']}\n"
+    achievements_text += f"🎯 До следующего уровня: {profile['next_level_points'] - profile['score'] if isinstance(profile['next_level_points'], int) else 'максимум'} очков"
+    
+    await update.message.reply_text(achievements_text)
+
+async def test_scheduler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Тестовая команда для проверки планировщика"""
+    await save_user_info(update)
+    
+    try:
+        # Проверка прав администратора
+        if not await is_chat_admin(update, context):
+            await update.message.reply_text("❌ Эта команда только для администраторов чата!")
+            return
+        
+        await update.message.reply_text("🧪 Тестируем планировщик...")
+        
+        # Запускаем викторину через планировщик через 10 секунд
+        context.job_queue.run_once(
+            scheduled_quiz, 
+            10,  # через 10 секунд
+            chat_id=update.effective_chat.id,
+            name="test_scheduled_quiz"
+        )
+        
+        await update.message.reply_text("✅ Тест запущен! Викторина придет через 10 секунд...")
+        logger.info("⏰ Тестовый запуск планировщика через 10 секунд")
+        
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка тестирования: {e}")
+        logger.exception(f"❌ Ошибка test_scheduler: {e}")
+
+async def set_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Свое расписание чата: /set_schedule 09:00 18:00 или /set_schedule default"""
+    await save_user_info(update)
+    
+    try:
+        if not await is_chat_admin(update, context):
+            await update.message.reply_text("❌ Эта команда только для администраторов чата!")
+            return
+        
+        if not context.args:
+            await update.message.reply_text("ℹ️ Использование: /set_schedule 09:00 18:00 (или default - общее расписание)")
+            return
+        
+        chat_id = update.effective_chat.id
+        if context.args[0].lower() == "default":
+            await quiz_manager.set_chat_schedule(chat_id, times=None)
+            await update.message.reply_text("✅ Чат снова получает викторины по общему расписанию")
+            return
+        
+        try:
+            times = sorted({parse_time(value) for value in context.args})
+        except ValueError:
+            await update.message.reply_text("❌ Время указывается в формате ЧЧ:ММ, например 09:30")
+            return
+        
+        await quiz_manager.set_chat_schedule(chat_id, times=times)
+        await update.message.reply_text(f"✅ Расписание чата: {', '.join(times)}")
+        
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка: {e}")
+        logger.exception(f"❌ Ошибка set_schedule: {e}")
+
+async def set_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Часовой пояс расписания чата: /set_timezone Asia/Yekaterinburg или /set_timezone default"""
+    await save_user_info(update)
+    
+    try:
+        if not await is_chat_admin(update, context):
+            await update.message.reply_text("❌ Эта команда только для администраторов чата!")
+            return
+        
+        if not context.args:
+            await update.message.reply_text("ℹ️ Использование: /set_timezone Europe/Moscow (или default)")
+            return
+        
+        chat_id = update.effective_chat.id
+        if context.args[0].lower() == "default":
+            await quiz_manager.set_chat_schedule(chat_id, timezone=None)
+            await update.message.reply_text("✅ Чат снова использует общий часовой пояс")
+            return
+        
+        try:
+            timezone = parse_timezone(context.args[0])
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
+        
+        await quiz_manager.set_chat_schedule(chat_id, timezone=timezone)
+        await update.message.reply_text(f"✅ Часовой пояс чата: {timezone}")
+        
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка: {e}")
+        logger.exception(f"❌ Ошибка set_timezone: {e}")
+
+async def active_chats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает активные чаты постранично: /active_chats [страница] (только для админов)
+    
+    Сведения о чатах страницы берутся из кэша, недостающие запрашиваются
+    параллельно. Чаты, куда бот больше не может писать, удаляются из списка.
+    """
+    from config import ACTIVE_CHATS_PAGE_SIZE
+    
+    await save_user_info(update)
+    
+    try:
+        # Проверка прав администратора
+        if not await is_chat_admin(update, context):
+            await update.message.reply_text("❌ Эта команда только для администраторов чата!")
+            return
+        
+        active_chats = await quiz_manager.get_active_chats()
+        
+        if not active_chats:
+            await update.message.reply_text("📊 Нет активных чатов")
+            return
+        
+        pages = (len(active_chats) + ACTIVE_CHATS_PAGE_SIZE - 1) // ACTIVE_CHATS_PAGE_SIZE
+        page = int(context.args[0]) if context.args and context.args[0].isdigit() else 1
+        page = min(max(page, 1), pages)
+        first = (page - 1) * ACTIVE_CHATS_PAGE_SIZE
+        page_chats = active_chats[first:first + ACTIVE_CHATS_PAGE_SIZE]
+        
+        infos, gone, migrated = await chat_info.resolve(context.bot, page_chats)
+        for chat_id in gone:
+            await broadcaster.deactivate(chat_id)
+        for old_id, new_id in migrated.items():
+            # Группа стала супергруппой - у нее новый ID
+            await quiz_manager.remove_chat_id(old_id)
+            await quiz_manager.add_chat_id(new_id)
+            broadcaster.reactivate(new_id)
+        
+        chats_text = f"📊 АКТИВНЫЕ ЧАТЫ ({len(active_chats)}), страница {page}/{pages}:\n\n"
+        for i, chat_id in enumerate(page_chats, first + 1):
+            if chat_id in gone:
+                continue
+            if chat_id in migrated:
+                chats_text += f"{i}. Чат переехал в супергруппу (ID: {chat_id} → {migrated[chat_id]})\n"
+                continue
+            info = infos.get(chat_id)
+            if info is None:
+                chats_text += f"{i}. Неизвестный чат (ID: {chat_id})\n"
+                continue
+            chats_text += f"{i}. {info['title']} ({info['type']}, ID: {chat_id})"
+            if info["last_seen"]:
+                last_seen = datetime.datetime.fromtimestamp(info["last_seen"])
+                chats_text += f", активность {last_seen:%d.%m %H:%M}"
+            chats_text += "\n"
+        
+        if gone:
+            chats_text += f"\n🗑️ Удалено недоступных чатов: {len(gone)}"
+        if page < pages:
+            chats_text += f"\n➡️ Следующая страница: /active_chats {page + 1}"
+        
+        await update.message.reply_text(chats_text)
+        
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка: {e}")
+        logger.exception(f"❌ Ошибка active_chats: {e}")
+
+async def expire_used_questions(context: ContextTypes.DEFAULT_TYPE):
+    """Периодически возвращает в оборот давно использованные вопросы"""
+    try:
+        await quiz_manager.clean_old_questions_if_needed()
+    except Exception as e:
+        logger.exception(f"❌ Ошибка возврата вопросов в оборот: {e}")
+
+async def prepare_quiz(chat_id):
+    """Выбирает вопрос для чата, открывает сессию и возвращает текст сообщения"""
+    question_data = await quiz_manager.start_quiz(chat_id)
+    if not question_data:
+        return None
+    
+    return (
+        f"🧠 ВИКТОРИНА!\n\n"
+        f"{question_data['question']}\n\n"
+        f"💡 Отвечайте, начиная сообщение с ДЕФИСА:\n"
+        f"- ваш ответ\n\n"
+        f"🎯 Первый правильный ответ получает 1 Карась-балл!"
+    )
+
+async def quiz_message(chat_id):
+    """Текст викторины для рассылки по расписанию"""
+    return await prepare_quiz(chat_id) or "😔 На сегодня вопросы закончились!"
+
+async def apply_migrations(migrated):
+    """Группы, ставшие супергруппами, получат следующую викторину по новому ID"""
+    for old_id, new_id in migrated.items():
+        await quiz_manager.add_chat_id(new_id)
+        broadcaster.reactivate(new_id)
+
+async def send_quiz_to_chat(chat_id, context):
+    """Отправляет викторину в указанный чат"""
+    try:
+        message = await prepare_quiz(chat_id)
+        # Отчет нужен, чтобы не потерять переезд группы в супергруппу
+        report = BroadcastReport(1)
+        sent = await broadcaster.send(context.bot, chat_id, message or "😔 На сегодня вопросы закончились!", report)
+        await apply_migrations(report.migrated)
+        if message and sent:
+            logger.info(f"✅ Викторина отправлена в чат {chat_id}!")
+            return True
+        return False
+    except Exception as e:
+        logger.exception(f"❌ Ошибка при отправке викторины: {e}")
+        return False
+
+async def scheduled_quiz(context: ContextTypes.DEFAULT_TYPE):
+    """Функция для запуска викторины по расписанию
+    
+    Задание слота (часовой пояс, время) рассылает викторину всем чатам
+    этого слота; тестовое задание без слота - всем активным чатам.
+    """
+    slot = context.job.data if context.job else None
+    logger.info(f"🕐 Запуск викторины по расписанию {slot or ''}...")
+    
+    # Получаем все активные чаты
+    active_chats = await quiz_manager.get_active_chats()
+    # Отключенные чаты уже убраны из активных; считаем те, что ждали бы этот слот
+    skipped = list(broadcaster.deactivated - set(active_chats))
+    if slot is not None:
+        active_chats = quiz_scheduler.chats_for(slot, active_chats)
+        skipped = quiz_scheduler.chats_for(slot, skipped)
+    logger.info(f"📋 Активные чаты: {len(active_chats)}")
+    
+    if not active_chats:
+        logger.warning("⚠️ Нет активных чатов для отправки викторины")
+        return
+    
+    # Вопрос в чате открывается в момент его отправки: при растянутой
+    # рассылке (BROADCAST_JITTER_WINDOW) ответы не приходят все разом
+    messages = {chat_id: functools.partial(quiz_message, chat_id) for chat_id in active_chats}
+    
+    report = await broadcaster.broadcast(context.bot, messages, skipped=len(skipped))
+    logger.info(f"✅ Рассылка викторины: {report.summary()}")
+    
+    await apply_migrations(report.migrated)
+
+async def setup_scheduler(application):
+    """Настраивает задания викторин по расписанию из настроек (post_init)"""
+    try:
+        job_queue = application.job_queue
+        
+        if job_queue is None:
+            logger.error("❌ JobQueue недоступен")
+            return
+        
+        quiz_scheduler.start(job_queue, scheduled_quiz, quiz_manager.get_settings())
+        logger.info(f"✅ Планировщик успешно настроен! Слотов викторин: {len(quiz_scheduler.jobs)}")
+        
+    except Exception as e:
+        logger.exception(f"❌ Ошибка настройки планировщика: {e}")
+
+async def start_monitoring(application):
+    """Запускает профилировщик и HTTP-сервер метрик, если они включены"""
+    from config import METRICS_HOST, METRICS_PORT, PROFILER_ENABLED
+    
+    if PROFILER_ENABLED:
+        update_profiler.start()
+        logger.info("🐢 Профилировщик медленных обновлений включен")
+    if METRICS_PORT:
+        application.bot_data["metrics_server"] = await start_metrics_server(
+            METRICS_HOST, METRICS_PORT, {"/metrics": registry.render, "/slow": update_profiler.report}
+        )
+        logger.info(f"📊 Метрики: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+async def post_init(application):
+    """Настройка после запуска приложения: расписание викторин и мониторинг"""
+    await setup_scheduler(application)
+    await start_monitoring(application)
+
+async def shutdown(application):
+    """Финальный сброс данных на диск при остановке бота"""
+    server = application.bot_data.pop("metrics_server", None)
+    if server is not None:
+        server.close()
+    update_profiler.stop()
+    await quiz_manager.close()
+
+def build_application(token, base_url=None, concurrent_updates=None):
+    """Создает приложение со всеми обработчиками и периодическими заданиями
+    
+    base_url позволяет направить бота на другой сервер Bot API
+    (например, на тестовый стенд load_harness.py). Обновления разных
+    чатов обрабатываются параллельно (до concurrent_updates одновременно),
+    обновления одного чата - по очереди в порядке прихода.
+    """
+    from config import PIPELINE_STATS_INTERVAL, QUESTION_EXPIRY_INTERVAL, CONCURRENT_UPDATES, PROFILER_ENABLED
+    
+    processor = ChatOrderedUpdateProcessor(
+        concurrent_updates or CONCURRENT_UPDATES, profiler=update_profiler if PROFILER_ENABLED else None
+    )
+    builder = Application.builder().token(token).concurrent_updates(processor)
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.post_init(post_init).post_shutdown(shutdown).build()
+    logger.info("✅ Приложение создано")
+    
+    # Добавление обработчиков
+    application.add_handler(TypeHandler(Update, remember_chat), group=-1)
+    application.add_handler(CommandHandler("start", timed_handler(start)))
+    application.add_handler(CommandHandler("leaderboard", timed_handler(leaderboard)))
+    application.add_handler(CommandHandler("question", timed_handler(question)))
+    application.add_handler(CommandHandler("schedule", timed_handler(schedule)))
+    application.add_handler(CommandHandler("next_quiz", timed_handler(next_quiz)))
+    application.add_handler(CommandHandler("quiz", timed_handler(quiz)))
+    application.add_handler(CommandHandler("reset_stats", timed_handler(reset_stats)))
+    application.add_handler(CommandHandler("profile", timed_handler(profile)))
+    application.add_handler(CommandHandler("achievements", timed_handler(achievements)))
+    application.add_handler(CommandHandler("test_schedule", timed_handler(test_scheduler)))
+    application.add_handler(CommandHandler("active_chats", timed_handler(active_chats)))
+    application.add_handler(CommandHandler("set_schedule", timed_handler(set_schedule)))
+    application.add_handler(CommandHandler("set_timezone", timed_handler(set_timezone)))
+    application.add_handler(ChatMemberHandler(track_chat_member, ChatMemberHandler.ANY_CHAT_MEMBER))
+    
+    # Обработчик сообщений ДОЛЖЕН БЫТЬ ПОСЛЕДНИМ!
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, timed_handler(handle_message)))
+    
+    logger.info("✅ Все обработчики добавлены")
+    
+    # Планировщик викторин настраивается в post_init (setup_scheduler)
+    application.job_queue.run_repeating(log_pipeline_stats, interval=PIPELINE_STATS_INTERVAL)
+    application.job_queue.run_repeating(expire_used_questions, interval=QUESTION_EXPIRY_INTERVAL)
+    return application
+
+def webhook_settings():
+    """Параметры run_webhook/start_webhook из config
+
+    Telegram принимает только https-адреса, поэтому без корректного
+    WEBHOOK_URL бот не запускается (ValueError).
+    """
+    from config import (
+        WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+        WEBHOOK_SECRET_TOKEN, WEBHOOK_MAX_CONNECTIONS,
+    )
+    
+    url = urlsplit(WEBHOOK_URL)
+    if url.scheme != "https" or not url.hostname:
+        raise ValueError(
+            f"RUN_MODE = \"webhook\" требует WEBHOOK_URL вида https://example.com в config.py "
+            f"(сейчас: {WEBHOOK_URL!r})"
+        )
+    
+    return {
+        "listen": WEBHOOK_LISTEN,
+        "port": WEBHOOK_PORT,
+        "url_path": WEBHOOK_PATH,
+        "webhook_url": f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+        # Telegram передает секрет в заголовке каждого запроса, чужие запросы отклоняются
+        "secret_token": WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32),
+        "max_connections": WEBHOOK_MAX_CONNECTIONS,
+        # chat_member приходит только по явному запросу (нужен кэшу администраторов)
+        "allowed_updates": Update.ALL_TYPES,
+    }
+
+def main():
+    """Основная функция"""
+    logger.info("🔄 Запуск основной функции...")
+    
+    try:
+        # Импортируем токен напрямую из config
+        from config import BOT_TOKEN, ANSWER_SIMILARITY, RUN_MODE
+        
+        if BOT_TOKEN == "ВАШ_ТОКЕН_ОТ_BOTFATHER":
+            logger.error("❌ ЗАМЕНИТЕ ТОКЕН В config.py на настоящий!")
+            input("Нажмите Enter чтобы выйти...")
+            return
+        
+        logger.info("✅ Токен загружен")
+        
+        # Ошибки настройки webhook видны сразу, до сборки приложения
+        run_settings = webhook_settings() if RUN_MODE == "webhook" else None
+        
+        application = build_application(BOT_TOKEN)
+        
+        # Запуск бота
+        logger.info(f"🎯 Бот запускается в режиме {RUN_MODE}...")
+        logger.info("⏰ Викторины идут по расписанию из settings.json (изменения применяются без перезапуска)")
+        logger.info("🧪 Для тестирования используйте /test_schedule")
+        logger.info("🔄 Для сброса статистики используйте /reset_stats (админы)")
+        logger.info("🏆 Доступны команды /profile и /achievements")
+        logger.info("🔇 Бот НЕ реагирует на неправильные ответы (убрали спам)")
+        logger.info(f"🤖 Включено fuzzy-сравнение ответов ({int(ANSWER_SIMILARITY * 100)}% совпадение)")
+        logger.info("Остановите бота комбинацией Ctrl+C")
+        
+        if RUN_MODE == "webhook":
+            application.run_webhook(**run_settings)
+        else:
+            # Используем run_polling вместо asyncio; chat_member нужно запросить явно
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
+        
+    except Exception as e:
+        logger.critical(f"💥 Критическая ошибка: {e}", exc_info=True)
+        input("Нажмите Enter чтобы выйти...")
+
+if __name__ == '__main__':
+    logger.info("📦 Запуск из main...")
+    main()
+    logger.info("👋 Бот завершил работу")
@@ -0,0 +1,321 @@
+import asyncio
+import logging
+import time
+import zlib
+from collections import Counter
+from datetime import timedelta
+
+from telegram.error import BadRequest, ChatMigrated, NetworkError, RetryAfter, TelegramError
+
+from chat_cache import is_chat_gone
+from metrics import registry
+from config import (
+    BROADCAST_CONCURRENCY,
+    BROADCAST_GLOBAL_RATE,
+    BROADCAST_PER_CHAT_INTERVAL,
+    BROADCAST_MAX_RETRIES,
+    BROADCAST_BACKOFF_BASE,
+    BROADCAST_JITTER_WINDOW,
+    BROADCAST_MAX_PENDING,
+    BROADCAST_MAX_FAILURES,
+)
+
+logger = logging.getLogger(__name__)
+
+# Категории ошибок отправки
+TRANSIENT = "transient"        # сеть, таймаут, разовая ошибка запроса
+RATE_LIMITED = "rate_limited"  # RetryAfter - превышены лимиты Telegram
+PERMANENT = "permanent"        # бот выгнан/заблокирован, чат удален или переехал
+INTERNAL = "internal"          # исключение не от Telegram: сбой подготовки текста или кода отправки
+
+
+def classify_error(error):
+    """Категория ошибки отправки: TRANSIENT, RATE_LIMITED или PERMANENT"""
+    if isinstance(error, RetryAfter):
+        return RATE_LIMITED
+    if isinstance(error, ChatMigrated) or is_chat_gone(error):
+        return PERMANENT
+    return TRANSIENT
+
+
+BROADCAST_SECONDS = registry.histogram(
+    "broadcast_duration_seconds", "Длительность рассылки целиком",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800),
+)
+BROADCAST_LAG_SECONDS = registry.histogram(
+    "broadcast_delivery_lag_seconds", "Задержка доставки относительно запланированного момента чата",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+BROADCAST_SENDS = registry.counter(
+    "broadcast_sends_total", "Отправки сообщений: sent, категория ошибки или skipped (чат отключен)", ["result"]
+)
+BROADCAST_QUEUE = registry.gauge("broadcast_queue_depth", "Сообщения рассылки, отправленные в работу и еще не доставленные")
+
+
+def percentile(sorted_values, p):
+    """Перцентиль p (0..100) по уже отсортированному списку"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class TokenBucket:
+    """Ограничитель скорости: не больше rate операций в секунду"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Останавливает выдачу токенов (например, по RetryAfter от Telegram)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        """Ждет, пока появится свободный токен"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class BroadcastReport:
+    """Итоги одной рассылки"""
+
+    def __init__(self, total, window=0.0):
+        self.total = total
+        self.window = window
+        self.sent = 0
+        self.failed = []
+        self.retries = 0
+        self.rate_limited = 0
+        self.errors = Counter()     # категория -> неудачных отправок
+        self.deactivated = []       # чаты, отключенные в этой рассылке
+        self.migrated = {}          # старый id группы -> id супергруппы
+        self.saved = 0              # чатов слота, отключенных раньше: отправок в них не было
+        self.latencies = []     # от запланированного момента чата до доставки
+        self.sent_at = []       # моменты доставки от начала рассылки
+        self.max_lag = 0.0      # насколько позже своего момента ушел самый отстающий чат
+        self.started = time.monotonic()
+        self.duration = 0.0
+
+    def peak_rate(self):
+        """Наибольшее число доставок за одну секунду рассылки"""
+        return max(Counter(int(moment) for moment in self.sent_at).values(), default=0)
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        return (
+            f"отправлено {self.sent}/{self.total} за {self.duration:.2f}с, "
+            f"ошибок {len(self.failed)} (постоянных {self.errors[PERMANENT]}, временных {self.errors[TRANSIENT]}, "
+            f"лимиты {self.errors[RATE_LIMITED]}, внутренних {self.errors[INTERNAL]}), "
+            f"повторов {self.retries}, RetryAfter {self.rate_limited}; "
+            f"отключено чатов {len(self.deactivated)}, сэкономлено отправок {self.saved}; "
+            f"задержка p50={percentile(latencies, 50):.2f}с "
+            f"p90={percentile(latencies, 90):.2f}с "
+            f"p99={percentile(latencies, 99):.2f}с; "
+            f"окно {self.window:.0f}с, пик {self.peak_rate()} сообщ./с, "
+            f"макс. отставание {self.max_lag:.2f}с"
+        )
+
+
+class Broadcaster:
+    """Параллельная рассылка с учетом лимитов Telegram
+
+    Отправки идут конкурентно (не больше max_concurrency одновременно),
+    общий поток ограничен токен-бакетом, в один чат - не чаще одного сообщения
+    в per_chat_interval секунд. RetryAfter приостанавливает всю рассылку на
+    указанное Telegram время, сетевые ошибки повторяются с экспоненциальной
+    задержкой.
+
+    Рассылку можно растянуть на окно window секунд: каждый чат получает
+    постоянное смещение внутри окна (crc32 от id), так что всплеск отправок
+    и ответов размазывается по окну. Если отправки не успевают и в очереди
+    уже max_pending сообщений, следующие чаты ждут, а не копятся.
+
+    Неудачные отправки считаются по чатам. Чат отключается от рассылок
+    (on_deactivate - например, удаление из активных чатов) сразу после
+    постоянной ошибки или после max_failures неудач подряд; отказы из-за
+    лимитов Telegram - не вина чата и в счетчик не идут.
+    """
+
+    def __init__(
+        self,
+        max_concurrency=BROADCAST_CONCURRENCY,
+        global_rate=BROADCAST_GLOBAL_RATE,
+        per_chat_interval=BROADCAST_PER_CHAT_INTERVAL,
+        max_retries=BROADCAST_MAX_RETRIES,
+        backoff_base=BROADCAST_BACKOFF_BASE,
+        max_pending=BROADCAST_MAX_PENDING,
+        max_failures=BROADCAST_MAX_FAILURES,
+        on_deactivate=None,
+    ):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.bucket = TokenBucket(global_rate)
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_pending = max_pending
+        self.max_failures = max_failures
+        self.on_deactivate = on_deactivate
+        self.failures = Counter()   # chat_id -> неудачных отправок подряд
+        self.deactivated = set()
+        self._chat_last_sent = {}
+
+    @staticmethod
+    def offset(chat_id, window):
+        """Постоянное смещение чата внутри окна рассылки"""
+        return zlib.crc32(str(chat_id).encode()) / 2 ** 32 * window
+
+    async def _wait_chat_slot(self, chat_id):
+        """Соблюдает интервал между сообщениями в один чат"""
+        last_sent = self._chat_last_sent.get(chat_id)
+        if last_sent is not None:
+            delay = last_sent + self.per_chat_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        self._chat_last_sent[chat_id] = time.monotonic()
+
+    async def send(self, bot, chat_id, text, report=None):
+        """Отправляет одно сообщение с повторами; True если доставлено"""
+        for attempt in range(self.max_retries + 1):
+            async with self.semaphore:
+                await self._wait_chat_slot(chat_id)
+                await self.bucket.acquire()
+                try:
+                    await bot.send_message(chat_id=chat_id, text=text)
+                    BROADCAST_SENDS.inc(result="sent")
+                    self.failures.pop(chat_id, None)
+                    self.deactivated.discard(chat_id)
+                    return True
+                except TelegramError as e:
+                    error = e
+                category = classify_error(error)
+                if category == RATE_LIMITED:
+                    retry_after = error.retry_after
+                    delay = retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+                    self.bucket.pause(delay)
+                    if report:
+                        report.rate_limited += 1
+                    logger.warning(f"⏳ RetryAfter для чата {chat_id}: пауза {delay:.1f}с")
+                elif category == PERMANENT:
+                    # Повтор не поможет: чат удален, бот заблокирован и т.п.
+                    logger.error(f"❌ Чат {chat_id} недоступен: {error}")
+                    if isinstance(error, ChatMigrated) and report:
+                        report.migrated[chat_id] = error.new_chat_id
+                    break
+                elif isinstance(error, NetworkError) and not isinstance(error, BadRequest):
+                    delay = self.backoff_base * 2 ** attempt
+                    logger.warning(f"⚠️ Сетевая ошибка для чата {chat_id}: {error}, повтор через {delay:.1f}с")
+                else:
+                    logger.error(f"❌ Ошибка отправки в чат {chat_id}: {error}")
+                    break
+
+            if attempt < self.max_retries:
+                if report:
+                    report.retries += 1
+                await asyncio.sleep(delay)
+
+        await self._failed(chat_id, category, report)
+        return False
+
+    async def _failed(self, chat_id, category, report):
+        """Учитывает неудачную отправку и при необходимости отключает чат"""
+        BROADCAST_SENDS.inc(result=category)
+        if report:
+            report.errors[category] += 1
+        if category == RATE_LIMITED:
+            return
+        self.failures[chat_id] += 1
+        if category == PERMANENT or self.failures[chat_id] >= self.max_failures:
+            await self.deactivate(chat_id, report)
+
+    async def deactivate(self, chat_id, report=None):
+        """Исключает чат из рассылок (например, бот выгнан из него)"""
+        self.failures.pop(chat_id, None)
+        self._chat_last_sent.pop(chat_id, None)
+        if chat_id not in self.deactivated:
+            self.deactivated.add(chat_id)
+            if report:
+                report.deactivated.append(chat_id)
+            logger.info(f"🚫 Чат {chat_id} отключен от рассылок")
+        # Вызывается и повторно: чат мог вернуться через /start после
+        # прошлого отключения (on_deactivate должен быть идемпотентным)
+        if self.on_deactivate:
+            await self.on_deactivate(chat_id)
+
+    def reactivate(self, chat_id):
+        """Чат снова подключен к рассылкам (например, /start после исключения)"""
+        self.deactivated.discard(chat_id)
+
+    async def broadcast(self, bot, messages, window=BROADCAST_JITTER_WINDOW, skipped=0):
+        """Рассылает {chat_id: текст} параллельно, возвращает BroadcastReport
+
+        Вместо текста можно передать async-функцию без аргументов: она
+        вызывается в момент отправки в чат (например, чтобы открыть вопрос
+        не раньше, чем его увидят).
+
+        skipped - сколько чатов этой рассылки вызывающий не включил, потому
+        что они отключены раньше (попадает в report.saved).
+        """
+        report = BroadcastReport(len(messages), window)
+        report.saved = skipped
+        if skipped:
+            BROADCAST_SENDS.inc(skipped, result="skipped")
+        pending = asyncio.Semaphore(self.max_pending)
+
+        async def deliver(chat_id, text, target):
+            try:
+                try:
+                    if callable(text):
+                        text = await text()
+                    delivered = await self.send(bot, chat_id, text, report)
+                except Exception as e:
+                    # Сбой одного чата не должен обрывать рассылку и терять отчет
+                    logger.exception(f"❌ Не удалось отправить сообщение в чат {chat_id}: {e}")
+                    BROADCAST_SENDS.inc(result=INTERNAL)
+                    report.errors[INTERNAL] += 1
+                    report.failed.append(chat_id)
+                    return
+                if delivered:
+                    now = time.monotonic()
+                    report.sent += 1
+                    report.latencies.append(now - target)
+                    report.sent_at.append(now - report.started)
+                    BROADCAST_LAG_SECONDS.observe(now - target)
+                else:
+                    report.failed.append(chat_id)
+            finally:
+                BROADCAST_QUEUE.dec()
+                pending.release()
+
+        schedule = sorted(((self.offset(chat_id, window), chat_id) for chat_id in messages), key=lambda item: item[0])
+        tasks = []
+        for offset, chat_id in schedule:
+            target = report.started + offset
+            delay = target - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # Отправки отстают - следующий чат ждет свободного места
+            await pending.acquire()
+            BROADCAST_QUEUE.inc()
+            report.max_lag = max(report.max_lag, time.monotonic() - target)
+            tasks.append(asyncio.create_task(deliver(chat_id, messages[chat_id], target)))
+
+        await asyncio.gather(*tasks)
+        report.duration = time.monotonic() - report.started
+        BROADCAST_SECONDS.observe(report.duration)
+        return report
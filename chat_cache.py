@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, TelegramError
+
+from config import CHAT_INFO_TTL, CHAT_RESOLVE_CONCURRENCY
+from metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Тексты BadRequest, после которых писать в чат уже бесполезно
+GONE_MESSAGES = ("chat not found", "bot was kicked", "bot is not a member", "user is deactivated", "peer_id_invalid")
+
+
+def is_chat_gone(error):
+    """True, если бот больше не может писать в чат (выгнан, заблокирован, чат удален)"""
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and any(text in error.message.lower() for text in GONE_MESSAGES)
+
+
+class ChatInfoCache:
+    """Название, тип и время последней активности чатов
+
+    Записи обновляются из каждого входящего обновления (observe), так что
+    для живых чатов get_chat обычно не нужен. Недостающие или устаревшие
+    (старше ttl) записи resolve запрашивает параллельно, не больше
+    concurrency запросов одновременно, и заодно сообщает, какие чаты
+    недоступны или переехали в супергруппу.
+    """
+
+    def __init__(self, ttl=CHAT_INFO_TTL, concurrency=CHAT_RESOLVE_CONCURRENCY):
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self._chats = {}  # chat_id -> {"title", "type", "last_seen", "updated"}
+        self.hits = 0
+        self.misses = 0
+
+    def observe(self, chat, seen=True):
+        """Запоминает чат; seen - чат прислал обновление только что"""
+        entry = self._chats.setdefault(chat.id, {"last_seen": None})
+        entry["title"] = chat.effective_name or f"Чат {chat.id}"
+        entry["type"] = chat.type
+        entry["updated"] = time.monotonic()
+        if seen:
+            entry["last_seen"] = time.time()
+
+    def get(self, chat_id):
+        entry = self._chats.get(chat_id)
+        if entry is None or time.monotonic() - entry["updated"] >= self.ttl:
+            return None
+        return entry
+
+    def forget(self, chat_id):
+        self._chats.pop(chat_id, None)
+
+    async def resolve(self, bot, chat_ids):
+        """Сведения о чатах: (chat_id -> запись, недоступные чаты, {старый id: новый id})
+
+        При временной ошибке Telegram остается прежняя запись (если была),
+        недоступным такой чат не считается.
+        """
+        gone = []
+        migrated = {}
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(chat_id):
+            async with semaphore:
+                try:
+                    chat = await bot.get_chat(chat_id)
+                except ChatMigrated as e:
+                    migrated[chat_id] = e.new_chat_id
+                    self.forget(chat_id)
+                except TelegramError as e:
+                    if is_chat_gone(e):
+                        gone.append(chat_id)
+                        self.forget(chat_id)
+                    else:
+                        logger.warning(f"⚠️ Не удалось получить сведения о чате {chat_id}: {e}")
+                else:
+                    self.observe(chat, seen=False)
+
+        missing = [chat_id for chat_id in chat_ids if self.get(chat_id) is None]
+        self.misses += len(missing)
+        self.hits += len(chat_ids) - len(missing)
+        CACHE_LOOKUPS.inc(len(missing), cache="chat_info", result="miss")
+        CACHE_LOOKUPS.inc(len(chat_ids) - len(missing), cache="chat_info", result="hit")
+        await asyncio.gather(*(fetch(chat_id) for chat_id in missing))
+
+        infos = {chat_id: self._chats[chat_id] for chat_id in chat_ids if chat_id in self._chats}
+        return infos, gone, migrated
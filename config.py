@@ -1,5 +1,98 @@
-BOT_TOKEN = "8420863274:AAFV5g5PX1bqipVrEc54IX1VMZMuo2fxxm4"
-DATA_PATH = "data"
-QUESTIONS_FILE = "data/questions.json"
-SETTINGS_FILE = "data/settings.json"
-USERS_FILE = "data/users.json"
\ No newline at end of file
+BOT_TOKEN = "8420863274:AAFV5g5PX1bqipVrEc54IX1VMZMuo2fxxm4"
+DATA_PATH = "data"
+QUESTIONS_FILE = "data/questions.json"
+SETTINGS_FILE = "data/settings.json"
+USERS_FILE = "data/users.json"
+
+# Через сколько секунд после изменения данные сбрасываются на диск
+WRITE_BEHIND_INTERVAL = 2.0
+
+# Журнал событий и как часто он сворачивается в снапшоты (число событий)
+JOURNAL_FILE = "data/journal.jsonl"
+JOURNAL_COMPACT_EVERY = 1000
+
+# Хранилище данных: "json" (снапшоты + журнал) или "sqlite"
+STORAGE_BACKEND = "json"
+DB_FILE = "data/quiz.db"
+
+# Рассылка викторин: одновременных отправок, сообщений в секунду всего
+# (лимит Telegram ~30/с), секунд между сообщениями в один чат,
+# повторов при сетевых ошибках и базовая задержка повтора
+BROADCAST_CONCURRENCY = 20
+BROADCAST_GLOBAL_RATE = 25
+BROADCAST_PER_CHAT_INTERVAL = 1.0
+BROADCAST_MAX_RETRIES = 3
+BROADCAST_BACKOFF_BASE = 1.0
+# Растянуть рассылку одного слота на N секунд (0 - всем сразу)
+BROADCAST_JITTER_WINDOW = 0
+# Сколько сообщений рассылки может ждать отправки одновременно
+BROADCAST_MAX_PENDING = 100
+# После скольких неудачных отправок подряд чат отключается от рассылок
+# (после постоянной ошибки - бот выгнан, чат удален - сразу)
+BROADCAST_MAX_FAILURES = 3
+
+# Потоков для дисковых операций QuizManager (вне event loop)
+QUIZ_IO_WORKERS = 4
+
+# Порог похожести ответа (0..1) для нечеткого сравнения
+ANSWER_SIMILARITY = 0.8
+
+# Как часто (секунд) выводить статистику стадий обработки сообщений
+PIPELINE_STATS_INTERVAL = 600
+
+# Не сохранять изменения профиля одного пользователя чаще, чем раз в N секунд (0 - сразу)
+USER_INFO_THROTTLE = 0
+
+# Сколько секунд хранить готовые ответы /leaderboard, /profile, /schedule и т.п.
+# (раньше они сбрасываются по событиям)
+RENDER_CACHE_TTL = 60
+# Сколько готовых ответов хранить максимум (самые старые вытесняются)
+RENDER_CACHE_MAX_ENTRIES = 10000
+
+# Как часто (секунд) возвращать в оборот вопросы старше reset_after_days
+QUESTION_EXPIRY_INTERVAL = 3600
+
+# Часовой пояс общего расписания викторин (чаты могут задать свой через /set_timezone)
+QUIZ_TIMEZONE = "Europe/Moscow"
+
+# Получение обновлений: "polling" (long polling) или "webhook" (встроенный HTTP-сервер)
+RUN_MODE = "polling"
+# Публичный адрес, на который Telegram будет слать обновления (https://example.com)
+WEBHOOK_URL = ""
+WEBHOOK_LISTEN = "0.0.0.0"
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = "telegram"
+# Секрет для заголовка X-Telegram-Bot-Api-Secret-Token (пусто - случайный при каждом запуске)
+WEBHOOK_SECRET_TOKEN = ""
+WEBHOOK_MAX_CONNECTIONS = 40
+
+# Параллельная обработка обновлений (порядок внутри одного чата сохраняется)
+# Сколько обработчиков выполняется одновременно
+CONCURRENT_UPDATES = 16
+# Сколько обновлений можно принять в обработку (выполняются + ждут своей очереди)
+UPDATE_QUEUE_LIMIT = 256
+# Кэш администраторов чатов для админских команд (секунды)
+ADMIN_CACHE_TTL = 600
+# После этого возраста запись еще отдается, но список обновляется в фоне
+ADMIN_CACHE_REFRESH_AFTER = 300
+
+# Сведения о чатах для /active_chats
+CHAT_INFO_TTL = 86400          # через сколько секунд перезапрашивать название чата
+CHAT_RESOLVE_CONCURRENCY = 10  # одновременных запросов get_chat
+ACTIVE_CHATS_PAGE_SIZE = 30    # чатов на одной странице /active_chats
+
+# Метрики в формате Prometheus: http://METRICS_HOST:METRICS_PORT/metrics (0 - сервер не запускать)
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 0
+# Файл, куда метрики сбрасываются раз в PIPELINE_STATS_INTERVAL (пусто - не писать)
+METRICS_FILE = ""
+# Профилировщик самых медленных обновлений (отчет - /slow на порту метрик и в статистике)
+PROFILER_ENABLED = False
+PROFILER_INTERVAL = 0.005  # период снятия стека, секунды
+PROFILER_KEEP = 10         # сколько самых медленных обновлений хранить
+
+# Логирование
+LOG_LEVEL = "INFO"              # DEBUG - подробности по каждому сообщению
+LOG_LEVELS = {"httpx": "WARNING", "apscheduler": "WARNING"}  # уровни отдельных логгеров
+LOG_FORMAT = "text"             # "text" или "json" (одна запись - одна строка JSON)
+LOG_SAMPLE_EVERY = 100          # из отладочных строк по каждому сообщению выводится каждая N-я
@@ -0,0 +1,154 @@
+import argparse
+import logging
+import csv
+import hashlib
+import json
+import math
+import os
+import re
+import time
+from collections import Counter
+from itertools import islice
+
+from answer_matcher import normalize
+from quiz_manager import QuizManager
+
+BATCH_SIZE = 1000
+PROGRESS_EVERY = 100000
+
+# Все, кроме букв, цифр и перевода строки (им разделены вопросы пачки)
+NON_WORD_RE = re.compile(r"[^\w\n]+")
+
+def question_keys(texts):
+    """Хэши (8 байт) нормализованных текстов вопросов для поиска дублей
+
+    Регистр, ё и пунктуация обрабатываются одним проходом по всей пачке,
+    а не отдельным вызовом на каждый вопрос. Пробелы и переводы строк
+    внутри текста схлопываются до разбивки, поэтому многострочный вопрос
+    из банка дает тот же хэш, что и его импортируемая копия.
+    """
+    texts = (" ".join(text.split()) for text in texts)
+    joined = NON_WORD_RE.sub(" ", "\n".join(texts).lower().replace("ё", "е"))
+    return [
+        hashlib.blake2b(" ".join(line.split()).encode('utf-8'), digest_size=8).digest()
+        for line in joined.split("\n")
+    ]
+
+def read_rows(path, fmt):
+    """Построчно читает CSV (колонки question, answer, alternatives) или JSONL"""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if fmt == "csv":
+            for row in csv.DictReader(f):
+                # Варианты ответа в CSV разделяются вертикальной чертой
+                row["alternatives"] = [alt for alt in (row.get("alternatives") or "").split("|") if alt.strip()]
+                yield row
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                yield None
+
+def clean_batch(rows, seen, stats):
+    """Проверяет и нормализует пачку строк, отбрасывая битые и повторы"""
+    valid = []
+    for row in rows:
+        if not isinstance(row, dict):
+            stats["invalid"] += 1
+            continue
+        text = " ".join(str(row.get("question") or "").split())
+        # Ответ храним в том же виде, что и в questions.json: строчными буквами
+        answer = " ".join(str(row.get("answer") or "").lower().split())
+        normalized_answer = normalize(answer)
+        if not text or not normalized_answer:
+            stats["invalid"] += 1
+            continue
+        valid.append((row, text, answer, normalized_answer))
+
+    questions = []
+    keys = question_keys([text for _, text, _, _ in valid])
+    for (row, text, answer, normalized_answer), key in zip(valid, keys):
+        if key in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(key)
+
+        question = {"question": text, "answer": answer}
+        forms = {normalized_answer}
+        alternatives = []
+        for alt in row.get("alternatives") or []:
+            alt = " ".join(str(alt).lower().split())
+            form = normalize(alt)
+            if form and form not in forms:
+                forms.add(form)
+                alternatives.append(alt)
+        if alternatives:
+            question["alternatives"] = alternatives
+        questions.append(question)
+    return questions
+
+def import_questions(path, fmt=None, batch_size=BATCH_SIZE, dry_run=False):
+    """Потоковый импорт вопросов из CSV/JSONL в хранилище QuizManager
+
+    Файл читается пачками по batch_size строк; каждая пачка проверяется,
+    очищается от дублей (по хэшу нормализованного текста вопроса, в том
+    числе против уже имеющихся вопросов) и записывается одним событием -
+    одной транзакцией SQLite или одной строкой журнала с одним fsync.
+    Журнал сворачивается в снапшот один раз, при закрытии (вопросы пишутся
+    в questions.json потоком), а не каждые JOURNAL_COMPACT_EVERY пачек.
+    Бот на время импорта должен быть остановлен.
+    """
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    manager = QuizManager(compact_every=math.inf)
+
+    # В памяти держим только 8-байтовые хэши, а не сами вопросы
+    seen = set()
+    questions = iter(manager.questions_snapshot())
+    while True:
+        texts = [question["question"] for question in islice(questions, BATCH_SIZE)]
+        if not texts:
+            break
+        seen.update(question_keys(texts))
+    print(f"📚 В банке уже {len(seen)} вопросов")
+
+    stats = Counter()
+    started = time.monotonic()
+    rows = read_rows(path, fmt)
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            stats["read"] += len(batch)
+            questions = clean_batch(batch, seen, stats)
+            if questions and not dry_run:
+                manager.add_questions(questions)
+                manager.flush()
+            stats["imported"] += len(questions)
+
+            if stats["read"] // PROGRESS_EVERY != (stats["read"] - len(batch)) // PROGRESS_EVERY:
+                elapsed = time.monotonic() - started
+                print(f"⏳ Прочитано {stats['read']} строк ({stats['read'] / elapsed:.0f} строк/с)")
+    finally:
+        manager.close()
+
+    elapsed = max(time.monotonic() - started, 1e-9)
+    action = "Проверено" if dry_run else "Импортировано"
+    print(f"✅ {action} {stats['imported']} из {stats['read']} строк за {elapsed:.1f}с "
+          f"({stats['read'] / elapsed:.0f} строк/с): дублей {stats['duplicates']}, ошибок {stats['invalid']}")
+    return stats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Массовый импорт вопросов из CSV/JSONL")
+    parser.add_argument("file", help="файл с вопросами (.csv или .jsonl)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="формат файла (по умолчанию - по расширению)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="строк в одной транзакции")
+    parser.add_argument("--dry-run", action="store_true", help="только проверить файл, ничего не записывать")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if not os.path.exists(args.file):
+        print(f"❌ Файл {args.file} не найден")
+    else:
+        import_questions(args.file, args.format, args.batch_size, args.dry_run)
@@ -0,0 +1,326 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import secrets
+import shutil
+import sys
+import tempfile
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+from broadcaster import percentile
+
+TOKEN = "123456:HARNESS"
+ADMIN_ID = 1
+BOT_USER = {"id": 42, "is_bot": True, "first_name": "Karas", "username": "karas_quiz_bot",
+            "can_join_groups": True, "can_read_all_group_messages": True, "supports_inline_queries": False}
+
+
+async def read_http_message(reader):
+    """Читает HTTP/1.1 запрос или ответ: (первая строка, заголовки, тело); None - соединение закрыто"""
+    first_line = await reader.readline()
+    if not first_line:
+        return None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return first_line.decode("latin-1").strip(), headers, body
+
+
+def parse_parameters(headers, body):
+    """Параметры запроса к Bot API: JSON или форма (значения-объекты в форме закодированы JSON)"""
+    if not body:
+        return {}
+    if headers.get("content-type", "").startswith("application/json"):
+        return json.loads(body)
+    params = {}
+    for name, value in parse_qsl(body.decode("utf-8")):
+        try:
+            params[name] = json.loads(value)
+        except ValueError:
+            params[name] = value
+    return params
+
+
+class FakeTelegram:
+    """Минимальный сервер Bot API на asyncio для нагрузочных замеров
+
+    Отвечает на методы, которые вызывает бот (getMe, getUpdates,
+    sendMessage, getChatAdministrators, setWebhook...), раздает
+    обновления через long polling и сообщает о каждом ответе бота
+    в on_reply(chat_id, текст, message_id исходного сообщения).
+    """
+
+    def __init__(self, on_reply):
+        self.on_reply = on_reply
+        self.pending = []          # обновления для getUpdates
+        self.new_updates = asyncio.Event()
+        self.webhook = None        # (url, secret_token) после setWebhook
+        self.message_id = 0
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self._serve, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def push_update(self, update):
+        self.pending.append(update)
+        self.new_updates.set()
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                request = await read_http_message(reader)
+                if request is None:
+                    break
+                request_line, headers, body = request
+                method = urlsplit(request_line.split()[1]).path.rsplit("/", 1)[-1]
+                result = await self.call(method, parse_parameters(headers, body))
+                payload = json.dumps({"ok": True, "result": result}, ensure_ascii=False).encode("utf-8")
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(payload)).encode() + b"\r\n\r\n" + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Незавершенный long polling при остановке сервера
+            pass
+        finally:
+            writer.close()
+
+    async def call(self, method, params):
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return await self._get_updates(int(params.get("offset") or 0), float(params.get("timeout") or 0))
+        if method == "setWebhook":
+            self.webhook = (params["url"], params.get("secret_token"))
+            return True
+        if method == "sendMessage":
+            self.message_id += 1
+            reply_to = (params.get("reply_parameters") or {}).get("message_id") or params.get("reply_to_message_id")
+            self.on_reply(int(params["chat_id"]), str(params.get("text", "")), reply_to)
+            return {"message_id": self.message_id, "date": int(time.time()), "from": BOT_USER,
+                    "chat": self.chat(params["chat_id"]), "text": str(params.get("text", ""))}
+        if method == "getChatAdministrators":
+            return [{"status": "creator", "is_anonymous": False,
+                     "user": {"id": ADMIN_ID, "is_bot": False, "first_name": "Admin"}}]
+        if method == "getChat":
+            return {**self.chat(params["chat_id"]), "accent_color_id": 0, "max_reaction_count": 11,
+                    "accepted_gift_types": {"unlimited_gifts": False, "limited_gifts": False,
+                                            "unique_gifts": False, "premium_subscription": False}}
+        return True
+
+    async def _get_updates(self, offset, timeout):
+        self.pending = [update for update in self.pending if update["update_id"] >= offset]
+        if not self.pending and timeout:
+            self.new_updates.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self.new_updates.wait(), timeout)
+        return self.pending[:100]
+
+    @staticmethod
+    def chat(chat_id):
+        return {"id": int(chat_id), "type": "group", "title": f"Chat {chat_id}"}
+
+
+class WebhookSender:
+    """Отправляет обновления на webhook бота по нескольким keep-alive соединениям"""
+
+    def __init__(self, url, secret_token, connections):
+        self.url = urlsplit(url)
+        self.secret_token = secret_token
+        self.connections = connections
+        self.queue = asyncio.Queue()
+        self.workers = []
+
+    async def start(self):
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.connections)]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+    def push_update(self, update):
+        self.queue.put_nowait(update)
+
+    async def _worker(self):
+        reader, writer = await asyncio.open_connection(self.url.hostname, self.url.port)
+        try:
+            while True:
+                update = await self.queue.get()
+                body = json.dumps(update, ensure_ascii=False).encode("utf-8")
+                writer.write(
+                    f"POST {self.url.path} HTTP/1.1\r\nHost: {self.url.netloc}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                    f"X-Telegram-Bot-Api-Secret-Token: {self.secret_token}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+                status_line, _, _ = await read_http_message(reader)
+                if " 200 " not in f"{status_line} ":
+                    print(f"⚠️ Webhook ответил: {status_line}")
+        finally:
+            writer.close()
+
+
+class LoadRun:
+    """Один замер: викторина в N чатах, затем пачка ответов во все чаты сразу"""
+
+    def __init__(self, chats, answers_per_chat, first_chat_id):
+        self.chat_ids = [first_chat_id - i for i in range(chats)]
+        self.answers_per_chat = answers_per_chat
+        self.update_id = 0
+        self.message_id = 0
+        self.sent_at = {}           # message_id -> время отправки обновления
+        self.latencies = []
+        self.quiz_started = set()
+        self.all_replied = asyncio.Event()
+        self.quizzes_ready = asyncio.Event()
+        self.expected = 0
+
+    def make_update(self, chat_id, user_id, text):
+        self.update_id += 1
+        self.message_id += 1
+        message = {
+            "message_id": self.message_id, "date": int(time.time()), "text": text,
+            "chat": FakeTelegram.chat(chat_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"Player{user_id}", "username": f"player{user_id}"},
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": self.update_id, "message": message}
+
+    def on_reply(self, chat_id, text, reply_to):
+        now = time.monotonic()
+        if "ВИКТОРИНА" in text and chat_id in self.chat_ids:
+            self.quiz_started.add(chat_id)
+            if len(self.quiz_started) == len(self.chat_ids):
+                self.quizzes_ready.set()
+        sent_at = self.sent_at.pop(reply_to, None)
+        if sent_at is not None:
+            self.latencies.append(now - sent_at)
+            if len(self.latencies) == self.expected:
+                self.all_replied.set()
+
+    async def run(self, transport, manager, timeout):
+        # Админ запускает викторину в каждом чате
+        for chat_id in self.chat_ids:
+            transport.push_update(self.make_update(chat_id, ADMIN_ID, "/quiz"))
+        await asyncio.wait_for(self.quizzes_ready.wait(), timeout)
+
+        # Все игроки отвечают правильно: первый получает очко, остальные - "опоздал",
+        # так что на каждое сообщение бот отвечает ровно одним сообщением
+        updates = []
+        for player in range(self.answers_per_chat):
+            for chat_id in self.chat_ids:
+                answer = manager.get_current_question(chat_id)["answer"]
+                updates.append(self.make_update(chat_id, 1000 + player, f"- {answer}"))
+        self.expected = len(updates)
+
+        started = time.monotonic()
+        for update in updates:
+            self.sent_at[update["message"]["message_id"]] = time.monotonic()
+            transport.push_update(update)
+        await asyncio.wait_for(self.all_replied.wait(), timeout)
+        duration = time.monotonic() - started
+
+        latencies = sorted(self.latencies)
+        return {
+            "updates": self.expected,
+            "duration": duration,
+            "rate": self.expected / duration,
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p99": percentile(latencies, 99),
+        }
+
+
+async def measure(bot, mode, args, first_chat_id):
+    run = LoadRun(args.chats, args.answers, first_chat_id)
+    api = FakeTelegram(run.on_reply)
+    api_port = await api.start()
+    application = bot.build_application(
+        TOKEN, base_url=f"http://127.0.0.1:{api_port}/bot", concurrent_updates=args.concurrency
+    )
+    await application.initialize()
+    await application.start()
+
+    sender = None
+    if mode == "webhook":
+        secret_token = secrets.token_urlsafe(16)
+        await application.updater.start_webhook(
+            listen="127.0.0.1", port=args.webhook_port, url_path="telegram",
+            webhook_url=f"http://127.0.0.1:{args.webhook_port}/telegram",
+            secret_token=secret_token, max_connections=args.connections,
+        )
+        sender = WebhookSender(*api.webhook, args.connections)
+        await sender.start()
+        transport = sender
+    else:
+        await application.updater.start_polling(poll_interval=0, timeout=10)
+        transport = api
+
+    try:
+        return await run.run(transport, bot.quiz_manager.manager, args.timeout)
+    finally:
+        if sender:
+            await sender.stop()
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        await api.stop()
+
+
+async def main(args):
+    # Бот работает на копии data/, чтобы замер не трогал настоящие очки и вопросы
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    workdir = tempfile.mkdtemp(prefix="karas-harness-")
+    shutil.copytree(os.path.join(repo_dir, "data"), os.path.join(workdir, "data"))
+    os.chdir(workdir)
+    sys.path.insert(0, repo_dir)
+
+    results = {}
+    devnull = open(os.devnull, "w", encoding="utf-8")
+    try:
+        with contextlib.redirect_stdout(devnull):
+            import bot
+            # Логи бота идут в stderr через QueueListener - оставляем только предупреждения
+            logging.getLogger().setLevel(logging.WARNING)
+        for index, mode in enumerate(args.modes):
+            with contextlib.redirect_stdout(devnull):
+                results[mode] = await measure(bot, mode, args, first_chat_id=-(index + 1) * 1_000_000)
+            r = results[mode]
+            print(f"📊 {mode}: {r['updates']} ответов за {r['duration']:.2f}с = {r['rate']:.0f} обновл./с; "
+                  f"задержка ответа p50={r['p50'] * 1000:.1f}мс p90={r['p90'] * 1000:.1f}мс p99={r['p99'] * 1000:.1f}мс")
+        with contextlib.redirect_stdout(devnull):
+            await bot.quiz_manager.close()
+    finally:
+        devnull.close()
+        os.chdir(repo_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Замер задержки ответов и обновлений/с: polling против webhook")
+    parser.add_argument("--modes", nargs="+", choices=["polling", "webhook"], default=["polling", "webhook"])
+    parser.add_argument("--chats", type=int, default=50, help="чатов с викториной")
+    parser.add_argument("--answers", type=int, default=20, help="ответов в каждый чат")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent_updates приложения")
+    parser.add_argument("--connections", type=int, default=40, help="соединений к webhook (max_connections)")
+    parser.add_argument("--webhook-port", type=int, default=8787)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,98 @@
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+
+from config import LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_SAMPLE_EVERY
+
+LOG_LINE_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Атрибуты, которые есть у любой LogRecord; остальное - поля, переданные через extra=
+STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sampled"}
+
+
+def record_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in STANDARD_ATTRS}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Строка лога с полями из extra= (ключ=значение) или одна строка JSON на запись"""
+
+    def __init__(self, json_lines=False):
+        super().__init__(LOG_LINE_FORMAT)
+        self.json_lines = json_lines
+
+    def format(self, record):
+        fields = record_fields(record)
+        if self.json_lines:
+            payload = {
+                "time": self.formatTime(record),
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+                **fields,
+            }
+            if record.exc_info:
+                payload["exception"] = self.formatException(record.exc_info)
+            return json.dumps(payload, ensure_ascii=False, default=str)
+
+        text = super().format(record)
+        if fields:
+            text += " | " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+
+class SampleFilter(logging.Filter):
+    """Пропускает только каждую every-ю запись с extra={"sampled": True}
+
+    Так помечаются отладочные строки, которые пишутся на каждое сообщение
+    чата: при уровне DEBUG видна выборка, а не весь поток.
+    """
+
+    def __init__(self, every=LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.every = max(1, every)
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        if not getattr(record, "sampled", False):
+            return True
+        return next(self._counter) % self.every == 0
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не форматирует запись в вызывающем потоке
+
+    Стандартный prepare() склеивает сообщение с аргументами прямо в event
+    loop; здесь запись уходит в очередь как есть, и форматирует ее поток
+    QueueListener. Аргументы логов - строки и числа, их не меняют после
+    вызова, поэтому откладывать форматирование безопасно.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level=LOG_LEVEL, levels=LOG_LEVELS, fmt=LOG_FORMAT):
+    """Настраивает логирование: запись через очередь в отдельном потоке
+
+    Корневой логгер получает только DeferredQueueHandler (с выборкой
+    отладочных строк), вывод в stderr делает QueueListener. Возвращает
+    запущенный QueueListener; он останавливается при выходе из процесса.
+    """
+    output = logging.StreamHandler()
+    output.setFormatter(StructuredFormatter(json_lines=fmt == "json"))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SampleFilter())
+    logging.basicConfig(level=level, handlers=[queue_handler], force=True)
+    for name, logger_level in levels.items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    listener = logging.handlers.QueueListener(log_queue, output)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,48 @@
+import argparse
+import logging
+import os
+
+from config import DB_FILE
+from quiz_manager import QuizManager
+from storage import JournalStorage, SqliteStorage
+
+def migrate(db_file, force=False):
+    """Переносит data/*.json (вместе с незавернутым журналом) в SQLite"""
+    if os.path.exists(db_file) and not force:
+        print(f"❌ {db_file} уже существует. Используйте --force для перезаписи")
+        return False
+    
+    print("📂 Читаю JSON-данные...")
+    # QuizManager поверх JSON-хранилища сам проиграет незавернутый журнал
+    source = QuizManager(storage=JournalStorage())
+    
+    # --force: база создается заново, иначе старые answers и question_usage
+    # смешались бы с новым снапшотом
+    for path in (db_file, f"{db_file}-wal", f"{db_file}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    target = SqliteStorage(db_file)
+    with source._lock:
+        questions = source.pool.snapshot()
+        snapshot = target.serialize_snapshot({
+            "users": source.users_data,
+            "questions": questions,
+            "settings": source.settings,
+            "seq": 0,
+        })
+    source.close()
+    target.write_snapshot(snapshot)
+    target.close()
+    
+    print(f"✅ Перенесено: {len(snapshot['users'])} пользователей, "
+          f"{len(questions)} вопросов, {len(snapshot['chats'])} чатов")
+    print("💡 Включите STORAGE_BACKEND = \"sqlite\" в config.py")
+    return True
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Миграция data/*.json в SQLite")
+    parser.add_argument("--db", default=DB_FILE, help="путь к файлу базы")
+    parser.add_argument("--force", action="store_true", help="перезаписать существующую базу")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    migrate(args.db, args.force)
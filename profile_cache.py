@@ -0,0 +1,39 @@
+import time
+
+from config import USER_INFO_THROTTLE
+
+
+class UserProfileCache:
+    """Кэш профилей пользователей для save_user_info
+
+    Хранит последние сохраненные username/first_name по id пользователя.
+    Запись нужна только если данные из Telegram отличаются от сохраненных,
+    и не чаще одного раза в throttle секунд на пользователя (0 - без
+    ограничения). Изменение, пришедшее во время паузы, сохранится при
+    следующем обращении после нее.
+    """
+
+    def __init__(self, is_current=None, throttle=USER_INFO_THROTTLE):
+        self.throttle = throttle
+        self._is_current = is_current
+        self._profiles = {}  # user_id -> (username, first_name, время записи)
+
+    def needs_save(self, user_id, username, first_name):
+        """True, если профиль изменился и его пора сохранить"""
+        username = username or ""
+        first_name = first_name or ""
+        cached = self._profiles.get(user_id)
+
+        if cached is None:
+            # Первая встреча после запуска: сверяемся с данными QuizManager
+            if self._is_current and self._is_current(user_id, username, first_name):
+                self._profiles[user_id] = (username, first_name, 0.0)
+                return False
+            return True
+
+        if cached[0] == username and cached[1] == first_name:
+            return False
+        return time.monotonic() - cached[2] >= self.throttle
+
+    def mark_saved(self, user_id, username, first_name):
+        self._profiles[user_id] = (username or "", first_name or "", time.monotonic())
@@ -0,0 +1,113 @@
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from config import PROFILER_INTERVAL, PROFILER_KEEP
+
+MAX_STACK_DEPTH = 12
+
+
+def describe_update(update):
+    """Короткое описание обновления без текста сообщения: (чат, вид)"""
+    chat = getattr(update, "effective_chat", None)
+    message = getattr(update, "effective_message", None)
+    text = getattr(message, "text", None) or ""
+    if text.startswith("/"):
+        kind = text.split()[0].split("@")[0]
+    elif message is not None:
+        kind = "message"
+    else:
+        kind = type(update).__name__
+    return (chat.id if chat else None), kind
+
+
+class SlowUpdateProfiler:
+    """Выборочный профилировщик самых медленных обновлений
+
+    Фоновый поток раз в interval секунд снимает стек потока event loop.
+    Пока обновление обрабатывается, кадр его корутины зарегистрирован
+    (begin/end), и снимок стека, в котором этот кадр есть, засчитывается
+    этому обновлению - так параллельные обновления не смешиваются. Время
+    ожидания сети в снимки не попадает: видно, где тратится процессор.
+
+    Хранятся keep самых долгих обновлений с самыми частыми стеками.
+    Профилировщик включается настройкой PROFILER_ENABLED.
+    """
+
+    def __init__(self, interval=PROFILER_INTERVAL, keep=PROFILER_KEEP):
+        self.interval = interval
+        self.keep = keep
+        self._active = {}     # id(кадр корутины) -> запись обновления
+        self._slowest = []    # min-куча (длительность, номер, запись)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._target = None
+        self.samples = 0
+
+    def start(self):
+        """Запускает снятие стеков текущего потока (потока event loop)"""
+        if self._thread is not None:
+            return
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._sample_loop, name="update-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def begin(self, frame, update):
+        chat, kind = describe_update(update)
+        record = {"chat": chat, "kind": kind, "started": time.perf_counter(), "samples": Counter()}
+        self._active[id(frame)] = record
+        return frame
+
+    def end(self, frame):
+        record = self._active.pop(id(frame), None)
+        if record is None:
+            return
+        record["duration"] = time.perf_counter() - record["started"]
+        with self._lock:
+            item = (record["duration"], next(self._counter), record)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, item)
+            elif item[0] > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, item)
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                record = self._active.get(id(frame))
+                if record is not None:
+                    # Стек от корутины обновления до текущей строки, внешние вызовы выше
+                    record["samples"][tuple(reversed(stack[:MAX_STACK_DEPTH]))] += 1
+                    self.samples += 1
+                    break
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+
+    def slowest(self):
+        with self._lock:
+            return [record for _, _, record in sorted(self._slowest, reverse=True)]
+
+    def report(self, limit=None, stacks=3):
+        """Текстовый отчет: самые медленные обновления и их самые частые стеки"""
+        lines = [f"Самые медленные обновления (снимков стека: {self.samples}, период {self.interval * 1000:.0f}мс)"]
+        for record in self.slowest()[:limit]:
+            lines.append(f"{record['duration'] * 1000:.1f}мс  {record['kind']}  чат {record['chat']}  "
+                         f"снимков {sum(record['samples'].values())}")
+            for stack, count in record["samples"].most_common(stacks):
+                # Ближайшие к текущей строке вызовы - самые полезные
+                lines.append(f"    {count} × " + " → ".join(stack[-4:]))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,318 @@
+import heapq
+import json
+import mmap
+import random
+import tempfile
+from array import array
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+NO_DATE = -1
+# Элемент кучи сроков - одно число: дата (мкс) в старших битах, слот в младших
+SLOT_BITS = 32
+SLOT_MASK = (1 << SLOT_BITS) - 1
+
+
+def date_to_micros(value):
+    """ISO-дата использования -> микросекунды от эпохи (NO_DATE, если даты нет)"""
+    if not value:
+        return NO_DATE
+    try:
+        return (datetime.fromisoformat(value) - EPOCH) // timedelta(microseconds=1)
+    except (TypeError, ValueError):
+        return NO_DATE
+
+
+def question_id(value):
+    """id вопроса как int; строка из цифр допускается (файл правили вручную)"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    raise ValueError(f"Некорректный id вопроса: {value!r}")
+
+
+def micros_to_date(value):
+    if value == NO_DATE:
+        return None
+    return (EPOCH + timedelta(microseconds=value)).isoformat()
+
+
+class TextStore:
+    """Тексты вопросов во временном файле, отображенном в память (mmap)
+
+    Каждая запись - JSON вопроса без id и служебных полей. В памяти только
+    смещения начала и конца записи, текст декодируется при обращении.
+    Замена записи дописывает новую версию в конец файла.
+    """
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile(prefix="questions-")
+        self._starts = array('q')
+        self._ends = array('q')
+        self._size = 0
+        self._map = None
+
+    def put(self, index, record):
+        payload = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+        self._file.write(payload)
+        if index == len(self._starts):
+            self._starts.append(self._size)
+            self._ends.append(self._size + len(payload))
+        else:
+            self._starts[index] = self._size
+            self._ends[index] = self._size + len(payload)
+        self._size += len(payload)
+
+    def get(self, index):
+        end = self._ends[index]
+        if self._map is None or end > len(self._map):
+            # Отображение фиксированного размера - после дозаписи создаем заново
+            self._file.flush()
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return json.loads(self._map[self._starts[index]:end])
+
+    def view(self):
+        """Копия индекса записей с собственным отображением файла
+
+        Файл только дописывается, поэтому записи по скопированным смещениям
+        не меняются, и копию можно читать из другого потока без блокировки.
+        """
+        self._file.flush()
+        return TextView(self._file.fileno(), self._size, array('q', self._starts), array('q', self._ends))
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+class TextView:
+    """Неизменяемая копия TextStore (см. TextStore.view)"""
+
+    def __init__(self, fileno, size, starts, ends):
+        # mmap держит свою копию дескриптора - переживает закрытие TextStore
+        self._map = mmap.mmap(fileno, size, access=mmap.ACCESS_READ) if size else None
+        self._starts = starts
+        self._ends = ends
+
+    def get(self, index):
+        return json.loads(self._map[self._starts[index]:self._ends[index]])
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class PoolSnapshot:
+    """Банк вопросов на момент QuestionPool.snapshot() для записи снапшота
+
+    Под блокировкой копируются только плоские массивы (id, позиции, даты,
+    смещения текстов). Вопросы собираются по одному при итерации, уже без
+    блокировки, поэтому снапшот пишется потоком, а не списком всего банка.
+    Итерировать можно один раз: после нее отображение файла закрывается.
+    """
+
+    def __init__(self, pool):
+        self.ids = array('q', pool.ids)
+        self.positions = array('q', pool.positions)
+        self.used_at = array('q', pool.used_at)
+        self.unused_count = pool.unused_count
+        self._texts = pool.texts.view()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        """Вопросы в формате questions.json"""
+        try:
+            for slot, qid in enumerate(self.ids):
+                used = self.positions[slot] >= self.unused_count
+                yield {
+                    "id": qid,
+                    **self._texts.get(slot),
+                    "used": used,
+                    "used_date": micros_to_date(self.used_at[slot]) if used else None,
+                }
+        finally:
+            self._texts.close()
+
+
+class QuestionPool:
+    """Индекс банка вопросов с выбором случайного неиспользованного за O(1)
+
+    Каждому вопросу при добавлении выделяется слот - номер в массивах.
+    Все слоты лежат в одном массиве order: первые unused_count элементов -
+    неиспользованные вопросы, остальные - использованные. Пометка вопроса
+    делается обменом с границей (swap-remove), поэтому выбор, пометка и
+    полный сброс не зависят от размера банка.
+
+    Даты использования дополнительно лежат в min-куче, поэтому истекшие
+    вопросы достаются за время, пропорциональное их числу. Записи в куче
+    не удаляются при снятии пометки - устаревшие отбрасываются при
+    извлечении (дата или статус слота уже не совпадают).
+
+    Состояние хранится в плоских массивах (id, позиции, даты использования
+    в микросекундах), а тексты - в TextStore. Слот ищется по id через
+    словарь: id из файла могут быть любыми целыми, не обязательно подряд.
+    Вместе с этим словарем на вопрос в памяти приходится около 150 байт
+    независимо от длины текста. Словарь вопроса собирается только для
+    вопроса, который действительно нужен.
+    """
+
+    def __init__(self, questions=()):
+        self.texts = TextStore()
+        self.ids = array('q')           # слот -> id
+        self.slots = {}                 # id -> слот
+        self.order = array('q')         # слоты, неиспользованные в начале
+        self.positions = array('q')     # слот -> индекс в order
+        self.used_at = array('q')       # слот -> дата использования (мкс), читается только у использованных
+        self.expiry = []                # куча (дата << SLOT_BITS) | слот
+        self.unused_count = 0
+        self.max_id = 0
+        for question in questions:
+            self.add(question)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, qid):
+        return self._slot(qid) is not None
+
+    def _slot(self, qid):
+        return self.slots.get(qid)
+
+    def add(self, question):
+        """Добавляет вопрос в банк (флаг used учитывается)
+
+        ValueError, если id вопроса - не целое число.
+        """
+        qid = question_id(question["id"])
+        record = {k: v for k, v in question.items() if k not in ("id", "used", "used_date")}
+        slot = self._slot(qid)
+        if slot is not None:
+            self.texts.put(slot, record)
+            return
+
+        slot = len(self.ids)
+        self.texts.put(slot, record)
+        self.ids.append(qid)
+        self.slots[qid] = slot
+        self.max_id = max(self.max_id, qid)
+        self.used_at.append(NO_DATE)
+        self.order.append(slot)
+        self.positions.append(len(self.order) - 1)
+        # Новый слот встает в конец, затем переносится в неиспользованные
+        self._swap(slot, self.unused_count)
+        self.unused_count += 1
+        if question.get("used"):
+            self.mark_used(qid, question.get("used_date"))
+
+    def _question(self, slot):
+        return {"id": self.ids[slot], **self.texts.get(slot)}
+
+    def get(self, qid):
+        slot = self._slot(qid)
+        return None if slot is None else self._question(slot)
+
+    def is_used(self, qid):
+        return self.positions[self._slot(qid)] >= self.unused_count
+
+    def _swap(self, slot, index):
+        """Ставит слот на позицию index в order"""
+        current = self.positions[slot]
+        other = self.order[index]
+        self.order[index], self.order[current] = slot, other
+        self.positions[slot] = index
+        self.positions[other] = current
+
+    def draw(self):
+        """Случайный неиспользованный вопрос или None"""
+        if not self.unused_count:
+            return None
+        return self._question(self.order[random.randrange(self.unused_count)])
+
+    def mark_used(self, qid, used_date):
+        slot = self._slot(qid)
+        if slot is None:
+            return False
+        if self.positions[slot] < self.unused_count:
+            self.unused_count -= 1
+            self._swap(slot, self.unused_count)
+        self.used_at[slot] = date_to_micros(used_date)
+        if self.used_at[slot] != NO_DATE:
+            heapq.heappush(self.expiry, (self.used_at[slot] << SLOT_BITS) | slot)
+            self._compact_expiry()
+        return True
+
+    def mark_unused(self, qid):
+        slot = self._slot(qid)
+        if slot is None or self.positions[slot] < self.unused_count:
+            return False
+        self._swap(slot, self.unused_count)
+        self.unused_count += 1
+        return True
+
+    def reset_all(self):
+        """Все вопросы снова неиспользованные (старые даты просто перестают читаться)"""
+        self.unused_count = len(self.order)
+        self.expiry = []
+
+    def _compact_expiry(self):
+        """Пересобирает кучу, если устаревших записей стало больше живых"""
+        if len(self.expiry) <= 2 * (len(self.order) - self.unused_count) + 1024:
+            return
+        self.expiry = [
+            (self.used_at[slot] << SLOT_BITS) | slot
+            for slot in self.order[self.unused_count:]
+            if self.used_at[slot] != NO_DATE
+        ]
+        heapq.heapify(self.expiry)
+
+    def pop_expired(self, cutoff):
+        """id использованных вопросов с датой раньше cutoff (datetime)
+
+        Найденные записи удаляются из кучи; сами вопросы остаются
+        использованными, пока вызывающий не снимет пометку.
+        """
+        cutoff = (cutoff - EPOCH) // timedelta(microseconds=1)
+        expired = []
+        while self.expiry and self.expiry[0] >> SLOT_BITS < cutoff:
+            entry = heapq.heappop(self.expiry)
+            slot = entry & SLOT_MASK
+            if self.positions[slot] >= self.unused_count and self.used_at[slot] == entry >> SLOT_BITS:
+                expired.append(self.ids[slot])
+        return expired
+
+    def used_date(self, qid):
+        slot = self._slot(qid)
+        if slot is None or self.positions[slot] < self.unused_count:
+            return None
+        return micros_to_date(self.used_at[slot])
+
+    def iter_questions(self):
+        """Все вопросы по одному, без служебных полей"""
+        for slot in range(len(self.ids)):
+            yield self._question(slot)
+
+    def snapshot(self):
+        """Копия для записи снапшота вне блокировки (см. PoolSnapshot)"""
+        return PoolSnapshot(self)
+
+    def to_list(self):
+        """Вопросы в формате questions.json (для снапшотов)"""
+        return [
+            {
+                **question,
+                "used": self.is_used(question["id"]),
+                "used_date": self.used_date(question["id"]),
+            }
+            for question in self.iter_questions()
+        ]
+
+    def close(self):
+        self.texts.close()
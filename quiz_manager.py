@@ -1,414 +1,859 @@
-import json
-import random
-from datetime import datetime, timedelta
-import os
-
-# Импортируем из config вместо прямого определения
-from config import QUESTIONS_FILE, SETTINGS_FILE, USERS_FILE, BOT_TOKEN
-
-class QuizManager:
-    def __init__(self):
-        print("🔧 Инициализация QuizManager...")
-        self.ensure_data_files()
-        self.clean_old_questions_if_needed()
-        print("✅ QuizManager инициализирован!")
-    
-    def ensure_data_files(self):
-        """Создает необходимые файлы и папки если их нет"""
-        print("📁 Проверка файлов данных...")
-        os.makedirs("data", exist_ok=True)
-        
-        # Создаем questions.json если нет или он пустой/битый
-        if not os.path.exists(QUESTIONS_FILE) or os.path.getsize(QUESTIONS_FILE) == 0:
-            print("📝 Создаю questions.json...")
-            sample_questions = {
-                "questions": [
-                    {
-                        "id": 1,
-                        "question": "Какой химический элемент обозначается как 'Fe'?",
-                        "answer": "железо",
-                        "used": False,
-                        "used_date": None
-                    },
-                    {
-                        "id": 2, 
-                        "question": "Столица Франции?",
-                        "answer": "париж",
-                        "used": False,
-                        "used_date": None
-                    },
-                    {
-                        "id": 3,
-                        "question": "Сколько планет в Солнечной системе?",
-                        "answer": "8",
-                        "used": False,
-                        "used_date": None
-                    }
-                ]
-            }
-            with open(QUESTIONS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(sample_questions, f, ensure_ascii=False, indent=2)
-            print("✅ questions.json создан!")
-        else:
-            print("✅ questions.json уже существует")
-        
-        # Создаем settings.json если нет или он пустой/битый
-        if not os.path.exists(SETTINGS_FILE) or os.path.getsize(SETTINGS_FILE) == 0:
-            print("⚙️ Создаю settings.json...")
-            default_settings = {
-                "quiz_schedule": [
-                    {"time": "12:00", "enabled": True},
-                    {"time": "18:00", "enabled": True}
-                ],
-                "auto_reset_used_questions": True,
-                "reset_after_days": 30
-            }
-            with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(default_settings, f, ensure_ascii=False, indent=2)
-            print("✅ settings.json создан!")
-        else:
-            print("✅ settings.json уже существует")
-        
-        # Создаем users.json если нет или он пустой/битый
-        if not os.path.exists(USERS_FILE) or os.path.getsize(USERS_FILE) == 0:
-            print("👥 Создаю users.json...")
-            with open(USERS_FILE, 'w', encoding='utf-8') as f:
-                json.dump({}, f, ensure_ascii=False, indent=2)
-            print("✅ users.json создан!")
-        else:
-            print("✅ users.json уже существует")
-        
-        print("✅ Все файлы данных проверены!")
-    
-    def load_questions(self):
-        """Загрузка вопросов из JSON"""
-        try:
-            with open(QUESTIONS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                print(f"✅ Загружено {len(data.get('questions', []))} вопросов")
-                return data.get("questions", [])
-        except json.JSONDecodeError as e:
-            print(f"❌ Ошибка JSON в questions.json: {e}")
-            # Пересоздаем файл если он битый
-            self.ensure_data_files()
-            return self.load_questions()
-        except Exception as e:
-            print(f"❌ Ошибка загрузки вопросов: {e}")
-            return []
-    
-    def save_questions(self, questions):
-        """Сохранение вопросов в JSON"""
-        try:
-            data = {"questions": questions}
-            with open(QUESTIONS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            print(f"💾 questions.json сохранен ({len(questions)} вопросов)")
-        except Exception as e:
-            print(f"❌ Ошибка сохранения вопросов: {e}")
-    
-    def load_users(self):
-        """Загрузка пользователей из JSON"""
-        try:
-            with open(USERS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data
-        except json.JSONDecodeError as e:
-            print(f"❌ Ошибка JSON в users.json: {e}")
-            # Пересоздаем файл если он битый
-            with open(USERS_FILE, 'w', encoding='utf-8') as f:
-                json.dump({}, f, ensure_ascii=False, indent=2)
-            return {}
-        except Exception as e:
-            print(f"❌ Ошибка загрузки пользователей: {e}")
-            return {}
-    
-    def save_users(self, users):
-        """Сохранение пользователей в JSON"""
-        try:
-            with open(USERS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(users, f, ensure_ascii=False, indent=2)
-            print(f"💾 users.json успешно сохранен ({len(users)} записей)")
-        except Exception as e:
-            print(f"❌ Ошибка сохранения пользователей: {e}")
-    
-    def load_settings(self):
-        """Загрузка настроек из JSON"""
-        try:
-            with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data
-        except json.JSONDecodeError as e:
-            print(f"❌ Ошибка JSON в settings.json: {e}")
-            # Пересоздаем файл если он битый
-            self.ensure_data_files()
-            return self.load_settings()
-        except Exception as e:
-            print(f"❌ Ошибка загрузки настроек: {e}")
-            return {}
-    
-    def clean_old_questions_if_needed(self):
-        """Очистка старых использованных вопросов"""
-        settings = self.load_settings()
-        if not settings.get("auto_reset_used_questions", True):
-            return
-        
-        reset_days = settings.get("reset_after_days", 30)
-        questions = self.load_questions()
-        changed = False
-        
-        for q in questions:
-            if q.get("used") and q.get("used_date"):
-                try:
-                    used_date = datetime.fromisoformat(q["used_date"])
-                    if datetime.now() - used_date > timedelta(days=reset_days):
-                        q["used"] = False
-                        q["used_date"] = None
-                        changed = True
-                except:
-                    continue
-        
-        if changed:
-            self.save_questions(questions)
-    
-    def get_random_question(self):
-        """Получение случайного неиспользованного вопроса"""
-        questions = self.load_questions()
-        if not questions:
-            print("❌ Нет вопросов в базе!")
-            return None
-            
-        unused_questions = [q for q in questions if not q.get("used", False)]
-        
-        if not unused_questions:
-            print("🔄 Сбрасываю все вопросы...")
-            for q in questions:
-                q["used"] = False
-                q["used_date"] = None
-            self.save_questions(questions)
-            unused_questions = questions
-        
-        if unused_questions:
-            question = random.choice(unused_questions)
-            # НЕ помечаем вопрос как использованный здесь - это сделает set_current_question
-            print(f"✅ Выбран вопрос: {question['question']}")
-            return question
-        
-        return None
-    
-    def get_current_question(self):
-        """Получение текущего активного вопроса"""
-        users_data = self.load_users()
-        return users_data.get("current_question")
-    
-    def set_current_question(self, question):
-        """Установка текущего активного вопроса и пометка его как использованного"""
-        print(f"📝 Устанавливаем текущий вопрос: {question['question']}")
-        
-        # Помечаем вопрос как использованный в questions.json
-        questions = self.load_questions()
-        question_updated = False
-        for q in questions:
-            if q['id'] == question['id']:
-                q['used'] = True
-                q['used_date'] = datetime.now().isoformat()
-                question_updated = True
-                print(f"✅ Вопрос {question['id']} помечен как использованный в questions.json")
-                break
-        
-        if question_updated:
-            self.save_questions(questions)
-            print("💾 questions.json обновлен")
-        else:
-            print("⚠️ Вопрос не найден в questions.json для обновления")
-        
-        # Устанавливаем текущий вопрос в users.json
-        users_data = self.load_users()
-        users_data["current_question"] = question
-        users_data["answered_users"] = []  # Сбрасываем список ответивших
-        
-        self.save_users(users_data)
-        print("💾 Текущий вопрос сохранен в users.json")
-    
-    def check_answer(self, user_id, answer):
-        """Проверка ответа пользователя"""
-        users_data = self.load_users()
-        current_question = users_data.get("current_question")
-        answered_users = users_data.get("answered_users", [])
-        
-        print(f"🔍 Проверка ответа: user_id={user_id}, answer='{answer}'")
-        print(f"📋 Текущий вопрос: {current_question}")
-        print(f"👥 Уже ответили: {answered_users}")
-        
-        if not current_question:
-            print("❌ Нет активного вопроса")
-            return False, "no_question"
-        
-        # Проверяем, отвечал ли уже пользователь
-        if str(user_id) in answered_users:
-            print(f"⚠️ Пользователь {user_id} уже отвечал")
-            return False, "already_answered"
-        
-        correct_answer = current_question["answer"].lower().strip()
-        user_answer = answer.lower().strip()
-        
-        print(f"📊 Сравнение: '{user_answer}' vs '{correct_answer}'")
-        
-        is_correct = user_answer == correct_answer
-        
-        if is_correct:
-            print(f"✅ Правильный ответ от пользователя {user_id}")
-            # Добавляем пользователя в список ответивших
-            answered_users.append(str(user_id))
-            users_data["answered_users"] = answered_users
-            
-            # Обновляем счет пользователя
-            self.update_user_score(user_id, 1)
-            
-            # Сохраняем изменения
-            self.save_users(users_data)
-            print(f"💾 Данные сохранены: answered_users={answered_users}")
-        else:
-            print(f"❌ Неправильный ответ от пользователя {user_id}")
-        
-        return is_correct, "correct" if is_correct else "wrong"
-    
-    def update_user_score(self, user_id, points=1):
-        """Обновление счета пользователя"""
-        print(f"📊 Обновление счета: user_id={user_id}, points={points}")
-        
-        users_data = self.load_users()
-        
-        if "users" not in users_data:
-            users_data["users"] = {}
-            print("👥 Создан новый раздел users")
-        
-        user_str = str(user_id)
-        if user_str not in users_data["users"]:
-            users_data["users"][user_str] = {
-                "score": 0,
-                "username": "",
-                "first_name": ""
-            }
-            print(f"👤 Создан новый пользователь: {user_str}")
-        
-        users_data["users"][user_str]["score"] += points
-        print(f"🎯 Пользователь {user_str} теперь имеет {users_data['users'][user_str]['score']} очков")
-        
-        # Сохраняем изменения
-        self.save_users(users_data)
-        print("💾 Счет пользователя сохранен")
-    
-    def update_user_info(self, user_id, username, first_name):
-        """Обновление информации о пользователе"""
-        users_data = self.load_users()
-        
-        if "users" not in users_data:
-            users_data["users"] = {}
-        
-        user_str = str(user_id)
-        if user_str not in users_data["users"]:
-            users_data["users"][user_str] = {
-                "score": 0,
-                "username": username or "",
-                "first_name": first_name or ""
-            }
-        else:
-            users_data["users"][user_str]["username"] = username or ""
-            users_data["users"][user_str]["first_name"] = first_name or ""
-        
-        self.save_users(users_data)
-    
-    def get_leaderboard(self):
-        """Получение таблицы лидеров"""
-        users_data = self.load_users()
-        users = users_data.get("users", {})
-        
-        sorted_users = sorted(
-            users.items(),
-            key=lambda x: x[1]["score"],
-            reverse=True
-        )[:10]
-        
-        return sorted_users
-    
-    def get_user_score(self, user_id):
-        """Получение счета конкретного пользователя"""
-        users_data = self.load_users()
-        user = users_data.get("users", {}).get(str(user_id), {})
-        return user.get("score", 0)
-    
-    def get_quiz_times(self):
-        """Получение расписания викторин"""
-        settings = self.load_settings()
-        return [s["time"] for s in settings.get("quiz_schedule", []) if s.get("enabled", True)]
-    
-    def add_quiz_time(self, time):
-        """Добавление времени викторины"""
-        settings = self.load_settings()
-        settings["quiz_schedule"].append({"time": time, "enabled": True})
-        self.save_settings(settings)
-    
-    def remove_quiz_time(self, time):
-        """Удаление времени викторины"""
-        settings = self.load_settings()
-        settings["quiz_schedule"] = [s for s in settings["quiz_schedule"] if s["time"] != time]
-        self.save_settings(settings)
-    
-    def get_all_users_count(self):
-        """Получает общее количество зарегистрированных пользователей"""
-        users_data = self.load_users()
-        users = users_data.get('users', {})
-        return len(users)
-
-    def get_first_responder_info(self):
-        """Получает информацию о первом ответившем пользователе"""
-        users_data = self.load_users()
-        answered_users = users_data.get("answered_users", [])
-        
-        if not answered_users:
-            return None
-        
-        # Берем первого ответившего (первый в списке)
-        first_responder_id = answered_users[0]
-        users = users_data.get("users", {})
-        first_responder = users.get(first_responder_id)
-        
-        if first_responder:
-            return {
-                'first_name': first_responder.get('first_name', 'Участник'),
-                'username': first_responder.get('username', '')
-            }
-        
-        return None
-
-    # МЕТОДЫ ДЛЯ УПРАВЛЕНИЯ ЧАТАМИ
-    def add_chat_id(self, chat_id):
-        """Добавляет ID чата в список для автоматических викторин"""
-        users_data = self.load_users()
-        
-        if "active_chats" not in users_data:
-            users_data["active_chats"] = []
-        
-        if chat_id not in users_data["active_chats"]:
-            users_data["active_chats"].append(chat_id)
-            self.save_users(users_data)
-            print(f"✅ Добавлен чат ID: {chat_id}")
-        
-        return users_data["active_chats"]
-
-    def get_active_chats(self):
-        """Получает список активных чатов"""
-        users_data = self.load_users()
-        return users_data.get("active_chats", [])
-
-    def remove_chat_id(self, chat_id):
-        """Удаляет ID чата из списка"""
-        users_data = self.load_users()
-        
-        if "active_chats" in users_data:
-            if chat_id in users_data["active_chats"]:
-                users_data["active_chats"].remove(chat_id)
-                self.save_users(users_data)
-                print(f"🗑️ Удален чат ID: {chat_id}")
-        
-        return users_data.get("active_chats", [])
\ No newline at end of file
+import asyncio
+import atexit
+import functools
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import os
+
+# Импортируем из config вместо прямого определения
+from config import QUESTIONS_FILE, SETTINGS_FILE, USERS_FILE, BOT_TOKEN, WRITE_BEHIND_INTERVAL, JOURNAL_COMPACT_EVERY, STORAGE_BACKEND, QUIZ_IO_WORKERS
+from answer_matcher import AnswerMatcher
+from question_pool import QuestionPool
+from score_index import ScoreIndex
+from storage import atomic_write, create_storage
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+LOAD_SECONDS = registry.gauge("quiz_load_seconds", "Время загрузки данных при запуске")
+FLUSH_SECONDS = registry.histogram("quiz_flush_seconds", "Время записи на диск", ["kind"])
+FLUSH_BYTES = registry.counter("quiz_flush_bytes_total", "Записано байт (SQLite не считает)", ["kind"])
+FLUSH_EVENTS = registry.counter("quiz_flush_events_total", "Событий записано в журнал или базу")
+CALL_SECONDS = registry.histogram(
+    "quiz_manager_call_seconds", "Вызов QuizManager из бота, включая ожидание очереди ресурса", ["method"]
+)
+
+def call_name(method):
+    """Имя метода для метрик (functools.partial разворачивается)"""
+    while isinstance(method, functools.partial):
+        method = method.func
+    return getattr(method, "__name__", "call")
+
+def synchronized(method):
+    """Выполняет метод под блокировкой состояния QuizManager"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+# Уровни: (минимум очков, название, эмодзи)
+LEVELS = [
+    (0, "Малек", "🐟"),
+    (5, "Карасик", "🐠"),
+    (15, "Карась", "🐡"),
+    (30, "Щука", "🦈"),
+    (60, "Сом", "🐋"),
+    (100, "Царь-рыба", "👑"),
+]
+
+class QuizManager:
+    # Достижения за набранные очки
+    ACHIEVEMENTS = {
+        "first_blood": {"icon": "🥇", "name": "Первый улов", "description": "Дать первый правильный ответ", "score": 1},
+        "ten": {"icon": "🔟", "name": "Десятка", "description": "Набрать 10 очков", "score": 10},
+        "fifty": {"icon": "🎖️", "name": "Полсотни", "description": "Набрать 50 очков", "score": 50},
+        "hundred": {"icon": "🏆", "name": "Сотня", "description": "Набрать 100 очков", "score": 100},
+    }
+    
+    def __init__(self, flush_interval=WRITE_BEHIND_INTERVAL, compact_every=JOURNAL_COMPACT_EVERY, storage=None):
+        logger.info("🔧 Инициализация QuizManager...")
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self._lock = threading.RLock()
+        self._io_lock = threading.Lock()
+        self._pending = []
+        self._matchers = {}  # chat_id -> AnswerMatcher активного вопроса
+        self._listeners = []  # подписчики на события (кэши бота)
+        self._snapshot_requested = False
+        self._dirty_event = threading.Event()
+        self._stop_event = threading.Event()
+        
+        self.ensure_data_files()
+        self.storage = storage or create_storage(STORAGE_BACKEND)
+        
+        # Данные живут в памяти - это единственный источник истины
+        load_started = time.perf_counter()
+        state, events = self.storage.load()
+        self.users_data = state["users"]
+        self.pool = QuestionPool(state["questions"].get("questions", []))
+        self.settings = state["settings"]
+        # Глобальный вопрос старого формата не привязан к чату - отбрасываем
+        self.users_data.pop("current_question", None)
+        self.users_data.pop("answered_users", None)
+        self._rebuild_indexes()
+        for event in events:
+            self._apply_event(event)
+        self._seq = self.storage.last_seq
+        # Битый снапшот был отложен в сторону - сразу пишем корректный
+        self._snapshot_requested = self.storage.needs_snapshot
+        LOAD_SECONDS.set(time.perf_counter() - load_started)
+        logger.info(f"✅ Загружено {len(self.pool)} вопросов")
+        registry.gauge("quiz_pending_events", "События, еще не записанные на диск").set_function(
+            lambda: len(self._pending)
+        )
+        
+        self._writer = threading.Thread(target=self._write_behind_loop, name="quiz-write-behind", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+        
+        self.clean_old_questions_if_needed()
+        logger.info("✅ QuizManager инициализирован!")
+    
+    def ensure_data_files(self):
+        """Создает необходимые файлы и папки если их нет"""
+        logger.info("📁 Проверка файлов данных...")
+        os.makedirs("data", exist_ok=True)
+        
+        # Создаем questions.json если нет или он пустой/битый
+        if not os.path.exists(QUESTIONS_FILE) or os.path.getsize(QUESTIONS_FILE) == 0:
+            logger.info("📝 Создаю questions.json...")
+            sample_questions = {
+                "questions": [
+                    {
+                        "id": 1,
+                        "question": "Какой химический элемент обозначается как 'Fe'?",
+                        "answer": "железо",
+                        "used": False,
+                        "used_date": None
+                    },
+                    {
+                        "id": 2, 
+                        "question": "Столица Франции?",
+                        "answer": "париж",
+                        "used": False,
+                        "used_date": None
+                    },
+                    {
+                        "id": 3,
+                        "question": "Сколько планет в Солнечной системе?",
+                        "answer": "8",
+                        "used": False,
+                        "used_date": None
+                    }
+                ]
+            }
+            atomic_write(QUESTIONS_FILE, json.dumps(sample_questions, ensure_ascii=False, indent=2))
+            logger.info("✅ questions.json создан!")
+        else:
+            logger.info("✅ questions.json уже существует")
+        
+        # Создаем settings.json если нет или он пустой/битый
+        if not os.path.exists(SETTINGS_FILE) or os.path.getsize(SETTINGS_FILE) == 0:
+            logger.info("⚙️ Создаю settings.json...")
+            default_settings = {
+                "quiz_schedule": [
+                    {"time": "12:00", "enabled": True},
+                    {"time": "18:00", "enabled": True}
+                ],
+                "auto_reset_used_questions": True,
+                "reset_after_days": 30
+            }
+            atomic_write(SETTINGS_FILE, json.dumps(default_settings, ensure_ascii=False, indent=2))
+            logger.info("✅ settings.json создан!")
+        else:
+            logger.info("✅ settings.json уже существует")
+        
+        # Создаем users.json если нет или он пустой/битый
+        if not os.path.exists(USERS_FILE) or os.path.getsize(USERS_FILE) == 0:
+            logger.info("👥 Создаю users.json...")
+            atomic_write(USERS_FILE, json.dumps({}, ensure_ascii=False, indent=2))
+            logger.info("✅ users.json создан!")
+        else:
+            logger.info("✅ users.json уже существует")
+        
+        logger.info("✅ Все файлы данных проверены!")
+    
+    def _record(self, op, **fields):
+        """Применяет событие к состоянию в памяти и ставит его в очередь журнала"""
+        with self._lock:
+            self._seq += 1
+            event = {"seq": self._seq, "op": op, **fields}
+            self._apply_event(event)
+            self._pending.append(event)
+            for listener in self._listeners:
+                listener(event)
+        self._dirty_event.set()
+        return event
+    
+    def subscribe(self, listener):
+        """Регистрирует listener(event), вызываемый после каждого изменения состояния"""
+        self._listeners.append(listener)
+    
+    def _ensure_user(self, user_str):
+        """Возвращает запись пользователя, создавая ее при необходимости"""
+        users = self.users_data.setdefault("users", {})
+        if user_str not in users:
+            users[user_str] = {
+                "score": 0,
+                "username": "",
+                "first_name": ""
+            }
+            self.score_index.set(user_str, 0)
+            logger.debug("👤 Создан новый пользователь", extra={"user": user_str})
+        return users[user_str]
+    
+    def _rebuild_indexes(self):
+        """Строит рейтинги (общий и по чатам) по данным в памяти"""
+        users = self.users_data.get("users", {})
+        self.score_index = ScoreIndex({user_id: user["score"] for user_id, user in users.items()})
+        self.chat_score_indexes = {
+            chat: ScoreIndex(scores) for chat, scores in self.users_data.get("chat_scores", {}).items()
+        }
+    
+    def _add_points(self, user_str, points, chat=None):
+        """Начисляет очки и обновляет рейтинги"""
+        user = self._ensure_user(user_str)
+        user["score"] += points
+        self.score_index.set(user_str, user["score"])
+        
+        if chat is not None:
+            chat_scores = self.users_data.setdefault("chat_scores", {}).setdefault(chat, {})
+            chat_scores[user_str] = chat_scores.get(user_str, 0) + points
+            if chat not in self.chat_score_indexes:
+                self.chat_score_indexes[chat] = ScoreIndex()
+            self.chat_score_indexes[chat].set(user_str, chat_scores[user_str])
+    
+    def _apply_event(self, event):
+        """Применение одного события журнала к данным в памяти"""
+        op = event["op"]
+        users_data = self.users_data
+        
+        if op == "user_score":
+            self._add_points(event["user"], event["points"])
+        elif op == "user_info":
+            user = self._ensure_user(event["user"])
+            user["username"] = event["username"]
+            user["first_name"] = event["first_name"]
+        elif op == "session_start":
+            # Варианты ответа нормализуются один раз на сессию
+            self._matchers[str(event["chat"])] = AnswerMatcher(event["question"])
+            users_data.setdefault("sessions", {})[str(event["chat"])] = {
+                "question": event["question"],
+                "answered_users": [],  # Список ответивших в этом чате
+                "started_at": event["date"],
+                "answered_at": None
+            }
+        elif op == "answer_won":
+            session = users_data.get("sessions", {}).get(str(event["chat"]))
+            if session is not None:
+                session["answered_users"].append(event["user"])
+                session["answered_at"] = event["date"]
+            self._add_points(event["user"], event["points"], chat=str(event["chat"]))
+        elif op == "stats_reset":
+            for user in users_data.get("users", {}).values():
+                user["score"] = 0
+            users_data["chat_scores"] = {}
+            users_data["sessions"] = {}
+            self._matchers.clear()
+            self._rebuild_indexes()
+        elif op == "chat_add":
+            active_chats = users_data.setdefault("active_chats", [])
+            if event["chat"] not in active_chats:
+                active_chats.append(event["chat"])
+        elif op == "chat_remove":
+            active_chats = users_data.get("active_chats", [])
+            if event["chat"] in active_chats:
+                active_chats.remove(event["chat"])
+        elif op == "questions_add":
+            for question in event["questions"]:
+                self.pool.add(question)
+        elif op == "question_used":
+            self.pool.mark_used(event["id"], event["date"])
+        elif op == "question_reset":
+            for qid in event["ids"]:
+                self.pool.mark_unused(qid)
+        elif op == "questions_reset_all":
+            self.pool.reset_all()
+        elif op == "settings":
+            self.settings = event["settings"]
+    
+    def _write_behind_loop(self):
+        """Фоновый поток: сбрасывает изменения на диск"""
+        while not self._stop_event.is_set():
+            self._dirty_event.wait()
+            # Коалесцируем пачку изменений в одну запись
+            self._stop_event.wait(self.flush_interval)
+            self._dirty_event.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception(f"❌ Ошибка фоновой записи: {e}")
+    
+    def flush(self, compact=False):
+        """Дописывает накопленные события в журнал; при необходимости делает снапшот"""
+        with self._io_lock:
+            with self._lock:
+                events = self._pending
+                self._pending = []
+                compact = (
+                    compact
+                    or self._snapshot_requested
+                    or self.storage.journal_size + len(events) >= self.compact_every
+                )
+                if compact:
+                    # Снапшот уже включает все события из очереди; вопросы
+                    # копируются массивами и пишутся потоком уже без блокировки
+                    snapshot = self.storage.serialize_snapshot({
+                        "users": self.users_data,
+                        "questions": self.pool.snapshot(),
+                        "settings": self.settings,
+                        "seq": self._seq,
+                    })
+                    self._snapshot_requested = False
+            
+            try:
+                if compact:
+                    with FLUSH_SECONDS.time(kind="snapshot"):
+                        written = self.storage.write_snapshot(snapshot)
+                    FLUSH_BYTES.inc(written, kind="snapshot")
+                    logger.info(f"💾 Снапшот данных записан ({written} байт)")
+                elif events:
+                    with FLUSH_SECONDS.time(kind="append"):
+                        written = self.storage.append(events)
+                    FLUSH_BYTES.inc(written, kind="append")
+                    FLUSH_EVENTS.inc(len(events))
+            except Exception:
+                with self._lock:
+                    if compact:
+                        self._snapshot_requested = True
+                    else:
+                        self._pending[:0] = events
+                raise
+    
+    def close(self):
+        """Останавливает фоновую запись и выполняет финальный сброс на диск"""
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        self._dirty_event.set()
+        self._writer.join()
+        self.flush(compact=self.storage.compact_on_close)
+        self.storage.close()
+        self.pool.close()
+        logger.info("✅ Данные QuizManager сохранены на диск")
+    
+    def load_questions(self):
+        """Получение копии всех вопросов в формате questions.json"""
+        with self._lock:
+            return self.pool.to_list()
+    
+    def questions_snapshot(self):
+        """Снимок всех вопросов для прохода по одному без блокировки
+        
+        В отличие от load_questions, банк не собирается в список: вопросы
+        в формате questions.json отдаются при итерации (один раз).
+        """
+        with self._lock:
+            return self.pool.snapshot()
+    
+    def add_questions(self, questions):
+        """Добавляет пачку новых вопросов одним событием журнала; возвращает их id"""
+        with self._lock:
+            first_id = self.pool.max_id + 1
+            batch = [{"id": first_id + i, **question} for i, question in enumerate(questions)]
+            if batch:
+                self._record("questions_add", questions=batch)
+        return [question["id"] for question in batch]
+    
+    def save_questions(self, questions):
+        """Полная замена вопросов (записывается следующим снапшотом)"""
+        with self._lock:
+            self.pool.close()
+            self.pool = QuestionPool(questions)
+            self._snapshot_requested = True
+        self._dirty_event.set()
+    
+    def load_users(self):
+        """Получение данных пользователей (из памяти)"""
+        return self.users_data
+    
+    def save_users(self, users):
+        """Полная замена данных пользователей (записывается следующим снапшотом)"""
+        with self._lock:
+            self.users_data = users
+            self._rebuild_indexes()
+            self._snapshot_requested = True
+        self._dirty_event.set()
+    
+    def load_settings(self):
+        """Получение настроек (из памяти)"""
+        return self.settings
+    
+    def save_settings(self, settings):
+        """Сохранение настроек"""
+        self._record("settings", settings=settings)
+    
+    @synchronized
+    def clean_old_questions_if_needed(self):
+        """Возвращает в оборот вопросы, использованные больше reset_after_days дней назад
+        
+        Истекшие вопросы берутся из кучи сроков QuestionPool, поэтому работа
+        пропорциональна их количеству, а не размеру банка. Возвращает число
+        возвращенных вопросов.
+        """
+        settings = self.load_settings()
+        if not settings.get("auto_reset_used_questions", True):
+            return 0
+        
+        reset_days = settings.get("reset_after_days", 30)
+        expired_ids = self.pool.pop_expired(datetime.now() - timedelta(days=reset_days))
+        if expired_ids:
+            self._record("question_reset", ids=expired_ids)
+            logger.info(f"♻️ Возвращено в оборот вопросов: {len(expired_ids)}")
+        return len(expired_ids)
+    
+    @synchronized
+    def get_random_question(self):
+        """Получение случайного неиспользованного вопроса"""
+        if not len(self.pool):
+            logger.error("❌ Нет вопросов в базе!")
+            return None
+        
+        if not self.pool.unused_count:
+            logger.info("🔄 Сбрасываю все вопросы...")
+            self._record("questions_reset_all")
+        
+        question = self.pool.draw()
+        # НЕ помечаем вопрос как использованный здесь - это сделает set_current_question
+        logger.debug("✅ Выбран вопрос", extra={"question": question["id"]})
+        return question
+    
+    @synchronized
+    def start_quiz(self, chat_id):
+        """Выбирает вопрос и открывает сессию в чате одним действием"""
+        question = self.get_random_question()
+        if question:
+            self.set_current_question(chat_id, question)
+        return question
+    
+    def get_session(self, chat_id):
+        """Сессия викторины в чате: вопрос, ответившие, время начала/ответа"""
+        return self.users_data.get("sessions", {}).get(str(chat_id))
+    
+    def get_session_status(self, chat_id):
+        """Быстрая проверка сессии в памяти: None, open или answered"""
+        session = self.get_session(chat_id)
+        if not session:
+            return None
+        return "answered" if session["answered_users"] else "open"
+    
+    def get_current_question(self, chat_id):
+        """Получение текущего активного вопроса в чате"""
+        session = self.get_session(chat_id)
+        return session["question"] if session else None
+    
+    @synchronized
+    def set_current_question(self, chat_id, question):
+        """Установка активного вопроса в чате и пометка его как использованного"""
+        # Помечаем вопрос как использованный
+        self._record("question_used", id=question['id'], date=datetime.now().isoformat())
+        
+        # Открываем сессию чата (копия вопроса, чтобы не делить объект с банком вопросов)
+        self._record("session_start", chat=chat_id, question=dict(question), date=datetime.now().isoformat())
+        logger.info("📝 Открыт вопрос в чате", extra={"chat": chat_id, "question": question["id"]})
+    
+    @synchronized
+    def check_answer(self, user_id, answer, chat_id, points=1):
+        """Проверка ответа пользователя в чате: первый правильный ответ побеждает
+        
+        Проверка, запись ответа и начисление очков выполняются под одной
+        блокировкой и фиксируются одним событием answer_won, поэтому
+        победитель в сессии всегда один, а очки не теряются.
+        """
+        session = self.get_session(chat_id)
+        
+        if not session:
+            logger.debug("❌ Нет активного вопроса", extra={"chat": chat_id, "user": user_id, "sampled": True})
+            return False, "no_question"
+        
+        current_question = session["question"]
+        answered_users = session["answered_users"]
+        
+        # Проверяем, есть ли уже победитель в этой сессии
+        if answered_users:
+            logger.debug("⚠️ На вопрос уже ответили", extra={"chat": chat_id, "user": user_id, "sampled": True})
+            return False, "already_answered"
+        
+        matcher = self._matchers.get(str(chat_id))
+        if matcher is None:
+            matcher = self._matchers[str(chat_id)] = AnswerMatcher(current_question)
+        
+        is_correct = matcher.match(answer)
+        logger.debug(
+            "🔍 Проверка ответа",
+            extra={"chat": chat_id, "user": user_id, "question": current_question.get("id"),
+                   "correct": is_correct, "sampled": True},
+        )
+        
+        if is_correct:
+            # Победитель, ответ и очки - одним событием
+            self._record(
+                "answer_won",
+                chat=chat_id,
+                user=str(user_id),
+                question=current_question.get("id"),
+                points=points,
+                date=datetime.now().isoformat()
+            )
+            logger.info("✅ Правильный ответ", extra={"chat": chat_id, "user": user_id, "question": current_question.get("id")})
+        
+        return is_correct, "correct" if is_correct else "wrong"
+    
+    @synchronized
+    def update_user_score(self, user_id, points=1):
+        """Обновление счета пользователя"""
+        user_str = str(user_id)
+        self._record("user_score", user=user_str, points=points)
+        logger.info("🎯 Обновлен счет", extra={"user": user_str, "points": points, "score": self.get_user_score(user_id)})
+    
+    def is_user_info_current(self, user_id, username, first_name):
+        """True, если сохраненные имя и username совпадают с переданными"""
+        user = self.users_data.get("users", {}).get(str(user_id))
+        return (
+            user is not None
+            and user["username"] == (username or "")
+            and user["first_name"] == (first_name or "")
+        )
+    
+    @synchronized
+    def update_user_info(self, user_id, username, first_name):
+        """Обновление информации о пользователе; True, если что-то изменилось"""
+        if self.is_user_info_current(user_id, username, first_name):
+            return False
+        self._record("user_info", user=str(user_id), username=username or "", first_name=first_name or "")
+        return True
+    
+    def _score_index(self, chat_id=None):
+        """Общий рейтинг или рейтинг чата"""
+        if chat_id is None:
+            return self.score_index
+        return self.chat_score_indexes.get(str(chat_id)) or ScoreIndex()
+    
+    def _leaderboard_row(self, user_id, score):
+        user = self.users_data.get("users", {}).get(user_id, {})
+        level = self.get_user_level(score)
+        return (user_id, {
+            "score": score,
+            "username": user.get("username", ""),
+            "first_name": user.get("first_name", ""),
+            "level": level,
+            "level_emoji": LEVELS[level - 1][2],
+        })
+    
+    @synchronized
+    def get_leaderboard(self, chat_id=None, limit=10):
+        """Получение таблицы лидеров (общей или чата), без игроков с нулем очков"""
+        return [
+            self._leaderboard_row(user_id, score)
+            for user_id, score in self._score_index(chat_id).top(limit)
+            if score > 0
+        ]
+    
+    @synchronized
+    def get_leaderboard_neighbours(self, user_id, chat_id=None, radius=2):
+        """Строки таблицы вокруг пользователя: [(место, user_id, данные)]"""
+        return [
+            (position, *self._leaderboard_row(uid, score))
+            for position, uid, score in self._score_index(chat_id).neighbours(str(user_id), radius)
+        ]
+    
+    @synchronized
+    def get_players_count(self, chat_id=None):
+        """Количество игроков в общем рейтинге или рейтинге чата"""
+        return len(self._score_index(chat_id))
+    
+    def get_user_score(self, user_id):
+        """Получение счета конкретного пользователя"""
+        users_data = self.load_users()
+        user = users_data.get("users", {}).get(str(user_id), {})
+        return user.get("score", 0)
+    
+    @synchronized
+    def get_user_rank(self, user_id, chat_id=None):
+        """Место пользователя в общем рейтинге или рейтинге чата"""
+        return self._score_index(chat_id).rank(str(user_id))
+    
+    # УРОВНИ, ДОСТИЖЕНИЯ И ПРОФИЛЬ
+    def get_user_level(self, score):
+        """Номер уровня (с 1) по количеству очков"""
+        level = 1
+        for i, (min_score, _, _) in enumerate(LEVELS, 1):
+            if score >= min_score:
+                level = i
+        return level
+    
+    def get_user_achievements(self, user_id):
+        """Список id полученных достижений"""
+        score = self.get_user_score(user_id)
+        return [ach_id for ach_id, ach in self.ACHIEVEMENTS.items() if score >= ach["score"]]
+    
+    @synchronized
+    def get_user_profile(self, user_id):
+        """Профиль пользователя: очки, уровень, прогресс, достижения, место"""
+        score = self.get_user_score(user_id)
+        level = self.get_user_level(score)
+        min_score, level_name, level_emoji = LEVELS[level - 1]
+        
+        if level < len(LEVELS):
+            next_level_points = LEVELS[level][0]
+            progress_percent = int((score - min_score) * 100 / (next_level_points - min_score))
+        else:
+            next_level_points = "максимум"
+            progress_percent = 100
+        
+        return {
+            "score": score,
+            "level": level,
+            "level_name": level_name,
+            "level_emoji": level_emoji,
+            "next_level_points": next_level_points,
+            "progress_percent": progress_percent,
+            "achievements": self.get_user_achievements(user_id),
+            "rank": self.get_user_rank(user_id),
+            "players": len(self.score_index),
+        }
+    
+    @synchronized
+    def reset_all_stats(self):
+        """Сброс очков, рейтингов, сессий и использованных вопросов"""
+        self._record("stats_reset")
+        self._record("questions_reset_all")
+        logger.info("🔄 Вся статистика сброшена")
+    
+    def get_quiz_times(self):
+        """Получение расписания викторин"""
+        settings = self.load_settings()
+        return [s["time"] for s in settings.get("quiz_schedule", []) if s.get("enabled", True)]
+    
+    @synchronized
+    def add_quiz_time(self, time):
+        """Добавление времени викторины"""
+        settings = dict(self.load_settings())
+        settings["quiz_schedule"] = settings.get("quiz_schedule", []) + [{"time": time, "enabled": True}]
+        self.save_settings(settings)
+    
+    @synchronized
+    def remove_quiz_time(self, time):
+        """Удаление времени викторины"""
+        settings = dict(self.load_settings())
+        settings["quiz_schedule"] = [s for s in settings.get("quiz_schedule", []) if s["time"] != time]
+        self.save_settings(settings)
+    
+    @synchronized
+    def set_chat_schedule(self, chat_id, **changes):
+        """Личное расписание чата: times (список "ЧЧ:ММ") и/или timezone; None - как у всех"""
+        settings = dict(self.load_settings())
+        schedules = dict(settings.get("chat_schedules", {}))
+        schedule = dict(schedules.get(str(chat_id), {}))
+        for key, value in changes.items():
+            if value is None:
+                schedule.pop(key, None)
+            else:
+                schedule[key] = value
+        if schedule:
+            schedules[str(chat_id)] = schedule
+        else:
+            schedules.pop(str(chat_id), None)
+        settings["chat_schedules"] = schedules
+        self.save_settings(settings)
+    
+    def get_all_users_count(self):
+        """Получает общее количество зарегистрированных пользователей"""
+        return len(self.users_data.get('users', {}))
+
+    def get_first_responder_info(self, chat_id):
+        """Получает информацию о первом ответившем пользователе в чате
+        
+        Только чтение из памяти, без блокировки (как get_session_status):
+        победитель записывается в сессию один раз и больше не меняется.
+        """
+        users_data = self.load_users()
+        session = self.get_session(chat_id)
+        answered_users = session["answered_users"] if session else []
+        
+        if not answered_users:
+            return None
+        
+        # Берем первого ответившего (первый в списке)
+        first_responder_id = answered_users[0]
+        users = users_data.get("users", {})
+        first_responder = users.get(first_responder_id)
+        
+        if first_responder:
+            return {
+                'first_name': first_responder.get('first_name', 'Участник'),
+                'username': first_responder.get('username', '')
+            }
+        
+        return None
+
+    # МЕТОДЫ ДЛЯ УПРАВЛЕНИЯ ЧАТАМИ
+    @synchronized
+    def add_chat_id(self, chat_id):
+        """Добавляет ID чата в список для автоматических викторин"""
+        users_data = self.load_users()
+        
+        if "active_chats" not in users_data:
+            users_data["active_chats"] = []
+        
+        if chat_id not in users_data["active_chats"]:
+            self._record("chat_add", chat=chat_id)
+            logger.info(f"✅ Добавлен чат ID: {chat_id}")
+        
+        return users_data["active_chats"]
+
+    def get_active_chats(self):
+        """Получает список активных чатов"""
+        users_data = self.load_users()
+        return users_data.get("active_chats", [])
+
+    @synchronized
+    def remove_chat_id(self, chat_id):
+        """Удаляет ID чата из списка"""
+        users_data = self.load_users()
+        
+        if "active_chats" in users_data:
+            if chat_id in users_data["active_chats"]:
+                self._record("chat_remove", chat=chat_id)
+                logger.info(f"🗑️ Удален чат ID: {chat_id}")
+        
+        return users_data.get("active_chats", [])
+
+
+class AsyncQuizManager:
+    """Асинхронный интерфейс QuizManager для обработчиков бота
+
+    Все вызовы выполняются в отдельном пуле потоков, поэтому запись на диск
+    и запросы к базе не блокируют event loop. Вызовы, относящиеся к одному
+    ресурсу (чат, пользователь, настройки), выполняются строго по очереди
+    в порядке поступления.
+    """
+    
+    def __init__(self, manager=None, max_workers=QUIZ_IO_WORKERS):
+        self.manager = manager or QuizManager()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="quiz-io")
+        self._locks = {}   # ресурс -> [блокировка, сколько вызовов ее ждет или держит]
+    
+    async def _run(self, resource, method, *args):
+        """Выполняет метод QuizManager в пуле потоков под блокировкой ресурса
+        
+        Блокировка ресурса живет, пока ее кто-то ждет или держит, - словарь
+        не растет с каждым пользователем и чатом, которых видел бот.
+        """
+        loop = asyncio.get_running_loop()
+        call = functools.partial(method, *args)
+        with CALL_SECONDS.time(method=call_name(method)):
+            if resource is None:
+                return await loop.run_in_executor(self._executor, call)
+            entry = self._locks.setdefault(resource, [asyncio.Lock(), 0])
+            entry[1] += 1
+            try:
+                async with entry[0]:
+                    return await loop.run_in_executor(self._executor, call)
+            finally:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[resource]
+    
+    def __getattr__(self, name):
+        """Остальные методы QuizManager - в пуле потоков под общей блокировкой"""
+        if name == "manager":
+            raise AttributeError(name)
+        attr = getattr(self.manager, name)
+        if not callable(attr):
+            return attr
+        
+        async def call(*args):
+            return await self._run("manager", attr, *args)
+        return call
+    
+    # Чтение состояния в памяти - без пула потоков
+    def get_session_status(self, chat_id):
+        return self.manager.get_session_status(chat_id)
+    
+    def get_first_responder_info(self, chat_id):
+        return self.manager.get_first_responder_info(chat_id)
+    
+    def is_user_info_current(self, user_id, username, first_name):
+        return self.manager.is_user_info_current(user_id, username, first_name)
+    
+    def get_settings(self):
+        return self.manager.load_settings()
+    
+    def subscribe(self, listener):
+        self.manager.subscribe(listener)
+    
+    # Сессии чатов
+    async def check_answer(self, user_id, answer, chat_id):
+        return await self._run(f"chat:{chat_id}", self.manager.check_answer, user_id, answer, chat_id)
+    
+    async def start_quiz(self, chat_id):
+        return await self._run(f"chat:{chat_id}", self.manager.start_quiz, chat_id)
+    
+    async def get_current_question(self, chat_id):
+        return await self._run(f"chat:{chat_id}", self.manager.get_current_question, chat_id)
+    
+    # Пользователи
+    async def update_user_info(self, user_id, username, first_name):
+        return await self._run(f"user:{user_id}", self.manager.update_user_info, user_id, username, first_name)
+    
+    async def get_user_score(self, user_id):
+        return await self._run(None, self.manager.get_user_score, user_id)
+    
+    async def get_user_rank(self, user_id, chat_id=None):
+        return await self._run(None, self.manager.get_user_rank, user_id, chat_id)
+    
+    async def get_user_profile(self, user_id):
+        return await self._run(None, self.manager.get_user_profile, user_id)
+    
+    async def get_user_achievements(self, user_id):
+        return await self._run(None, self.manager.get_user_achievements, user_id)
+    
+    async def get_leaderboard(self, chat_id=None, limit=10):
+        return await self._run(None, self.manager.get_leaderboard, chat_id, limit)
+    
+    async def get_leaderboard_neighbours(self, user_id, chat_id=None, radius=2):
+        return await self._run(None, self.manager.get_leaderboard_neighbours, user_id, chat_id, radius)
+    
+    async def get_players_count(self, chat_id=None):
+        return await self._run(None, self.manager.get_players_count, chat_id)
+    
+    async def reset_all_stats(self):
+        return await self._run("manager", self.manager.reset_all_stats)
+    
+    async def get_all_users_count(self):
+        return await self._run(None, self.manager.get_all_users_count)
+    
+    # Настройки и чаты
+    async def get_quiz_times(self):
+        return await self._run(None, self.manager.get_quiz_times)
+    
+    async def add_quiz_time(self, time):
+        return await self._run("settings", self.manager.add_quiz_time, time)
+    
+    async def remove_quiz_time(self, time):
+        return await self._run("settings", self.manager.remove_quiz_time, time)
+    
+    async def set_chat_schedule(self, chat_id, **changes):
+        return await self._run("settings", functools.partial(self.manager.set_chat_schedule, chat_id, **changes))
+    
+    async def get_active_chats(self):
+        def get_active_chats():
+            return list(self.manager.get_active_chats())
+        return await self._run(None, get_active_chats)
+    
+    async def add_chat_id(self, chat_id):
+        return await self._run("chats", self.manager.add_chat_id, chat_id)
+    
+    async def remove_chat_id(self, chat_id):
+        return await self._run("chats", self.manager.remove_chat_id, chat_id)
+    
+    async def close(self):
+        """Финальный сброс данных и остановка пула потоков"""
+        await self._run(None, self.manager.close)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,126 @@
+import threading
+import time
+
+from config import RENDER_CACHE_MAX_ENTRIES, RENDER_CACHE_TTL
+from metrics import CACHE_LOOKUPS
+
+
+def event_tags(event):
+    """Теги закэшированных ответов, которые устаревают после события QuizManager"""
+    op = event["op"]
+    if op == "answer_won":
+        return ["scores:global", f"scores:chat:{event['chat']}"]
+    if op == "user_score":
+        return ["scores:global"]
+    if op == "user_info":
+        # Имена видны во всех таблицах
+        return ["scores"]
+    if op == "stats_reset":
+        # Сброс обнуляет все очки и закрывает сессии всех чатов
+        return ["scores", "session"]
+    if op == "session_start":
+        return [f"session:{event['chat']}"]
+    if op == "settings":
+        return ["schedule"]
+    return []
+
+
+class ResponseCache:
+    """Кэш готовых текстов ответов на команды
+
+    Каждая запись помечена тегами (например, "scores:chat:123"). События
+    QuizManager сбрасывают записи со своими тегами, TTL - страховка на случай
+    пропущенного события. Тег "scores" сбрасывает все "scores:*" (так же
+    "session" - все "session:*"). Ответ, который устареет сам по себе
+    (например, время следующей викторины), кладется с собственным ttl.
+
+    Подписчик вызывается из потоков пула QuizManager (под блокировкой
+    QuizManager), поэтому сброс трогает только записи со своими тегами -
+    через индекс тег -> ключи, а не перебором всего кэша. Записей не больше
+    max_entries: put выбрасывает истекшие и самые старые.
+
+    Все операции под собственной блокировкой. Ответ, который строился во
+    время события, не кладется в кэш: put сверяет поколение на момент
+    начала построения.
+    """
+
+    def __init__(self, ttl=RENDER_CACHE_TTL, max_entries=RENDER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.generation = 0
+        self._entries = {}       # ключ -> (текст, теги, время истечения), от старых к новым
+        self._keys = {}          # тег и его префикс ("scores") -> ключи записей
+        self._invalidated = {}   # тег -> поколение последнего сброса
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] < time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                CACHE_LOOKUPS.inc(cache="response", result="miss")
+                return None
+            self.hits += 1
+            CACHE_LOOKUPS.inc(cache="response", result="hit")
+            return entry[0]
+
+    def put(self, key, text, tags, generation, ttl=None):
+        """Сохраняет текст, если его теги не сбрасывались после generation
+
+        ttl - срок жизни записи в секундах, если он короче общего.
+        """
+        with self._lock:
+            for tag in tags:
+                if self._invalidated.get(tag, -1) > generation:
+                    return
+                if self._invalidated.get(tag.split(":")[0], -1) > generation:
+                    return
+            ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+            if ttl <= 0:
+                return
+            now = time.monotonic()
+            # Перезапись переносит ключ в конец: порядок - от старых к новым
+            self._drop(key)
+            self._entries[key] = (text, tuple(tags), now + ttl)
+            for tag in tags:
+                self._keys.setdefault(tag, set()).add(key)
+                self._keys.setdefault(tag.split(":")[0], set()).add(key)
+            self._prune(now)
+
+    def _drop(self, key):
+        """Удаляет запись вместе с ее ключами в индексе тегов"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[1]:
+            for index_tag in (tag, tag.split(":")[0]):
+                keys = self._keys.get(index_tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._keys[index_tag]
+
+    def _prune(self, now):
+        """Выбрасывает самые старые записи, пока они истекли или кэш переполнен"""
+        while self._entries:
+            oldest = next(iter(self._entries))
+            if self._entries[oldest][2] >= now and len(self._entries) <= self.max_entries:
+                break
+            self._drop(oldest)
+
+    def invalidate(self, tags):
+        with self._lock:
+            self.generation += 1
+            for tag in tags:
+                self._invalidated[tag] = self.generation
+                for key in list(self._keys.get(tag, ())):
+                    self._drop(key)
+
+    def on_event(self, event):
+        """Подписчик на события QuizManager"""
+        tags = event_tags(event)
+        if tags:
+            self.invalidate(tags)
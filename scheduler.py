@@ -0,0 +1,148 @@
+import asyncio
+import logging
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from config import QUIZ_TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+
+def parse_time(value):
+    """"9:05" -> "09:05"; ValueError, если это не время суток"""
+    hours, minutes = value.strip().split(":")
+    return time(int(hours), int(minutes)).strftime("%H:%M")
+
+
+def parse_timezone(name):
+    """Проверяет название часового пояса (например, Europe/Moscow)"""
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"неизвестный часовой пояс: {name}")
+    return name
+
+
+def unique_times(times):
+    """Отсортированные времена без повторов; некорректные пропускаются"""
+    result = set()
+    for value in times:
+        try:
+            result.add(parse_time(value))
+        except ValueError:
+            logger.warning(f"⚠️ Некорректное время в расписании: {value}")
+    return sorted(result)
+
+
+def default_times(settings):
+    return unique_times(s["time"] for s in settings.get("quiz_schedule", []) if s.get("enabled", True))
+
+
+def chat_schedule(settings, chat_id):
+    """(часовой пояс, времена) для чата с учетом его личных настроек"""
+    timezone = settings.get("timezone", QUIZ_TIMEZONE)
+    override = settings.get("chat_schedules", {}).get(str(chat_id), {})
+    times = unique_times(override["times"]) if "times" in override else default_times(settings)
+    return override.get("timezone", timezone), times
+
+
+def next_quiz_time(timezone, times, now=None):
+    """Ближайшее время викторины (datetime в часовом поясе чата) или None"""
+    if not times:
+        return None
+    zone = ZoneInfo(timezone)
+    now = (now or datetime.now(zone)).astimezone(zone)
+    for day in (now.date(), now.date() + timedelta(days=1)):
+        for value in times:
+            candidate = datetime.combine(day, time.fromisoformat(value), zone)
+            if candidate > now:
+                return candidate
+    return None
+
+
+class QuizScheduler:
+    """Задания JobQueue для викторин по расписанию из настроек
+
+    Слот - пара (часовой пояс, "ЧЧ:ММ"). На каждый слот заводится одно
+    ежедневное задание, и все чаты этого слота получают викторину одной
+    рассылкой. Общее расписание (quiz_schedule, settings["timezone"])
+    действует для всех чатов без личного расписания; личное лежит в
+    settings["chat_schedules"][chat_id] ({"timezone": ..., "times": [...]}).
+
+    При каждом изменении настроек reconcile сравнивает нужные слоты с уже
+    заведенными заданиями: лишние снимаются, недостающие добавляются,
+    остальные не трогаются.
+    """
+
+    def __init__(self):
+        self.job_queue = None
+        self.callback = None
+        self.jobs = {}          # слот -> Job
+        self.slots = {}         # слот -> {"default": bool, "chats": set(chat_id)}
+        self.overrides = set()  # чаты со своим расписанием
+        self._loop = None
+
+    def start(self, job_queue, callback, settings):
+        """Заводит задания по текущим настройкам; вызывается из event loop"""
+        self.job_queue = job_queue
+        self.callback = callback
+        self._loop = asyncio.get_running_loop()
+        self.reconcile(settings)
+
+    def on_event(self, event):
+        """Подписчик на события QuizManager (вызывается из потока пула)"""
+        if event["op"] == "settings" and self._loop is not None:
+            self._loop.call_soon_threadsafe(self.reconcile, event["settings"])
+
+    def build_slots(self, settings):
+        timezone = settings.get("timezone", QUIZ_TIMEZONE)
+        slots = {}
+        for value in default_times(settings):
+            slots[(timezone, value)] = {"default": True, "chats": set()}
+
+        overrides = set()
+        for chat_id in settings.get("chat_schedules", {}):
+            overrides.add(int(chat_id))
+            chat_timezone, times = chat_schedule(settings, chat_id)
+            for value in times:
+                slot = slots.setdefault((chat_timezone, value), {"default": False, "chats": set()})
+                slot["chats"].add(int(chat_id))
+        return slots, overrides
+
+    def reconcile(self, settings):
+        """Приводит задания JobQueue в соответствие с настройками"""
+        slots, overrides = self.build_slots(settings)
+        self.slots, self.overrides = slots, overrides
+
+        for slot in list(self.jobs):
+            if slot not in slots:
+                self.jobs.pop(slot).schedule_removal()
+                logger.info(f"🗑️ Снята викторина {slot[1]} ({slot[0]})")
+
+        for slot in slots:
+            if slot in self.jobs:
+                continue
+            timezone, value = slot
+            try:
+                run_at = time.fromisoformat(value).replace(tzinfo=ZoneInfo(timezone))
+            except (ZoneInfoNotFoundError, ValueError) as e:
+                logger.error(f"❌ Ошибка настройки времени {value} ({timezone}): {e}")
+                continue
+            self.jobs[slot] = self.job_queue.run_daily(
+                self.callback,
+                time=run_at,
+                days=tuple(range(7)),  # Все дни недели
+                data=slot,
+                name=f"quiz_{timezone}_{value}"
+            )
+            logger.info(f"✅ Викторина настроена на {value} ({timezone})")
+
+    def chats_for(self, slot, active_chats):
+        """Активные чаты, которым положена викторина в этом слоте"""
+        info = self.slots.get(slot)
+        if info is None:
+            return []
+        return [
+            chat_id for chat_id in active_chats
+            if chat_id in info["chats"] or (info["default"] and chat_id not in self.overrides)
+        ]
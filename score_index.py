@@ -0,0 +1,51 @@
+from sortedcontainers import SortedList
+
+
+class ScoreIndex:
+    """Рейтинг пользователей, обновляемый при каждом изменении счета
+
+    Пары (-очки, user_id) лежат в отсортированном списке, поэтому топ-K,
+    место пользователя и соседи по таблице считаются за O(log n) без
+    сортировки всех пользователей.
+    """
+
+    def __init__(self, scores=None):
+        self._scores = dict(scores or {})
+        self._sorted = SortedList((-score, user_id) for user_id, score in self._scores.items())
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __contains__(self, user_id):
+        return user_id in self._scores
+
+    def set(self, user_id, score):
+        old = self._scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            self._sorted.remove((-old, user_id))
+        self._scores[user_id] = score
+        self._sorted.add((-score, user_id))
+
+    def top(self, limit=10):
+        """[(user_id, очки)] лучших limit пользователей"""
+        return [(user_id, -neg_score) for neg_score, user_id in self._sorted.islice(0, limit)]
+
+    def rank(self, user_id):
+        """Место пользователя (при равенстве очков место общее), None если его нет"""
+        if user_id not in self._scores:
+            return None
+        # Сколько пользователей набрали строго больше очков
+        return self._sorted.bisect_left((-self._scores[user_id],)) + 1
+
+    def neighbours(self, user_id, radius=2):
+        """[(позиция, user_id, очки)] вокруг пользователя в таблице"""
+        if user_id not in self._scores:
+            return []
+        index = self._sorted.index((-self._scores[user_id], user_id))
+        start = max(0, index - radius)
+        return [
+            (start + offset + 1, uid, -neg_score)
+            for offset, (neg_score, uid) in enumerate(self._sorted.islice(start, index + radius + 1))
+        ]
@@ -0,0 +1,633 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+
+from config import QUESTIONS_FILE, SETTINGS_FILE, USERS_FILE, JOURNAL_FILE, DB_FILE
+
+logger = logging.getLogger(__name__)
+
+# Какой раздел данных изменяет каждое событие журнала
+EVENT_SECTIONS = {
+    "user_score": "users",
+    "user_info": "users",
+    "session_start": "users",
+    "answer_won": "users",
+    "stats_reset": "users",
+    "chat_add": "users",
+    "chat_remove": "users",
+    "questions_add": "questions",
+    "question_used": "questions",
+    "question_reset": "questions",
+    "questions_reset_all": "questions",
+    "settings": "settings",
+}
+
+
+# Начало questions.json, после которого вопросы читаются по одному
+QUESTIONS_HEAD_RE = re.compile(r'\s*\{\s*"questions"\s*:\s*\[')
+# journal_seq - последний ключ снапшота (см. questions_json_chunks)
+JOURNAL_SEQ_TAIL_RE = re.compile(r'"journal_seq"\s*:\s*(\d+)\s*\}\s*$')
+WHITESPACE_RE = re.compile(r'\s*')
+READ_CHUNK = 1 << 16
+
+
+def iter_json_array(f, text):
+    """Элементы JSON-массива по одному, с дочитыванием файла кусками
+
+    text - уже прочитанная часть сразу после открывающей '['. Возвращает
+    (через StopIteration) остаток файла после закрывающей ']'.
+    json.JSONDecodeError, если массив оборван или испорчен.
+    """
+    decoder = json.JSONDecoder()
+    pos = 0
+    expect = "first"    # first: элемент или ']'; item: элемент; comma: ',' или ']'
+    while True:
+        pos = WHITESPACE_RE.match(text, pos).end()
+        if pos == len(text):
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                raise json.JSONDecodeError("Файл оборвался внутри списка вопросов", text, pos)
+            text, pos = text[pos:] + chunk, 0
+            continue
+        if text[pos] == "]" and expect != "item":
+            return text[pos + 1:] + f.read()
+        if expect == "comma":
+            if text[pos] != ",":
+                raise json.JSONDecodeError("Ожидалась ',' или ']'", text, pos)
+            pos += 1
+            expect = "item"
+            continue
+        try:
+            item, end = decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            # Элемент мог не поместиться в прочитанное - дочитываем
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                raise
+            text, pos = text[pos:] + chunk, 0
+            continue
+        yield item
+        pos = end
+        expect = "comma"
+
+
+def atomic_write(path, payload):
+    """Атомарная запись файла: временный файл + fsync + rename
+
+    payload - строка или итератор строк (пишутся по мере получения).
+    Возвращает размер записанного файла в байтах.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for chunk in [payload] if isinstance(payload, str) else payload:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+        written = os.fstat(f.fileno()).st_size
+    os.replace(tmp_path, path)
+
+    # Фиксируем сам rename (только POSIX)
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    return written
+
+
+def questions_json_chunks(questions, seq):
+    """questions.json по частям, по вопросу за раз
+
+    Результат совпадает с json.dumps({"questions": [...], "journal_seq": seq},
+    indent=2), но весь банк не собирается ни в список, ни в одну строку.
+    """
+    encoder = json.JSONEncoder(ensure_ascii=False, indent=2)
+    yield '{\n  "questions": ['
+    separator = "\n"
+    for question in questions:
+        yield separator + "    " + encoder.encode(question).replace("\n", "\n    ")
+        separator = ",\n"
+    yield ("]" if separator == "\n" else "\n  ]") + f',\n  "journal_seq": {json.dumps(seq)}\n}}'
+
+
+class Storage:
+    """Интерфейс хранилища QuizManager
+
+    QuizManager держит данные в памяти и передает хранилищу события
+    (append) и, время от времени, полный снапшот состояния
+    (serialize_snapshot под блокировкой + write_snapshot в фоне).
+    Вопросы в state["questions"] - снимок QuestionPool.snapshot(): его
+    можно один раз пройти в write_snapshot, не держа блокировку.
+    """
+    # Нужно ли сворачивать данные в снапшот при остановке
+    compact_on_close = True
+
+    def __init__(self):
+        self.journal_size = 0
+        self.last_seq = 0
+        self.needs_snapshot = False
+
+    def load(self):
+        """Возвращает (state, events) - разделы данных и события для проигрывания"""
+        raise NotImplementedError
+
+    def append(self, events):
+        """Сохраняет пачку событий, возвращает число записанных байт"""
+        raise NotImplementedError
+
+    def serialize_snapshot(self, state):
+        """Делает независимую от памяти копию состояния (вызывается под блокировкой)"""
+        raise NotImplementedError
+
+    def write_snapshot(self, snapshot):
+        """Записывает снапшот, возвращает число записанных байт"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JournalStorage(Storage):
+    """Хранилище: JSON-снапшоты + журнал событий (append-only)
+
+    Каждое изменение дописывается в журнал небольшой строкой, fsync делается
+    один раз на пачку. Периодически журнал сворачивается в снапшоты, которые
+    пишутся через временный файл и rename, поэтому сбой посреди записи
+    не может испортить users.json/questions.json/settings.json.
+    """
+
+    def __init__(self, journal_file=JOURNAL_FILE):
+        super().__init__()
+        self.journal_file = journal_file
+        self.files = {
+            "users": USERS_FILE,
+            "questions": QUESTIONS_FILE,
+            "settings": SETTINGS_FILE,
+        }
+
+    def _read_snapshot(self, path, default):
+        """Чтение снапшота; битый файл откладывается в сторону, а не затирается"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return default
+        except json.JSONDecodeError as e:
+            corrupt_path = f"{path}.corrupt"
+            logger.error(f"❌ Ошибка JSON в {path}: {e}. Копия сохранена в {corrupt_path}")
+            os.replace(path, corrupt_path)
+            self.needs_snapshot = True
+            return default
+
+    def _read_questions(self, path):
+        """Снапшот вопросов, в котором сами вопросы - поток, а не список
+
+        Вопросы разбираются по одному при проходе (QuestionPool упаковывает
+        их сразу), поэтому весь банк словарями в памяти не собирается.
+        journal_seq берется из конца файла. Файл другой раскладки (например,
+        правленный вручную) читается целиком, как остальные снапшоты.
+        """
+        try:
+            f = open(path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return {}
+        head = f.read(READ_CHUNK)
+        match = QUESTIONS_HEAD_RE.match(head)
+        if match is None:
+            f.close()
+            return self._read_snapshot(path, {})
+        with open(path, 'rb') as tail_file:
+            tail_file.seek(max(0, os.fstat(tail_file.fileno()).st_size - 256))
+            seq = JOURNAL_SEQ_TAIL_RE.search(tail_file.read().decode('utf-8', 'replace'))
+        return {
+            "questions": self._stream_questions(path, f, head[match.end():]),
+            "journal_seq": int(seq.group(1)) if seq else 0,
+        }
+
+    def _stream_questions(self, path, f, text):
+        """Вопросы из открытого файла; при порче файл откладывается в сторону
+
+        Уже прочитанные до места порчи вопросы остаются в банке, следом
+        сразу пишется корректный снапшот.
+        """
+        try:
+            rest = yield from iter_json_array(f, text)
+            # После списка - только journal_seq и закрывающая скобка
+            rest = rest.strip()
+            json.loads("{" + (rest[1:] if rest.startswith(",") else rest))
+        except json.JSONDecodeError as e:
+            f.close()
+            corrupt_path = f"{path}.corrupt"
+            logger.error(f"❌ Ошибка JSON в {path}: {e}. Копия сохранена в {corrupt_path}")
+            os.replace(path, corrupt_path)
+            self.needs_snapshot = True
+        finally:
+            f.close()
+
+    def load(self):
+        """Загружает снапшоты и проигрывает поверх них журнал
+
+        Возвращает (state, events): state - словарь разделов
+        {"users": ..., "questions": ..., "settings": ...}, events - события
+        журнала, которых еще нет в снапшотах.
+        """
+        state = {
+            "users": self._read_snapshot(self.files["users"], {}),
+            "questions": self._read_questions(self.files["questions"]),
+            "settings": self._read_snapshot(self.files["settings"], {}),
+        }
+        snapshot_seq = {name: data.pop("journal_seq", 0) for name, data in state.items()}
+
+        events = []
+        for event in self._read_journal():
+            if event["seq"] > snapshot_seq[EVENT_SECTIONS[event["op"]]]:
+                events.append(event)
+        self.journal_size = len(events)
+        self.last_seq = max([*snapshot_seq.values(), *(event["seq"] for event in events)])
+
+        logger.info(f"📜 Журнал: {len(events)} событий для восстановления")
+        return state, events
+
+    def _read_journal(self):
+        """Читает журнал; недописанный хвост после сбоя отрезается"""
+        if not os.path.exists(self.journal_file):
+            return []
+
+        events = []
+        good_offset = 0
+        with open(self.journal_file, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete line")
+                    events.append(json.loads(line))
+                except ValueError:
+                    logger.warning(f"⚠️ Журнал обрезан после {len(events)} событий (недописанная запись)")
+                    break
+                good_offset += len(line)
+
+        if good_offset != os.path.getsize(self.journal_file):
+            with open(self.journal_file, 'r+b') as f:
+                f.truncate(good_offset)
+        return events
+
+    def append(self, events):
+        """Дописывает пачку событий в журнал с одним fsync"""
+        if not events:
+            return 0
+        payload = "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events)
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_size += len(events)
+        return len(payload.encode('utf-8'))
+
+    def serialize_snapshot(self, state):
+        """Сериализует все разделы вместе с номером последнего события
+
+        Вопросы не сериализуются здесь, под блокировкой, - их JSON пишется
+        в файл по частям уже в write_snapshot.
+        """
+        seq = state["seq"]
+        return {
+            "users": json.dumps({**state["users"], "journal_seq": seq}, ensure_ascii=False, indent=2),
+            "questions": questions_json_chunks(state["questions"], seq),
+            "settings": json.dumps({**state["settings"], "journal_seq": seq}, ensure_ascii=False, indent=2),
+        }
+
+    def write_snapshot(self, payloads):
+        """Атомарно записывает снапшоты разделов и очищает журнал
+
+        payloads - {раздел: JSON-строка или итератор ее частей}; каждый
+        раздел содержит journal_seq, поэтому сбой между записью файлов
+        безопасен: при старте уже учтенные события будут пропущены.
+        """
+        written = 0
+        for name, payload in payloads.items():
+            written += atomic_write(self.files[name], payload)
+
+        with open(self.journal_file, 'w', encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_size = 0
+        return written
+
+
+class SqliteStorage(Storage):
+    """Хранилище в SQLite (WAL): каждое событие - небольшой UPDATE/INSERT
+
+    Рейтинги считает ScoreIndex в памяти QuizManager, база только хранит
+    очки.
+    """
+
+    compact_on_close = False
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            username TEXT NOT NULL DEFAULT '',
+            first_name TEXT NOT NULL DEFAULT '',
+            score INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            used INTEGER NOT NULL DEFAULT 0,
+            used_date TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS question_usage (
+            question_id INTEGER NOT NULL,
+            used_date TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_question_usage_question ON question_usage(question_id);
+
+        CREATE TABLE IF NOT EXISTS chats (
+            chat_id INTEGER PRIMARY KEY,
+            active INTEGER NOT NULL DEFAULT 1
+        );
+
+        CREATE TABLE IF NOT EXISTS answers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            question_id INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_answers_question ON answers(question_id);
+
+        CREATE TABLE IF NOT EXISTS chat_scores (
+            chat_id INTEGER NOT NULL,
+            user_id TEXT NOT NULL,
+            score INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, user_id)
+        );
+
+        CREATE TABLE IF NOT EXISTS sessions (
+            chat_id INTEGER PRIMARY KEY,
+            question TEXT NOT NULL,
+            answered_users TEXT NOT NULL DEFAULT '[]',
+            started_at TEXT NOT NULL,
+            answered_at TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, db_file=DB_FILE):
+        super().__init__()
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self._migrate_schema()
+
+    def _migrate_schema(self):
+        """Досоздает колонки, появившиеся после первой версии схемы"""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(answers)")}
+        with self.conn:
+            if "chat_id" not in columns:
+                self.conn.execute("ALTER TABLE answers ADD COLUMN chat_id INTEGER")
+            if "answered_at" not in columns:
+                self.conn.execute("ALTER TABLE answers ADD COLUMN answered_at TEXT")
+            question_columns = {row[1] for row in self.conn.execute("PRAGMA table_info(questions)")}
+            if "alternatives" not in question_columns:
+                self.conn.execute("ALTER TABLE questions ADD COLUMN alternatives TEXT")
+            # Глобальный вопрос старого формата заменен сессиями чатов
+            self.conn.execute("DELETE FROM meta WHERE key IN ('current_question', 'answered_users')")
+            # Рейтинг считается в памяти (ScoreIndex) - индекс только замедлял запись очков
+            self.conn.execute("DROP INDEX IF EXISTS idx_users_score")
+
+    def _get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_meta(self, key, value):
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, json.dumps(value, ensure_ascii=False))
+        )
+
+    def load(self):
+        """Собирает разделы данных из таблиц; журнал не нужен - события уже в базе"""
+        users = {}
+        for user_id, username, first_name, score in self.conn.execute(
+                "SELECT user_id, username, first_name, score FROM users"):
+            users[user_id] = {"score": score, "username": username, "first_name": first_name}
+
+        users_data = {"users": users}
+        users_data["active_chats"] = [
+            row[0] for row in self.conn.execute("SELECT chat_id FROM chats WHERE active = 1 ORDER BY rowid")
+        ]
+        chat_scores = {}
+        for chat_id, user_id, score in self.conn.execute("SELECT chat_id, user_id, score FROM chat_scores"):
+            chat_scores.setdefault(str(chat_id), {})[user_id] = score
+        users_data["chat_scores"] = chat_scores
+        users_data["sessions"] = {
+            str(chat_id): {
+                "question": json.loads(question),
+                "answered_users": json.loads(answered_users),
+                "started_at": started_at,
+                "answered_at": answered_at
+            }
+            for chat_id, question, answered_users, started_at, answered_at in self.conn.execute(
+                "SELECT chat_id, question, answered_users, started_at, answered_at FROM sessions")
+        }
+
+        # Вопросы отдаются по одной строке курсора, без общего списка в памяти
+        questions = self._iter_questions()
+
+        state = {
+            "users": users_data,
+            "questions": {"questions": questions},
+            "settings": self._get_meta("settings", {}),
+        }
+        self.last_seq = self._get_meta("last_seq", 0)
+        if not self.conn.execute("SELECT 1 FROM questions LIMIT 1").fetchone():
+            logger.warning(f"⚠️ База {self.db_file} пуста - перенесите данные: python migrate_to_sqlite.py")
+        return state, []
+
+    def _iter_questions(self):
+        for qid, text, answer, alternatives, used, used_date in self.conn.execute(
+                "SELECT id, question, answer, alternatives, used, used_date FROM questions ORDER BY id"):
+            question = {"id": qid, "question": text, "answer": answer, "used": bool(used), "used_date": used_date}
+            if alternatives:
+                question["alternatives"] = json.loads(alternatives)
+            yield question
+
+    def _apply(self, event):
+        """Применение одного события к таблицам"""
+        op = event["op"]
+        execute = self.conn.execute
+
+        if op == "user_score":
+            execute(
+                "INSERT INTO users (user_id, score) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET score = score + excluded.score",
+                (event["user"], event["points"])
+            )
+        elif op == "user_info":
+            execute(
+                "INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET username = excluded.username, first_name = excluded.first_name",
+                (event["user"], event["username"], event["first_name"])
+            )
+        elif op == "session_start":
+            execute(
+                "INSERT INTO sessions (chat_id, question, answered_users, started_at) VALUES (?, ?, '[]', ?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET question = excluded.question, answered_users = '[]', "
+                "started_at = excluded.started_at, answered_at = NULL",
+                (event["chat"], json.dumps(event["question"], ensure_ascii=False), event["date"])
+            )
+        elif op == "answer_won":
+            execute(
+                "INSERT INTO users (user_id, score) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET score = score + excluded.score",
+                (event["user"], event["points"])
+            )
+            execute(
+                "INSERT INTO chat_scores (chat_id, user_id, score) VALUES (?, ?, ?) "
+                "ON CONFLICT(chat_id, user_id) DO UPDATE SET score = score + excluded.score",
+                (event["chat"], event["user"], event["points"])
+            )
+            execute(
+                "INSERT INTO answers (user_id, question_id, chat_id, answered_at) VALUES (?, ?, ?, ?)",
+                (event["user"], event.get("question"), event["chat"], event["date"])
+            )
+            execute(
+                "UPDATE sessions SET answered_users = json_insert(answered_users, '$[#]', ?), answered_at = ? "
+                "WHERE chat_id = ?",
+                (event["user"], event["date"], event["chat"])
+            )
+        elif op == "stats_reset":
+            execute("UPDATE users SET score = 0")
+            execute("DELETE FROM chat_scores")
+            execute("DELETE FROM sessions")
+        elif op == "chat_add":
+            execute(
+                "INSERT INTO chats (chat_id, active) VALUES (?, 1) "
+                "ON CONFLICT(chat_id) DO UPDATE SET active = 1",
+                (event["chat"],)
+            )
+        elif op == "chat_remove":
+            execute("UPDATE chats SET active = 0 WHERE chat_id = ?", (event["chat"],))
+        elif op == "questions_add":
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO questions (id, question, answer, alternatives, used, used_date) "
+                "VALUES (?, ?, ?, ?, 0, NULL)",
+                [
+                    (q["id"], q["question"], q["answer"],
+                     json.dumps(q["alternatives"], ensure_ascii=False) if q.get("alternatives") else None)
+                    for q in event["questions"]
+                ]
+            )
+        elif op == "question_used":
+            execute("UPDATE questions SET used = 1, used_date = ? WHERE id = ?", (event["date"], event["id"]))
+            execute("INSERT INTO question_usage (question_id, used_date) VALUES (?, ?)", (event["id"], event["date"]))
+        elif op == "question_reset":
+            execute_many = self.conn.executemany
+            execute_many("UPDATE questions SET used = 0, used_date = NULL WHERE id = ?", [(qid,) for qid in event["ids"]])
+        elif op == "questions_reset_all":
+            execute("UPDATE questions SET used = 0, used_date = NULL WHERE used = 1")
+        elif op == "settings":
+            self._set_meta("settings", event["settings"])
+
+    def append(self, events):
+        """Применяет пачку событий одной транзакцией"""
+        if not events:
+            return 0
+        with self.conn:
+            for event in events:
+                self._apply(event)
+            self._set_meta("last_seq", events[-1]["seq"])
+        return 0
+
+    def serialize_snapshot(self, state):
+        """Копия состояния в виде строк таблиц (строки вопросов - по мере записи)"""
+        users_data = state["users"]
+        return {
+            "seq": state["seq"],
+            "users": [
+                (user_id, user.get("username", ""), user.get("first_name", ""), user.get("score", 0))
+                for user_id, user in users_data.get("users", {}).items()
+            ],
+            "chats": list(users_data.get("active_chats", [])),
+            "chat_scores": [
+                (int(chat_id), user_id, score)
+                for chat_id, scores in users_data.get("chat_scores", {}).items()
+                for user_id, score in scores.items()
+            ],
+            "sessions": [
+                (int(chat_id), json.dumps(session["question"], ensure_ascii=False),
+                 json.dumps(session["answered_users"]), session["started_at"], session.get("answered_at"))
+                for chat_id, session in users_data.get("sessions", {}).items()
+            ],
+            "questions": (
+                (q["id"], q["question"], q["answer"],
+                 json.dumps(q["alternatives"], ensure_ascii=False) if q.get("alternatives") else None,
+                 int(bool(q.get("used"))), q.get("used_date"))
+                for q in state["questions"]
+            ),
+            "settings": json.dumps(state["settings"], ensure_ascii=False),
+        }
+
+    def write_snapshot(self, snapshot):
+        """Полная перезапись таблиц одной транзакцией"""
+        with self.conn:
+            self.conn.execute("DELETE FROM users")
+            self.conn.executemany(
+                "INSERT INTO users (user_id, username, first_name, score) VALUES (?, ?, ?, ?)",
+                snapshot["users"]
+            )
+            self.conn.execute("UPDATE chats SET active = 0")
+            self.conn.executemany(
+                "INSERT INTO chats (chat_id, active) VALUES (?, 1) "
+                "ON CONFLICT(chat_id) DO UPDATE SET active = 1",
+                [(chat_id,) for chat_id in snapshot["chats"]]
+            )
+            self.conn.execute("DELETE FROM chat_scores")
+            self.conn.executemany(
+                "INSERT INTO chat_scores (chat_id, user_id, score) VALUES (?, ?, ?)",
+                snapshot["chat_scores"]
+            )
+            self.conn.execute("DELETE FROM sessions")
+            self.conn.executemany(
+                "INSERT INTO sessions (chat_id, question, answered_users, started_at, answered_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                snapshot["sessions"]
+            )
+            self.conn.execute("DELETE FROM questions")
+            self.conn.executemany(
+                "INSERT INTO questions (id, question, answer, alternatives, used, used_date) VALUES (?, ?, ?, ?, ?, ?)",
+                snapshot["questions"]
+            )
+            self.conn.executemany(
+                "INSERT INTO meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                [
+                    ("settings", snapshot["settings"]),
+                    ("last_seq", json.dumps(snapshot["seq"])),
+                ]
+            )
+        return 0
+
+    def close(self):
+        self.conn.close()
+
+
+def create_storage(backend):
+    """Создает хранилище по имени из config.STORAGE_BACKEND"""
+    if backend == "sqlite":
+        return SqliteStorage()
+    if backend == "json":
+        return JournalStorage()
+    raise ValueError(f"Неизвестное хранилище: {backend}")
@@ -0,0 +1,116 @@
+"""Нагрузочная проверка "первый правильный ответ побеждает"
+
+Тысячи одновременных ответов в нескольких чатах: в каждой сессии ровно
+один победитель, после перезагрузки с диска сумма очков равна числу
+сессий. Запуск: python -m pytest tests
+"""
+import asyncio
+import sqlite3
+
+import pytest
+
+from quiz_manager import AsyncQuizManager, QuizManager
+from storage import JournalStorage, SqliteStorage
+
+CHATS = 8
+ROUNDS = 5
+ANSWERS_PER_CHAT = 100   # одновременных ответов на каждый вопрос в каждом чате
+WRONG_EVERY = 7          # каждый N-й ответ - неправильный
+
+QUESTIONS = [
+    {"question": "Столица Италии?", "answer": "рим"},
+    {"question": "Самая длинная река Африки?", "answer": "нил"},
+    {"question": "Сколько дней в високосном году?", "answer": "366"},
+    {"question": "Автор 'Евгения Онегина'?", "answer": "пушкин"},
+    {"question": "Химический символ золота?", "answer": "au"},
+]
+
+STORAGES = {
+    "json": JournalStorage,
+    "sqlite": SqliteStorage,
+}
+
+
+def create_manager(backend):
+    # Частая фоновая запись и свертка журнала идут параллельно с ответами
+    return QuizManager(flush_interval=0.01, compact_every=50, storage=STORAGES[backend]())
+
+
+async def play(manager):
+    """Все раунды: открыть вопросы во всех чатах и разом прислать ответы
+
+    Половина ответов идет через AsyncQuizManager (очередь чата), половина -
+    напрямую в QuizManager из потоков пула, мимо очереди: победителя должна
+    определять сама блокировка QuizManager.
+    """
+    async_manager = AsyncQuizManager(manager)
+    loop = asyncio.get_running_loop()
+    chats = [-(1000 + i) for i in range(CHATS)]
+    winners = {}
+    try:
+        for round_number in range(ROUNDS):
+            answers = {}
+            for chat_id in chats:
+                assert await async_manager.start_quiz(chat_id)
+                answers[chat_id] = manager.get_current_question(chat_id)["answer"]
+
+            calls = []
+            for chat_id in chats:
+                for i in range(ANSWERS_PER_CHAT):
+                    user_id = (round_number * CHATS + chats.index(chat_id)) * ANSWERS_PER_CHAT + i
+                    answer = "заведомо неверно" if i % WRONG_EVERY == 0 else answers[chat_id]
+                    if i % 2:
+                        call = async_manager.check_answer(user_id, answer, chat_id)
+                    else:
+                        call = loop.run_in_executor(None, manager.check_answer, user_id, answer, chat_id)
+                    calls.append((chat_id, user_id, call))
+
+            results = await asyncio.gather(*(call for _, _, call in calls))
+            for (chat_id, user_id, _), (is_correct, reason) in zip(calls, results):
+                assert reason in ("correct", "wrong", "already_answered")
+                if is_correct:
+                    assert (round_number, chat_id) not in winners, "два победителя в одной сессии"
+                    winners[round_number, chat_id] = str(user_id)
+
+            for chat_id in chats:
+                session = manager.get_session(chat_id)
+                assert session["answered_users"] == [winners[round_number, chat_id]]
+            # Блокировки чатов не копятся после того, как очередь опустела
+            assert not async_manager._locks
+    finally:
+        await async_manager.close()
+    return chats, winners
+
+
+@pytest.mark.parametrize("backend", sorted(STORAGES))
+def test_one_winner_per_session_and_scores_conserved(backend, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    manager = create_manager(backend)
+    manager.add_questions(QUESTIONS)
+
+    chats, winners = asyncio.run(play(manager))
+    assert len(winners) == CHATS * ROUNDS
+
+    # Данные перечитываются с диска заново
+    reloaded = create_manager(backend)
+    try:
+        users = reloaded.users_data["users"]
+        assert sum(user["score"] for user in users.values()) == CHATS * ROUNDS
+        for winner in set(winners.values()):
+            expected = sum(1 for user_id in winners.values() if user_id == winner)
+            assert users[winner]["score"] == expected
+
+        chat_scores = reloaded.users_data["chat_scores"]
+        for chat_id in chats:
+            assert sum(chat_scores[str(chat_id)].values()) == ROUNDS
+            assert reloaded.get_session(chat_id)["answered_users"] == [winners[ROUNDS - 1, chat_id]]
+    finally:
+        reloaded.close()
+
+    if backend == "sqlite":
+        conn = sqlite3.connect(reloaded.storage.db_file)
+        try:
+            assert conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] == CHATS * ROUNDS
+        finally:
+            conn.close()
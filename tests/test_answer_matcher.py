@@ -0,0 +1,72 @@
+"""Нормализация и нечеткое сравнение ответов"""
+import pytest
+
+from answer_matcher import AnswerMatcher, bounded_levenshtein, normalize
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("  Париж!  ", "париж"),
+    ("Ёлка", "елка"),
+    ("Сан-Франциско", "сан франциско"),
+    ("Людовик XIV", "людовик 14"),
+    ("Петр I", "петр 1"),
+    ("MCMXLV", "1945"),
+    ("1-й", "1"),
+    ("2-ая", "2"),
+    ("3ий", "3"),
+    ("5-го", "5"),
+    ("восемь", "8"),
+    ("Первая мировая", "1 мировая"),
+    ("Двадцать", "20"),
+    ("...", ""),
+])
+def test_normalize(text, expected):
+    assert normalize(text) == expected
+
+
+@pytest.mark.parametrize("a, b, max_distance, expected", [
+    ("париж", "париж", 1, 0),
+    ("париж", "парик", 1, 1),
+    ("париж", "пари", 1, 1),
+    ("париж", "рим", 1, None),
+    ("абвгд", "бавгд", 2, 2),
+])
+def test_bounded_levenshtein(a, b, max_distance, expected):
+    assert bounded_levenshtein(a, b, max_distance) == expected
+
+
+@pytest.mark.parametrize("question, answer", [
+    ({"answer": "Париж"}, "париж"),
+    ({"answer": "Париж"}, "парик"),             # 1 опечатка на 5 букв - ровно 80%
+    ({"answer": "Пушкин"}, "пушкен"),
+    ({"answer": "Менделеев"}, "менделев"),
+    ({"answer": "Александр Македонский"}, "александр македоский"),
+    ({"answer": "Ёж"}, "еж"),
+    ({"answer": "Петр I"}, "петр первый"),
+    ({"answer": "Петр I"}, "Петр 1-й"),
+    ({"answer": "8"}, "восемь"),
+    ({"answer": "Вторая мировая война"}, "2 мировая война"),
+    ({"answer": "Нью-Йорк", "alternatives": ["NY"]}, "ny"),
+])
+def test_match_accepts(question, answer):
+    assert AnswerMatcher(question).match(answer)
+
+
+@pytest.mark.parametrize("question, answer", [
+    ({"answer": "Рим"}, "рис"),                 # 1 из 3 букв - меньше 80%
+    ({"answer": "Менделеев"}, "медведев"),
+    ({"answer": "Петр I"}, "петр 2"),           # числа опечаткой не считаются
+    ({"answer": "Александр 1"}, "александр 2"),
+    ({"answer": "8"}, "9"),
+    ({"answer": "Париж"}, "!!!"),
+])
+def test_match_rejects(question, answer):
+    assert not AnswerMatcher(question).match(answer)
+
+
+@pytest.mark.parametrize("length, edits", [
+    (4, 0), (5, 1), (9, 1), (10, 2), (14, 2), (15, 3),
+])
+def test_allowed_edits_follow_threshold(length, edits):
+    matcher = AnswerMatcher({"answer": "а" * length}, similarity=0.8)
+    assert matcher.fuzzy_forms[0][2] == edits
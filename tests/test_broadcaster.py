@@ -0,0 +1,109 @@
+"""Отключение и возврат чатов в рассылку
+
+Чат, из которого бота выгнали, после /start снова получает викторины,
+а повторное исключение снова убирает его из активных чатов.
+"""
+import asyncio
+
+from telegram.error import Forbidden
+
+from broadcaster import INTERNAL, Broadcaster
+from quiz_manager import AsyncQuizManager, QuizManager
+
+CHAT_ID = -1001
+
+
+class ForbiddenBot:
+    """Бот, которому чат запрещает отправку"""
+
+    def __init__(self):
+        self.attempts = 0
+
+    async def send_message(self, chat_id, text):
+        self.attempts += 1
+        raise Forbidden("Forbidden: bot was kicked from the group chat")
+
+
+async def kick_start_kick():
+    manager = AsyncQuizManager(QuizManager(flush_interval=0.01))
+    broadcaster = Broadcaster(on_deactivate=manager.remove_chat_id, backoff_base=0)
+    try:
+        for _ in range(2):
+            # /start
+            await manager.add_chat_id(CHAT_ID)
+            broadcaster.reactivate(CHAT_ID)
+            assert CHAT_ID in await manager.get_active_chats()
+            # Бота выгнали (my_chat_member: kicked)
+            await broadcaster.deactivate(CHAT_ID)
+            assert CHAT_ID not in await manager.get_active_chats()
+
+        # Вернули еще раз, но отправка не проходит - чат снова отключается
+        await manager.add_chat_id(CHAT_ID)
+        broadcaster.reactivate(CHAT_ID)
+        bot = ForbiddenBot()
+        report = await broadcaster.broadcast(bot, {CHAT_ID: "вопрос"}, window=0)
+        assert bot.attempts == 1
+        assert report.deactivated == [CHAT_ID]
+        assert CHAT_ID not in await manager.get_active_chats()
+    finally:
+        await manager.close()
+
+
+def test_kicked_chat_leaves_broadcasts_after_returning(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    asyncio.run(kick_start_kick())
+
+
+def test_repeated_kick_without_start_still_removes_chat(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+
+    async def scenario():
+        manager = AsyncQuizManager(QuizManager(flush_interval=0.01))
+        broadcaster = Broadcaster(on_deactivate=manager.remove_chat_id)
+        try:
+            await manager.add_chat_id(CHAT_ID)
+            await broadcaster.deactivate(CHAT_ID)
+            # Чат вернули в обход /start (например, миграцией), reactivate не было
+            await manager.add_chat_id(CHAT_ID)
+            await broadcaster.deactivate(CHAT_ID)
+            assert CHAT_ID not in await manager.get_active_chats()
+        finally:
+            await manager.close()
+
+    asyncio.run(scenario())
+
+
+class FlakyCodeBot:
+    """Бот, у которого отправка в один чат падает не с ошибкой Telegram"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if chat_id == 2:
+            raise RuntimeError("сбой в коде отправки")
+        self.sent.append(chat_id)
+
+
+def test_unexpected_error_fails_one_chat_and_keeps_report():
+    async def broken_text():
+        raise ValueError("не удалось подготовить вопрос")
+
+    async def scenario():
+        broadcaster = Broadcaster(global_rate=1000, per_chat_interval=0)
+        bot = FlakyCodeBot()
+        messages = {1: "вопрос", 2: "вопрос", 3: broken_text, 4: "вопрос"}
+        report = await broadcaster.broadcast(bot, messages, window=0)
+        return bot, report, broadcaster
+
+    bot, report, broadcaster = asyncio.run(scenario())
+    assert sorted(bot.sent) == [1, 4]
+    assert report.sent == 2
+    assert sorted(report.failed) == [2, 3]
+    assert report.errors[INTERNAL] == 2
+    assert len(report.latencies) == 2
+    # Ошибка в коде - не повод отключать чат
+    assert not broadcaster.deactivated
+    assert "внутренних 2" in report.summary()
@@ -0,0 +1,40 @@
+"""Потоковое чтение questions.json"""
+import json
+
+import pytest
+
+from storage import JournalStorage, questions_json_chunks
+
+QUESTIONS = [
+    {"id": i, "question": f"Вопрос {i}: скобки ] [ {{ }}, запятые и \"кавычки\"", "answer": "да",
+     "used": i % 2 == 0, "used_date": None}
+    for i in range(1, 200)
+]
+
+
+def read_questions(tmp_path, text):
+    path = tmp_path / "questions.json"
+    path.write_text(text, encoding="utf-8")
+    storage = JournalStorage(journal_file=str(tmp_path / "journal.jsonl"))
+    data = storage._read_questions(str(path))
+    seq = data.pop("journal_seq", 0)
+    return list(data.get("questions", [])), seq, storage.needs_snapshot
+
+
+@pytest.mark.parametrize("text, seq", [
+    ("".join(questions_json_chunks(QUESTIONS, 42)), 42),
+    (json.dumps({"questions": QUESTIONS}, ensure_ascii=False), 0),
+    # Другая раскладка ключей читается целиком
+    (json.dumps({"journal_seq": 7, "questions": QUESTIONS}), 7),
+])
+def test_questions_read_one_by_one(tmp_path, text, seq):
+    assert read_questions(tmp_path, text) == (QUESTIONS, seq, False)
+
+
+def test_truncated_file_keeps_read_questions_and_is_set_aside(tmp_path):
+    text = "".join(questions_json_chunks(QUESTIONS, 42))
+    questions, _, needs_snapshot = read_questions(tmp_path, text[:len(text) // 2])
+    assert questions == QUESTIONS[:len(questions)]
+    assert 0 < len(questions) < len(QUESTIONS)
+    assert needs_snapshot
+    assert (tmp_path / "questions.json.corrupt").exists()
@@ -0,0 +1,114 @@
+import asyncio
+import sys
+import time
+
+from telegram.ext import BaseUpdateProcessor
+
+from config import CONCURRENT_UPDATES, UPDATE_QUEUE_LIMIT
+from metrics import registry
+
+UPDATE_SECONDS = registry.histogram("bot_update_seconds", "Время обработки обновления всеми обработчиками")
+UPDATE_WAIT_SECONDS = registry.histogram(
+    "bot_update_wait_seconds", "Ожидание очереди своего чата и свободного места обработчика"
+)
+
+
+def ordering_key(update):
+    """Ключ очереди обновления: чат, для обновлений без чата - пользователь"""
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return ("chat", chat.id)
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return ("user", user.id)
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка внутри чата
+
+    Обновления одного чата обрабатываются строго по очереди в порядке
+    прихода (для "первый правильный ответ побеждает" это важно), а разные
+    чаты - параллельно, не более max_running одновременно.
+
+    Порядок держится на очередях asyncio (FIFO): PTB создает задачи в
+    порядке прихода обновлений, задача сначала проходит общий семафор
+    BaseUpdateProcessor (он ограничивает число принятых, но еще не
+    обработанных обновлений - queue_limit), затем ждет блокировку своего
+    чата и только после нее занимает одно из max_running мест. Пока
+    обновление ждет свой чат, место обработчика не занято, поэтому
+    завал сообщений в одном чате не останавливает остальные.
+    """
+
+    def __init__(self, max_running=CONCURRENT_UPDATES, queue_limit=UPDATE_QUEUE_LIMIT, profiler=None):
+        super().__init__(max(queue_limit, max_running))
+        self.profiler = profiler
+        self.max_running = max_running
+        self._running = asyncio.Semaphore(max_running)
+        self._chat_locks = {}   # ключ -> [блокировка, сколько обновлений ее ждет или держит]
+        self.running = 0
+        self.peak_running = 0
+        self.peak_queued = 0
+        registry.gauge("bot_updates_running", "Обновления, обрабатываемые прямо сейчас").set_function(
+            lambda: self.running
+        )
+        registry.gauge("bot_updates_queued", "Принятые обновления, ждущие обработки").set_function(
+            lambda: self.queued
+        )
+
+    @property
+    def queued(self):
+        """Принятые обновления, ожидающие свой чат или свободное место"""
+        return self.current_concurrent_updates - self.running
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "peak_running": self.peak_running,
+            "peak_queued": self.peak_queued,
+            "chats": len(self._chat_locks),
+        }
+
+    def reset_peaks(self):
+        self.peak_running = self.running
+        self.peak_queued = self.queued
+
+    async def do_process_update(self, update, coroutine):
+        self.peak_queued = max(self.peak_queued, self.queued)
+        key = ordering_key(update)
+        accepted = time.perf_counter()
+        if key is None:
+            await self._run(update, coroutine, accepted)
+            return
+
+        entry = self._chat_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self._run(update, coroutine, accepted)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[key]
+
+    async def _run(self, update, coroutine, accepted):
+        async with self._running:
+            self.running += 1
+            self.peak_running = max(self.peak_running, self.running)
+            started = time.perf_counter()
+            UPDATE_WAIT_SECONDS.observe(started - accepted)
+            frame = self.profiler.begin(sys._getframe(), update) if self.profiler else None
+            try:
+                await coroutine
+            finally:
+                self.running -= 1
+                UPDATE_SECONDS.observe(time.perf_counter() - started)
+                if frame is not None:
+                    self.profiler.end(frame)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass